@@ -0,0 +1,147 @@
+"""\
+Per-request overhead of the wsgi_lambda_handler_* entry points.
+
+Runs every event in events.CORPUS through its adapter against a trivial WSGI
+app and reports latency percentiles, tracemalloc allocations and peak traced
+memory per event type, as JSON:
+
+    python benchmarks/adapters.py -o before.json
+    (change something)
+    python benchmarks/adapters.py -o after.json --compare before.json
+
+Use -k to pick events by substring, e.g. -k apigw-v2/ or -k post-large.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+os.environ.setdefault('LEVEL', str(40))  # keep adapter logging out of the timings
+
+import events
+import renlabs.runtime.aws.wsgi as wsgi
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    i = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[i]
+
+
+def measure(handler, event, iterations, warmup):
+    for _ in range(warmup):
+        handler(events.app, event, None)
+
+    timings = []
+    for _ in range(iterations):
+        t0 = time.perf_counter_ns()
+        handler(events.app, event, None)
+        timings.append(time.perf_counter_ns() - t0)
+    timings.sort()
+
+    # One more call under tracemalloc: net new blocks, and peak traced memory
+    # above what was live before the call.
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    base_current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    handler(events.app, event, None)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    alloc_blocks = sum(s.count_diff for s in stats if s.count_diff > 0)
+    alloc_bytes = sum(s.size_diff for s in stats if s.size_diff > 0)
+
+    return {
+        'iterations': iterations,
+        'p50_us': percentile(timings, 50) / 1000.0,
+        'p90_us': percentile(timings, 90) / 1000.0,
+        'p99_us': percentile(timings, 99) / 1000.0,
+        'mean_us': sum(timings) / len(timings) / 1000.0,
+        'alloc_blocks': alloc_blocks,
+        'alloc_bytes': alloc_bytes,
+        'peak_bytes': peak - base_current,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(selected, iterations, warmup):
+    results = {}
+    for name, (entry_point, event) in events.CORPUS.items():
+        if selected and not any(k in name for k in selected):
+            continue
+        try:
+            handler = getattr(wsgi, entry_point)
+            results[name] = measure(handler, event, iterations, warmup)
+        except Exception as e:
+            results[name] = {'error': f'{type(e).__name__}: {e}'}
+        r = results[name]
+        if 'error' in r:
+            print(f'{name:40} ERROR {r["error"]}', file=sys.stderr)
+        else:
+            print(f'{name:40} p50 {r["p50_us"]:9.1f}us  p99 {r["p99_us"]:9.1f}us'
+                  f'  peak {r["peak_bytes"]:>10}B', file=sys.stderr)
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': iterations,
+            'warmup': warmup,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline):
+    print(f'\n{"event":40} {"p50 change":>11} {"p99 change":>11} {"peak change":>12}')
+    for name, r in current['results'].items():
+        b = baseline['results'].get(name)
+        if not b or 'error' in r or 'error' in b:
+            continue
+        deltas = []
+        for key in ('p50_us', 'p99_us', 'peak_bytes'):
+            deltas.append(f'{(r[key] - b[key]) / b[key] * 100.0:+.1f}%' if b[key] else 'n/a')
+        print(f'{name:40} {deltas[0]:>11} {deltas[1]:>11} {deltas[2]:>12}')
+
+
+def main(argv=None):
+    a = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    a.add_argument('-n', '--iterations', type=int, default=300)
+    a.add_argument('--warmup', type=int, default=20)
+    a.add_argument('-k', action='append', default=[], help='select events by substring')
+    a.add_argument('-o', '--output', help='write JSON results here (default stdout)')
+    a.add_argument('--compare', help='baseline JSON results to compare against')
+    args = a.parse_args(argv)
+
+    current = run(args.k, args.iterations, args.warmup)
+    text = json.dumps(current, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(current, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
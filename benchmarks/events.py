@@ -0,0 +1,178 @@
+"""\
+Synthetic Lambda events for the adapter benchmarks: API Gateway v1 and v2,
+Lambda@Edge and ALB, each with small, large and binary bodies and with many
+headers and query parameters.
+
+CORPUS maps 'source/shape' to (entry point name, event). The benchmark app
+(app() below) reads the whole request body and answers with a body of
+?size= bytes of type ?ct=.
+"""
+
+import base64
+
+DOMAIN = 'abc123.execute-api.us-west-2.amazonaws.com'
+STAGE = 'testing'
+
+BASE_HEADERS = {
+    'accept': 'application/json',
+    'accept-encoding': 'gzip, deflate, br',
+    'host': DOMAIN,
+    'user-agent': 'benchmark/1.0',
+    'x-amzn-trace-id': 'Root=1-5e6e6e6e-0123456789abcdef01234567',
+    'x-forwarded-for': '203.0.113.7',
+    'x-forwarded-port': '443',
+    'x-forwarded-proto': 'https',
+}
+
+MANY_HEADERS = dict(BASE_HEADERS, **{f'x-custom-{i}': f'value-{i}' * 4 for i in range(60)})
+MANY_QUERY = {f'param{i}': f'v{i}' for i in range(50)}
+
+SMALL_BODY = b'{"hello": "world"}'
+LARGE_BODY = b'{"items": [' + b','.join(b'{"id": %d, "name": "item %d"}' % (i, i)
+                                        for i in range(40000)) + b']}'
+BINARY_BODY = bytes(range(256)) * 4096
+
+
+def app(environ, start_response):
+    """Trivial WSGI app: drain the request, answer ?size= bytes of ?ct="""
+    length = int(environ.get('CONTENT_LENGTH') or 0)
+    if length:
+        environ['wsgi.input'].read(length)
+    size, ct = 32, 'application/json'
+    for pair in environ.get('QUERY_STRING', '').split('&'):
+        k, _, v = pair.partition('=')
+        if k == 'size':
+            size = int(v)
+        elif k == 'ct':
+            ct = v.replace('%2F', '/')
+    body = (b'x' * size) if ct != 'application/octet-stream' else BINARY_BODY[:size]
+    start_response('200 OK', [('Content-Type', ct),
+                              ('Content-Length', str(len(body))),
+                              ('Set-Cookie', 'a=1'),
+                              ('Set-Cookie', 'b=2')])
+    return [body]
+
+
+def _body_fields(body, binary):
+    if body is None:
+        return {'isBase64Encoded': False}
+    if binary:
+        return {'body': base64.b64encode(body).decode('ascii'), 'isBase64Encoded': True}
+    return {'body': body.decode('utf-8'), 'isBase64Encoded': False}
+
+
+def v2(method, query, headers, body=None, binary=False):
+    path = f'/{STAGE}/items/42'
+    qs = '&'.join(f'{k}={v}' for k, v in query.items())
+    ev = {
+        'version': '2.0',
+        'routeKey': '$default',
+        'rawPath': path,
+        'rawQueryString': qs,
+        'headers': dict(headers),
+        'queryStringParameters': dict(query),
+        'requestContext': {
+            'accountId': '123456789012',
+            'apiId': 'abc123',
+            'domainName': DOMAIN,
+            'domainPrefix': 'abc123',
+            'http': {'method': method, 'path': path, 'protocol': 'HTTP/1.1',
+                     'sourceIp': '203.0.113.7', 'userAgent': 'benchmark/1.0'},
+            'requestId': 'JKJaXmPLvHcESHA=',
+            'routeKey': '$default',
+            'stage': STAGE,
+            'time': '10/Mar/2020:00:03:59 +0000',
+            'timeEpoch': 1583798639428,
+        },
+    }
+    ev.update(_body_fields(body, binary))
+    return ev
+
+
+def v1(method, query, headers, body=None, binary=False):
+    path = f'/{STAGE}/items/42'
+    ev = {
+        'version': '1.0',
+        'resource': '/{proxy+}',
+        'path': path,
+        'httpMethod': method,
+        'headers': dict(headers),
+        'multiValueHeaders': {k: [v] for k, v in headers.items()},
+        'queryStringParameters': dict(query) or None,
+        'multiValueQueryStringParameters': {k: [v] for k, v in query.items()} or None,
+        'requestContext': {
+            'accountId': '123456789012',
+            'apiId': 'abc123',
+            'domainName': DOMAIN,
+            'httpMethod': method,
+            'path': path,
+            'requestId': 'c6af9ac6-7b61-11e6-9a41-93e8deadbeef',
+            'resourcePath': '/{proxy+}',
+            'stage': STAGE,
+        },
+    }
+    ev.update(_body_fields(body, binary))
+    return ev
+
+
+def alb(method, query, headers, body=None, binary=False):
+    ev = {
+        'requestContext': {'elb': {'targetGroupArn':
+            'arn:aws:elasticloadbalancing:us-west-2:123456789012:targetgroup/tg/abc'}},
+        'httpMethod': method,
+        'path': '/items/42',
+        'multiValueQueryStringParameters': {k: [v] for k, v in query.items()},
+        'multiValueHeaders': {k: [v] for k, v in headers.items()},
+    }
+    ev.update(_body_fields(body, binary))
+    ev.setdefault('body', '')
+    return ev
+
+
+def edge(method, query, headers, body=None, binary=False):
+    request = {
+        'clientIp': '203.0.113.7',
+        'method': method,
+        'uri': '/items/42',
+        'querystring': '&'.join(f'{k}={v}' for k, v in query.items()),
+        'headers': {k: [{'key': k.title(), 'value': v}] for k, v in headers.items()},
+    }
+    if body is not None:
+        request['body'] = {'action': 'read-only', 'encoding': 'base64',
+                           'inputTruncated': False,
+                           'data': base64.b64encode(body).decode('ascii')}
+    return {'Records': [{'cf': {
+        'config': {'distributionDomainName': 'd111111abcdef8.cloudfront.net',
+                   'distributionId': 'EDFDVBD6EXAMPLE',
+                   'eventType': 'origin-request',
+                   'requestId': '4TyzHTaYWb1GX1qTfsHhEqV6HUDd_BzoBZnwfnvQc_1oF26ClkoUSEQ=='},
+        'request': request}}]}
+
+
+ENTRY_POINTS = {
+    'apigw-v2': ('wsgi_lambda_handler_APIGatewayv2', v2),
+    'apigw-v1': ('wsgi_lambda_handler_APIGatewayv1', v1),
+    'alb': ('wsgi_lambda_handler_ALB', alb),
+    'edge': ('wsgi_lambda_handler_LambdaAtEdge_origin', edge),
+}
+
+SHAPES = {
+    'get-small': ('GET', {'size': '32'}, BASE_HEADERS, None, False),
+    'get-many-headers-params': ('GET', dict(MANY_QUERY, size='32'), MANY_HEADERS, None, False),
+    'get-large-json': ('GET', {'size': str(len(LARGE_BODY))}, BASE_HEADERS, None, False),
+    'get-binary': ('GET', {'size': str(len(BINARY_BODY)), 'ct': 'application%2Foctet-stream'},
+                   BASE_HEADERS, None, False),
+    'post-small': ('POST', {'size': '32'}, dict(BASE_HEADERS, **{'content-type': 'application/json'}),
+                   SMALL_BODY, False),
+    'post-large-json': ('POST', {'size': '32'}, dict(BASE_HEADERS, **{'content-type': 'application/json'}),
+                        LARGE_BODY, False),
+    'post-binary': ('POST', {'size': '32'},
+                    dict(BASE_HEADERS, **{'content-type': 'application/octet-stream'}),
+                    BINARY_BODY, True),
+}
+
+CORPUS = {
+    f'{source}/{shape}': (entry_point, builder(*args))
+    for source, (entry_point, builder) in ENTRY_POINTS.items()
+    for shape, args in SHAPES.items()
+}
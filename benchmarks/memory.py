@@ -0,0 +1,102 @@
+"""\
+Peak memory of one request carrying a large body through the v2 adapter.
+
+Uploads (the app reads the whole request) and downloads (the app returns one
+body of that size), textual and binary, at a few sizes. Reports the peak
+traced memory above what was live before the call (the event, and for
+downloads the app's body, already exist), divided by the payload: the body
+as it travels in the event or response, so base64 bodies count at their
+encoded size. Expect ratios of about 2 or less:
+
+    python benchmarks/memory.py --sizes 1,8,32
+
+tracemalloc traces Python allocations, which for bodies this size is nearly
+all of the RSS a request adds; it's used instead of RSS because the process
+high-water mark can't be reset between cases.
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+os.environ.setdefault('LEVEL', str(40))  # keep adapter logging out of the figures
+
+import events
+from renlabs.runtime.aws.wsgi import wsgi_lambda_handler_APIGatewayv2
+
+MB = 1024 * 1024
+
+
+def upload_case(size, binary):
+    body = (bytes(range(256)) * (size // 256 + 1))[:size] if binary else b'x' * size
+    ct = 'application/octet-stream' if binary else 'application/json'
+    event = events.v2('POST', {'size': '0'},
+                      dict(events.BASE_HEADERS, **{'content-type': ct}), body, binary)
+    del body
+    payload = len(event['body'])
+
+    def app(environ, start_response):
+        environ['wsgi.input'].read(int(environ['CONTENT_LENGTH']))
+        start_response('204 No Content', [])
+        return []
+    return event, app, payload
+
+
+def download_case(size, binary):
+    ct = 'application/octet-stream' if binary else 'application/json'
+    body = [(bytes(range(256)) * (size // 256 + 1))[:size] if binary else b'x' * size]
+    headers = dict(events.BASE_HEADERS)
+    del headers['accept-encoding']  # measure the body itself, not gzip's output
+    event = events.v2('GET', {}, headers)
+    payload = len(base64.b64encode(b'\0' * size)) if binary else size
+
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', ct)])
+        return [body.pop()]
+    return event, app, payload
+
+
+def measure(event, app):
+    tracemalloc.start()
+    base_current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    response = wsgi_lambda_handler_APIGatewayv2(app, event, None)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del response
+    return peak - base_current
+
+
+def main(argv=None):
+    a = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    a.add_argument('--sizes', default='1,8,32', help='body sizes in MB, comma-separated')
+    a.add_argument('--max-ratio', type=float, default=2.2,
+                   help='exit 1 if any peak/payload ratio exceeds this')
+    args = a.parse_args(argv)
+
+    results = {}
+    worst = 0.0
+    for mb in [float(s) for s in args.sizes.split(',')]:
+        size = int(mb * MB)
+        for direction, make in (('upload', upload_case), ('download', download_case)):
+            for kind in ('text', 'binary'):
+                event, app, payload = make(size, kind == 'binary')
+                peak = measure(event, app)
+                ratio = peak / payload
+                worst = max(worst, ratio)
+                name = f'{direction}/{kind}/{mb:g}MB'
+                results[name] = {'payload_bytes': payload, 'peak_bytes': peak,
+                                 'ratio': round(ratio, 2)}
+                print(f'{name:24} payload {payload:>11}B  peak {peak:>11}B  {ratio:5.2f}x',
+                      file=sys.stderr)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    return 0 if worst <= args.max_ratio else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
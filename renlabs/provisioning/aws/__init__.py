@@ -1,58 +1,111 @@
-import boto3, re
-
-def get_tagged_role_names(provisioning_tag):
-    c = boto3.client('iam')
-    roles_response = c.list_roles()
-    roles_names = map(lambda x: x['RoleName'], roles_response['Roles'])
-    my_role_names = []
-    for role_name in roles_names:
-        role_tags_response = c.list_role_tags(RoleName=role_name)
-        for tag in role_tags_response['Tags']:
-            if tag['Key'] == 'provisioning' and tag['Value'] == provisioning_tag:
-                my_role_names.append(role_name)
-    return my_role_names
-
-def nuke_roles(my_role_names):
-    wipeouts = []
-    for role_name in my_role_names:
-        c = boto3.client('iam')
-        policies_response = c.list_attached_role_policies(RoleName=role_name)
-        for policy_arn in map(lambda x: x['PolicyArn'],
-                              policies_response['AttachedPolicies']):
-            c.detach_role_policy(RoleName=role_name, PolicyArn=policy_arn)
-        c.delete_role(RoleName=role_name)
-        wipeouts.append("iam -> {}".format(role_name))
-    return wipeouts
-
-def get_gettable_tagged_things_arns(region, provisioning_tag):
-    c = boto3.client('resourcegroupstaggingapi', region_name=region)
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from . import clients
+
+# Clients come from the clients registry, whose adaptive retry mode
+# rate-limits a client itself once AWS starts answering Throttling.
+
+logger = logging.getLogger(__name__)
+
+def _has_tag(tags, provisioning_tag):
+    return any(tag['Key'] == 'provisioning' and tag['Value'] == provisioning_tag
+               for tag in tags)
+
+def _tagged_role_name(c, role_name, provisioning_tag):
+    """role_name if the role has the tag, else None"""
+    try:
+        for page in c.get_paginator('list_role_tags').paginate(RoleName=role_name):
+            if _has_tag(page['Tags'], provisioning_tag):
+                return role_name
+    except c.exceptions.NoSuchEntityException:
+        pass  # deleted since it was listed
+    return None
+
+def _tagging_api_role_names(provisioning_tag, role=None):
+    """Names of roles the Resource Groups Tagging API has with the tag, or
+    None if it can't say"""
+    c = clients.client('resourcegroupstaggingapi', 'us-east-1', role)
+    try:
+        return [arn.rsplit('/', 1)[-1]
+                for arn in _tagged_arns(c, provisioning_tag, ['iam:role'])]
+    except ClientError:
+        return None
+
+def get_tagged_role_names(provisioning_tag, max_workers=8, role=None):
+    """
+    Names of IAM roles tagged provisioning=provisioning_tag.
+
+    Every role is listed (paginated). Those the Resource Groups Tagging API
+    already reports with the tag are taken as they are; the tags of the rest
+    are looked up on up to max_workers threads, so roles the tagging index
+    hasn't caught up with aren't missed. With role, AWS is asked as that IAM
+    role ARN.
+    """
+    known = set(_tagging_api_role_names(provisioning_tag, role) or ())
+    c = clients.client('iam', None, role)
+    names = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = []
+        for page in c.get_paginator('list_roles').paginate():
+            for entry in page['Roles']:
+                if entry['RoleName'] in known:
+                    names.append(entry['RoleName'])
+                else:
+                    pending.append(pool.submit(_tagged_role_name, c, entry['RoleName'],
+                                               provisioning_tag))
+        names.extend(filter(None, (f.result() for f in pending)))
+    return names
+
+def _nuke(td):
+    """Run td as nuke_roles and nuke_arns always have: return an
+    "iam -> name" style label per role, function or API deleted (not their
+    policies, permissions or routes), and raise the first failure"""
+    deleted = set(td.run(progress=logger.info))
+    if td.failures:
+        raise next(iter(td.failures.values()))
+    return [td.nodes[key].label for key in dict.fromkeys(td.roots)
+            if key in td.nodes and td.nodes[key].label in deleted]
+
+def nuke_roles(my_role_names, role=None):
+    """Delete the roles, policies first; see teardown.Teardown"""
+    return _nuke(Teardown(role=role).add_roles(my_role_names))
+
+def _tagged_arns(c, provisioning_tag, resource_types=None):
     f = {
         'Key': 'provisioning',
         'Values': [
             provisioning_tag
         ]
     }
-    resources_response = c.get_resources(TagFilters=(f,))
-    my_resources_arns = list(map(lambda x: x['ResourceARN'],
-                                 resources_response['ResourceTagMappingList']))
-    return my_resources_arns
-
-def nuke_arns(region, my_resources_arns):
-    wipeouts = []
-    for arn in my_resources_arns:
-        is_apigateway = re.match(rf'arn:aws:apigateway:{region}::/restapis/(?P<id>.*)$', arn)
-        is_lambda     = re.match(rf'arn:aws:lambda:{region}:\d*:function:(?P<name>.*)$', arn)
-        if is_apigateway:
-            boto3.client('apigateway').delete_rest_api(is_apigateway.group('id'))
-            wipeouts.append("apigateway -> {}".format(is_apigateway.group('id')))
-        elif is_lambda:
-            boto3.client('lambda').delete_function(FunctionName=is_lambda.group('name'))
-            wipeouts.append("lambda -> {}".format(is_lambda.group('name')))
-    return wipeouts
+    kwargs = {'ResourceTypeFilters': resource_types} if resource_types else {}
+    for page in c.get_paginator('get_resources').paginate(TagFilters=(f,), **kwargs):
+        for mapping in page['ResourceTagMappingList']:
+            yield mapping['ResourceARN']
+
+def get_gettable_tagged_things_arns(region, provisioning_tag, role=None):
+    c = clients.client('resourcegroupstaggingapi', region, role)
+    return list(_tagged_arns(c, provisioning_tag))
+
+def nuke_arns(region, my_resources_arns, role=None):
+    """Delete the tagged resources and their parts; see teardown.Teardown"""
+    return _nuke(Teardown(region, role=role).add_arns(my_resources_arns))
+
+def teardown_tagged(region, provisioning_tag, dry_run=False, progress=print, role=None):
+    """Delete everything tagged provisioning=provisioning_tag, as one
+    dependency-ordered teardown: roles and whatever the tagging API finds in
+    region. Returns what was (or, dry run, would be) deleted."""
+    td = Teardown(region, role=role)
+    td.add_arns(get_gettable_tagged_things_arns(region, provisioning_tag, role))
+    td.add_roles(get_tagged_role_names(provisioning_tag, role=role))
+    return td.run(dry_run=dry_run, progress=progress)
 
 
 # convenience imports
 from .base import AWSBase
-from .apigatewayv2 import GatewayApi, Route, DefaultRoute
+from .teardown import Teardown
+from .apigatewayv2 import GatewayApi, Route, DefaultRoute, RouteSet
 from .awslambda import LambdaFunction, LambdaExecutionRole
+from .capacity import CapacityProfile
+from .plan import Deployment, Plan
 
@@ -1,7 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
 from .base import AWSBase
 from botocore.exceptions import ClientError
 from .awslambda import LambdaFunction
 
+import logging
+logger = logging.getLogger(__name__)
+
+APIGATEWAY_PRINCIPAL = 'apigateway.amazonaws.com'
+
+def _throttled(settings, burst_limit, rate_limit):
+    """Route settings with these throttles, or None if already so"""
+    settings = dict(settings or {})
+    if (settings.get('ThrottlingBurstLimit'), settings.get('ThrottlingRateLimit')) \
+            == (burst_limit, rate_limit):
+        return None
+    settings['ThrottlingBurstLimit'] = burst_limit
+    settings['ThrottlingRateLimit'] = rate_limit
+    return settings
+
+
+def route_key(method, path):
+    """API Gateway's key for a Route's method and path"""
+    return f"{method} /{path}" if method and path else '$default'
+
+
+def invoke_statement_id(api_id, alias=None):
+    """The one resource-policy statement letting api_id invoke the function
+    (or alias)"""
+    return f'apigateway-{api_id}-{alias or "unqualified"}'
+
+
+def _invoke_source(statement):
+    """(region, account, API id) from an API Gateway invoke statement's
+    SourceArn, else None"""
+    principal = statement.get('Principal')
+    if not isinstance(principal, dict) or principal.get('Service') != APIGATEWAY_PRINCIPAL:
+        return None
+    for condition in statement.get('Condition', {}).values():
+        arn = condition.get('AWS:SourceArn', '')
+        if arn.startswith('arn:aws:execute-api:'):
+            _, _, _, region, account, resource = arn.split(':', 5)
+            return region, account, resource.split('/', 1)[0]
+    return None
+
+
 class GatewayApi(AWSBase):
     def __init__(self):
         super().__init__()
@@ -28,22 +70,27 @@ class GatewayApi(AWSBase):
         """
         # More weirdness: 'apigatewayv2' won't report entities created through
         # 'apigateway' and vice versa, beware.
-        items = self.apiClient.get_apis()
-        my_items = list(filter(lambda x: x['Name'] == self.app['name'], items['Items']))
-        return my_items
-
-    def find(self):
-        my_items = self.find_all()
-        self._api_id = my_items[0]['ApiId']
-        self._endpoint = my_items[0]['ApiEndpoint']
+        def load():
+            return [item
+                    for page in self.apiClient.get_paginator('get_apis').paginate()
+                    for item in page['Items']
+                    if item['Name'] == self.app['name']]
+        return self.state.get(('apis', self.app['name']), load)
 
-        self._integration_id = None
+    def _find_integration(self):
         integrations_items = self.apiClient.get_integrations(ApiId=self._api_id)['Items']
         if len(integrations_items) and len(integrations_items) != 1:
             raise RuntimeError(f"More than one integration for apigatewayv2 {self._api_id}")
         if len(integrations_items):
-            self._integration_id = integrations_items[0]['IntegrationId']
+            return integrations_items[0]['IntegrationId']
+        return None
 
+    def find(self):
+        my_items = self.find_all()
+        self._api_id = my_items[0]['ApiId']
+        self._endpoint = my_items[0]['ApiEndpoint']
+        self._integration_id = self.state.get(('integration', self._api_id),
+                                              self._find_integration)
         return self
 
     def create(self):
@@ -62,12 +109,21 @@ class GatewayApi(AWSBase):
         self._api_id = created_api['ApiId']
         self._endpoint = created_api['ApiEndpoint']
 
+        self.state.put(('apis', self.app['name']),
+                       [{'ApiId': self._api_id, 'ApiEndpoint': self._endpoint,
+                         'Name': self.app['name']}])
+        self.state.put(('routes', self._api_id), {})
+
+        self.create_integration()
+        self.create_stage()
+        return self
+
+    def create_integration(self):
+        """The API's Lambda proxy integration, to the unqualified function"""
         # Wow that integrationUri parameter.
         # See http://docs.aws.amazon.com/apigateway/api-reference/resource/integration/#uri
         # And https://github.com/boto/boto3/issues/572
-        integrationUri = (
-            f'arn:aws:apigateway:{self.region}' +
-            f':lambda:path/2015-03-31/functions/{self._function_arn}/invocations')
+        integrationUri = self._integration_uri(self._function_arn)
         integration_response = self.apiClient.create_integration(
             ApiId=self._api_id,
             IntegrationMethod='POST',
@@ -76,7 +132,10 @@ class GatewayApi(AWSBase):
             PayloadFormatVersion="2.0"
         )
         self._integration_id = integration_response['IntegrationId']
+        self.state.put(('integration', self._api_id), self._integration_id)
+        return self
 
+    def create_stage(self):
         stage_response = self.apiClient.create_stage(
             ApiId=self._api_id,
             AutoDeploy=True,
@@ -87,9 +146,119 @@ class GatewayApi(AWSBase):
         )
         # More stages can be added by hand, so this one can be treated as
         # pre-production; they'll need to be destroyed by hand too.
-
         return self
 
+    def _integration_uri(self, function_arn):
+        return (f'arn:aws:apigateway:{self.region}' +
+                f':lambda:path/2015-03-31/functions/{function_arn}/invocations')
+
+    def use_alias(self, alias):
+        """Send the integration to the function's alias (None for the
+        unqualified function) and let the API invoke it. Returns True if the
+        integration changed."""
+        self.find()
+        function_arn = f'{self._function_arn}:{alias}' if alias else self._function_arn
+        self.permit_invoke(alias)
+        uri = self._integration_uri(function_arn)
+        integration = self.apiClient.get_integration(
+            ApiId=self._api_id, IntegrationId=self._integration_id)
+        if integration['IntegrationUri'] == uri:
+            return False
+        self.apiClient.update_integration(
+            ApiId=self._api_id,
+            IntegrationId=self._integration_id,
+            IntegrationUri=uri)
+        return True
+
+    def permit_invoke(self, alias=None, prune=False, statements=None):
+        """Let any stage, method and route of the API invoke the function (or
+        alias), with one statement of a fixed id, unless the policy has it
+        already. Returns True if it was added. With prune, also remove other
+        statements for this API - like the one-per-route ones Route.create
+        used to add - and for APIs that no longer exist. statements are the
+        policy's, if already read."""
+        self.find()
+        function = LambdaFunction().find()
+        if statements is None:
+            statements = function.policy_statements(alias)
+        sid = invoke_statement_id(self._api_id, alias)
+        added = False
+        if not any(statement['Sid'] == sid for statement in statements):
+            added = function.permit(self._api_id, APIGATEWAY_PRINCIPAL,
+                                    method='*', qualifier=alias, statement_id=sid)
+        if prune:
+            self.prune_permissions(alias, statements)
+        return added
+
+    def _api_ids(self):
+        """Ids of every API in the region, HTTP/WebSocket and REST alike"""
+        api_ids = {item['ApiId']
+                   for page in self.apiClient.get_paginator('get_apis').paginate()
+                   for item in page['Items']}
+        api_ids.update(item['id']
+                       for page in self.client('apigateway').get_paginator(
+                           'get_rest_apis').paginate()
+                       for item in page['items'])
+        return api_ids
+
+    def prune_permissions(self, alias=None, statements=None):
+        """Remove API Gateway invoke statements other than permit_invoke()'s
+        from the function's (or alias's) policy: those for this API, and those
+        for APIs of this region and account, HTTP or REST, that are gone.
+        Statements for other regions or accounts are left alone. statements
+        are the policy's, if already read. Returns the statement ids removed."""
+        function = LambdaFunction().find()
+        if statements is None:
+            statements = function.policy_statements(alias)
+        keep = invoke_statement_id(self._api_id, alias)
+        candidates = []
+        for statement in statements:
+            source = _invoke_source(statement)
+            if source is None or statement['Sid'] == keep:
+                continue
+            region, account, api_id = source
+            if region == self.region and account == self.account:
+                candidates.append((statement['Sid'], api_id))
+        api_ids = None
+        removed = []
+        # One at a time: concurrent edits of a policy conflict
+        for sid, api_id in candidates:
+            if api_id != self._api_id:
+                if api_ids is None:
+                    api_ids = self._api_ids()
+                if api_id in api_ids:
+                    continue
+            function.remove_permission(sid, alias)
+            removed.append(sid)
+        if removed:
+            logger.info(f"Removed {len(removed)} stale invoke statements from "
+                        f"{function._function_name}{':' + alias if alias else ''}")
+        return removed
+
+    def route_table(self):
+        """{route key: route id} for the API, shared"""
+        def load():
+            return {item['RouteKey']: item['RouteId']
+                    for page in self.apiClient.get_paginator('get_routes').paginate(
+                        ApiId=self._api_id)
+                    for item in page['Items']}
+        return self.state.get(('routes', self._api_id), load)
+
+    def throttle(self, burst_limit, rate_limit):
+        """Stage-wide default throttling: burst_limit requests at once,
+        rate_limit per second steady. Returns True if that changed anything."""
+        self.find()
+        stage = self.apiClient.get_stage(
+            ApiId=self._api_id, StageName=self.app['gateway_stage_name'])
+        settings = _throttled(stage.get('DefaultRouteSettings'), burst_limit, rate_limit)
+        if settings is None:
+            return False
+        self.apiClient.update_stage(
+            ApiId=self._api_id,
+            StageName=self.app['gateway_stage_name'],
+            DefaultRouteSettings=settings)
+        return True
+
     def destroy(self):
         self.find()
         try:
@@ -105,6 +274,9 @@ class GatewayApi(AWSBase):
 
         for item in self.find_all():
             self.apiClient.delete_api(ApiId=item['ApiId'])
+            self.state.invalidate('integration', item['ApiId'])
+            self.state.invalidate('routes', item['ApiId'])
+        self.state.invalidate('apis', self.app['name'])
 
 
 class Route(AWSBase):
@@ -114,24 +286,20 @@ class Route(AWSBase):
         super().__init__()
         self._method = method
         self._path = path
-        self._routeKey = f"{method} /{path}" if method and path else '$default'
+        self._routeKey = route_key(method, path)
         self._gatewayapi = GatewayApi().find()
         self._api_id = self._gatewayapi._api_id
         self._integration_id = self._gatewayapi._integration_id
         self._route_id = None
 
     def find(self):
-        routes_response = self.apiClient.get_routes(ApiId=self._api_id)
-        self._route_id = None
-        for item in routes_response['Items']:
-            if item['RouteKey'] == self._routeKey:
-                self._route_id = item['RouteId']
-                break
+        self._route_id = self._gatewayapi.route_table().get(self._routeKey)
         if self._route_id is None:
             raise RuntimeError(f"No endpoint {self._routeKey!r}")
         return self
 
-    def create(self):
+    def create(self, permit=True):
+        """permit False leaves the Lambda invoke permission to the caller"""
         route_response = self.apiClient.create_route(
             ApiId=self._api_id,
             AuthorizationType='NONE',
@@ -139,10 +307,29 @@ class Route(AWSBase):
             Target=f"integrations/{self._integration_id}"
         )
         self._route_id = route_response['RouteId']
-        LambdaFunction().find().permit(self._api_id, 'apigateway.amazonaws.com')
+        self._gatewayapi.route_table()[self._routeKey] = self._route_id
+        if permit:
+            self._gatewayapi.permit_invoke()
         print(f"{self._method or 'Any'}: {self._gatewayapi._endpoint}/{self._gatewayapi.app['gateway_stage_name']}/{self._path or ''}")
         return self
 
+    def throttle(self, burst_limit, rate_limit):
+        """Throttling for this route alone, overriding the stage's. Returns
+        True if that changed anything."""
+        self.find()
+        stage_name = self._gatewayapi.app['gateway_stage_name']
+        stage = self.apiClient.get_stage(ApiId=self._api_id, StageName=stage_name)
+        route_settings = stage.get('RouteSettings', {})
+        settings = _throttled(route_settings.get(self._routeKey), burst_limit, rate_limit)
+        if settings is None:
+            return False
+        route_settings[self._routeKey] = settings
+        self.apiClient.update_stage(
+            ApiId=self._api_id,
+            StageName=stage_name,
+            RouteSettings=route_settings)
+        return True
+
     def destroy(self):
         self.find()
 
@@ -151,8 +338,77 @@ class Route(AWSBase):
                 self.apiClient.delete_route(ApiId=self._api_id, RouteId=self._route_id)
             except ClientError:
                 pass
+            self._gatewayapi.route_table().pop(self._routeKey, None)
 
 class DefaultRoute(Route):
     def __init__(self):
         super().__init__(None, None)
 
+
+class RouteSet(AWSBase):
+    """The API's whole set of routes at once: routes are (method, path) as
+    for Route. Where Route costs lookups and a permission per route, this
+    reads the route table once, creates and deletes only the difference,
+    concurrently, and keeps a single invoke permission for the API."""
+    def __init__(self, routes, alias=None, max_workers=4):
+        super().__init__()
+        self._routes = {route_key(method, path): (method, path) for method, path in routes}
+        self._alias = alias
+        self._max_workers = max_workers
+        self._gatewayapi = GatewayApi().find()
+        self._api_id = self._gatewayapi._api_id
+        self._integration_id = self._gatewayapi._integration_id
+
+    def _create(self, key):
+        route_response = self.apiClient.create_route(
+            ApiId=self._api_id,
+            AuthorizationType='NONE',
+            RouteKey=key,
+            Target=f"integrations/{self._integration_id}"
+        )
+        return key, route_response['RouteId']
+
+    def _delete(self, key, route_id):
+        try:
+            self.apiClient.delete_route(ApiId=self._api_id, RouteId=route_id)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NotFoundException':
+                raise
+        return key
+
+    def reconcile(self, prune=True):
+        """Make the API's routes exactly these (with prune False, at least
+        these), and its invoke permission the one statement. Returns
+        {'created': [route keys], 'deleted': [route keys],
+        'permissions_removed': [statement ids]}."""
+        table = self._gatewayapi.route_table()
+        create = sorted(set(self._routes) - set(table))
+        delete = sorted(set(table) - set(self._routes)) if prune else []
+        with ThreadPoolExecutor(max_workers=self._max_workers) as pool:
+            creating = [pool.submit(self._create, key) for key in create]
+            deleting = [pool.submit(self._delete, key, table[key]) for key in delete]
+        created, deleted, errors = [], [], []
+        for futures, done in ((creating, created), (deleting, deleted)):
+            for future in futures:
+                try:
+                    done.append(future.result())
+                except Exception as e:
+                    errors.append(e)
+        table.update(created)
+        for key in deleted:
+            table.pop(key, None)
+        if errors:
+            # What a failed call did is unknown; read the table afresh next time
+            self.state.invalidate('routes', self._api_id)
+            logger.error(f"RouteSet {self._api_id}: {len(errors)} route changes failed")
+            raise errors[0]
+
+        statements = LambdaFunction().find().policy_statements(self._alias)
+        self._gatewayapi.permit_invoke(self._alias, statements=statements)
+        removed = self._gatewayapi.prune_permissions(self._alias, statements)
+        result = {'created': [key for key, _ in created], 'deleted': deleted,
+                  'permissions_removed': removed}
+        logger.info(f"RouteSet {self._api_id}: {len(created)} created, {len(deleted)} "
+                    f"deleted, {len(removed)} stale permissions removed, "
+                    f"{len(table)} routes")
+        return result
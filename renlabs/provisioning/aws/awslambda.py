@@ -1,8 +1,63 @@
-import zipfile, io, traceback, uuid, json, os
+import zipfile, traceback, uuid, json, os, base64, hashlib, contextlib, tempfile, shutil, stat
+from urllib.parse import urlencode
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 from . import AWSBase, nuke_roles
 
+import logging
+logger = logging.getLogger(__name__)
+
+# Lambda's limit on a package sent inline rather than through S3
+INLINE_PACKAGE_LIMIT = 50 * 1024 * 1024
+UPLOAD_CONFIG = TransferConfig(multipart_threshold=8 * 1024 * 1024,
+                               multipart_chunksize=8 * 1024 * 1024,
+                               max_concurrency=8)
+# Zip's earliest representable date, for every entry in a built package
+PACKAGE_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def build_package(source, destination):
+    """
+    Zip source - a file, or a directory's contents - to destination so that
+    the same content always makes the same bytes, and so the same CodeSha256:
+    entries sorted by name, dated 1980-01-01, mode 644 (755 if the owner can
+    execute), deflated at the default level. Directories get no entries of
+    their own. Returns destination.
+
+    Compiled .pyc files embed their source's mtime unless they were made
+    hash-based; pip (and compileall) make them so when SOURCE_DATE_EPOCH
+    is set, as the AWS.org package builder does.
+    """
+    if os.path.isdir(source):
+        entries = []
+        for dirpath, dirnames, filenames in os.walk(source):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                entries.append((os.path.relpath(path, source).replace(os.sep, '/'), path))
+    else:
+        entries = [(os.path.basename(source), source)]
+
+    with zipfile.ZipFile(destination, 'w') as z:
+        for arcname, path in sorted(entries):
+            info = zipfile.ZipInfo(arcname, PACKAGE_DATE_TIME)
+            info.create_system = 3  # unix, so external_attr holds the mode
+            mode = 0o755 if os.stat(path).st_mode & stat.S_IXUSR else 0o644
+            info.external_attr = (stat.S_IFREG | mode) << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as src, z.open(info, 'w') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+    return destination
+
 class LambdaExecutionRole(AWSBase):
+    MANAGED_POLICIES = [
+        'AmazonAPIGatewayInvokeFullAccess',
+        'AmazonSNSFullAccess',
+        'AWSLambdaFullAccess',
+        'service-role/AWSLambdaBasicExecutionRole',
+        'service-role/AWSLambdaSQSQueueExecutionRole',
+        'service-role/AWSLambdaVPCAccessExecutionRole',
+        'service-role/AmazonAPIGatewayPushToCloudWatchLogs']
+
     def __init__(self):
         super().__init__()
         self._role_arn = None
@@ -13,22 +68,26 @@ class LambdaExecutionRole(AWSBase):
         return self._name
 
     def destroy(self):
+        self.state.invalidate('role', self._name)
         try:
-            nuke_roles([self._name])
+            nuke_roles([self._name], role=self._role)
         except ClientError:
             pass
 
     def find(self):
-        r = self.iamClient.get_role(RoleName=self._name)
-        self._role_arn = r['Role']['Arn']
+        self._role_arn = self.state.get(
+            ('role', self._name),
+            lambda: self.iamClient.get_role(RoleName=self._name)['Role']['Arn'])
         return self
 
     def create(self):
-        role_names = map(lambda x: x['RoleName'], self.iamClient.list_roles()['Roles'])
         if self._role_arn:
             raise RuntimeError("Role {} already has ARN {}".format(self._name, self._role_arn))
-        if self._name in role_names:
+        try:
+            self.iamClient.get_role(RoleName=self._name)
             raise RuntimeError("Role {} already exists".format(self._name))
+        except self.iamClient.exceptions.NoSuchEntityException:
+            pass
 
         arpd = json.dumps({
             "Version": "2012-10-17",
@@ -63,47 +122,116 @@ class LambdaExecutionRole(AWSBase):
                 }
             ])
 
-        for managed_policy_name in [
-                'AmazonAPIGatewayInvokeFullAccess',
-                'AmazonSNSFullAccess',
-                'AWSLambdaFullAccess',
-                'service-role/AWSLambdaBasicExecutionRole',
-                'service-role/AWSLambdaSQSQueueExecutionRole',
-                'service-role/AWSLambdaVPCAccessExecutionRole',
-                'service-role/AmazonAPIGatewayPushToCloudWatchLogs']:
+        self.attach_policies(self.MANAGED_POLICIES)
+        self._role_arn = self.state.put(('role', self._name), created_role['Role']['Arn'])
+        return self
+
+    @staticmethod
+    def policy_arn(managed_policy_name):
+        return "arn:aws:iam::aws:policy/{}".format(managed_policy_name)
+
+    def attach_policies(self, managed_policy_names):
+        for managed_policy_name in managed_policy_names:
             self.iamClient.attach_role_policy(
                 RoleName=self._name,
-                PolicyArn="arn:aws:iam::aws:policy/{}".format(managed_policy_name))
-        self._role_arn = created_role['Role']['Arn']
+                PolicyArn=self.policy_arn(managed_policy_name))
         return self
 
 
 class LambdaFunction(AWSBase):
+    HANDLER = "lambda_function.lambda_handler"
+
     def __init__(self):
         """code is local filename for lambda function file or zip archive"""
         super().__init__()
         self._function_arn = None
+        self._function_url = None
         self._function_name = f"lambda_{self.app['name']}"
 
-    def _zipfile_bytes(self, filename):
+    @contextlib.contextmanager
+    def _package(self, filename):
+        """Path of the zip to deploy: filename itself if it's a zip, else
+        a temporary build_package() of the file or directory"""
         pkgType = filename.rsplit('.',1)[-1]
         if pkgType == 'zip':
-            return open(filename, 'rb').read()  # yikes, RAM hog
+            yield filename
+            return
+
+        with tempfile.TemporaryDirectory() as tmp:
+            yield build_package(filename, os.path.join(tmp, 'package.zip'))
+
+    def _zipfile_bytes(self, filename):
+        with self._package(filename) as path:
+            if os.path.getsize(path) > INLINE_PACKAGE_LIMIT:
+                raise RuntimeError(
+                    f"{filename} is over Lambda's {INLINE_PACKAGE_LIMIT} byte direct upload "
+                    "limit; set app['code_bucket'] to deploy through S3")
+            with open(path, 'rb') as f:
+                return f.read()
+
+    @staticmethod
+    def _sha256(path):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(block)
+        return h
+
+    def code_sha256(self, code_filename):
+        """The package's CodeSha256, as Lambda computes it: base64 of the
+        SHA-256 of the zip"""
+        with self._package(code_filename) as path:
+            return base64.b64encode(self._sha256(path).digest()).decode('ascii')
+
+    def deployed_code_sha256(self):
+        return self.lambdaClient.get_function(
+            FunctionName=self._function_name)['Configuration']['CodeSha256']
+
+    def upload_package(self, code_filename):
+        """Put the package in app['code_bucket'] under a key made from its
+        SHA-256 (after app['code_prefix'], default "lambda/<name>/"), unless
+        it's there already. Multipart, on threads, from disk. Returns the
+        S3Bucket/S3Key Code dict."""
+        bucket = self.app['code_bucket']
+        prefix = self.app.get('code_prefix', f"lambda/{self.app['name']}/")
+        with self._package(code_filename) as path:
+            key = f"{prefix}{self._sha256(path).hexdigest()}.zip"
+
+            def uploaded():
+                try:
+                    self.s3Client.head_object(Bucket=bucket, Key=key)
+                    return True
+                except ClientError as e:
+                    if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+                        raise
+                    return False
+
+            if not self.state.get(('s3-object', bucket, key), uploaded):
+                self.s3Client.upload_file(
+                    path, bucket, key,
+                    ExtraArgs={'Tagging': urlencode({'provisioning': self.app['provisioning_tag']})},
+                    Config=UPLOAD_CONFIG)
+                self.state.put(('s3-object', bucket, key), True)
+        return {'S3Bucket': bucket, 'S3Key': key}
 
-        dirname, basename = os.path.split(filename)
-        zf = io.BytesIO()
-        z = zipfile.ZipFile(zf, 'x', compression=zipfile.ZIP_DEFLATED)
-        z.write(os.path.join(dirname, basename), arcname=basename)
-        z.close()
-        return zf.getvalue()
+    def _code(self, code_filename):
+        """create_function's Code: from S3 if app has a code_bucket"""
+        if self.app.get('code_bucket'):
+            return self.upload_package(code_filename)
+        return {"ZipFile": self._zipfile_bytes(code_filename)}
 
     def find(self):
-        fn = self.lambdaClient.get_function(FunctionName=self._function_name)
-        self._function_arn = fn['Configuration']['FunctionArn']
+        self._function_arn = self.state.get(
+            ('function', self._function_name),
+            lambda: self.lambdaClient.get_function(
+                FunctionName=self._function_name)['Configuration']['FunctionArn'])
         return self
 
-    def create(self, role_arn, code_filename, timeout=3, memory_size=128):
-        handler = "lambda_function.lambda_handler"
+    def create(self, role_arn, code_filename, timeout=3, memory_size=128,
+               url_invoke_mode=None):
+        """url_invoke_mode BUFFERED or RESPONSE_STREAM also creates a public
+        function URL (see create_url)"""
+        handler = self.HANDLER
         created_function = self.lambdaClient.create_function(
             FunctionName=self._function_name,
             Runtime=self.app.get('lambda_runtime', 'python3.8'),
@@ -113,35 +241,227 @@ class LambdaFunction(AWSBase):
             Timeout=timeout,
             MemorySize=memory_size,
             Publish=True,
-            Code = {
-                "ZipFile": self._zipfile_bytes(code_filename)
-            },
+            Code = self._code(code_filename),
             Tags = {
                 "provisioning": self.app['provisioning_tag']
             })
 
-        self._function_arn = created_function['FunctionArn']
+        # Unqualified, as get_function reports it, should a version be on it
+        self._function_arn = self.state.put(
+            ('function', self._function_name),
+            ':'.join(created_function['FunctionArn'].split(':')[:7]))
+        if url_invoke_mode:
+            self.create_url(invoke_mode=url_invoke_mode)
         return self
 
-    def update_handler(self, code_filename):
-        self.lambdaClient.update_function_code(
-            FunctionName=self._function_name,
-            ZipFile=self._zipfile_bytes(code_filename),
-            Publish=True
-        )
+    def update_handler(self, code_filename, force=False):
+        """Deploy the package and publish a version, unless (without force)
+        the function already runs exactly this package. Returns True if it
+        was deployed."""
+        with self._package(code_filename) as path:
+            if not force and self.code_sha256(path) == self.deployed_code_sha256():
+                logger.info(f"{self._function_name} code unchanged, not updated")
+                return False
+            self.lambdaClient.get_waiter('function_updated').wait(
+                FunctionName=self._function_name)
+            self.lambdaClient.update_function_code(
+                FunctionName=self._function_name,
+                Publish=True,
+                **self._code(path)
+            )
+        return True
+
+    def update_configuration(self, **changes):
+        """update_function_configuration with these keyword arguments, once
+        any update in progress is done"""
+        self.lambdaClient.get_waiter('function_updated').wait(
+            FunctionName=self._function_name)
+        self.lambdaClient.update_function_configuration(
+            FunctionName=self._function_name, **changes)
+        return self
 
-    def permit(self, api_id, principal, method='$default', path_constraint=None):
+    def permit(self, api_id, principal, method='$default', path_constraint=None,
+               qualifier=None, statement_id=None):
+        """Let api_id invoke the function, or with qualifier that alias or
+        version. Given a statement_id, an existing statement by that id is
+        left alone; returns whether one was added."""
         arn = f"arn:aws:execute-api:{self.region}:{self.account}:{api_id}/*/{method}"
         if path_constraint:
             arn += path_constraint
-        self.lambdaClient.add_permission(
-            Action='lambda:InvokeFunction',
+        kwargs = {'Qualifier': qualifier} if qualifier else {}
+        try:
+            self.lambdaClient.add_permission(
+                Action='lambda:InvokeFunction',
+                FunctionName=self._function_name,
+                Principal=principal,
+                StatementId=statement_id or str(uuid.uuid4()),
+                SourceArn=arn,
+                **kwargs)
+        except self.lambdaClient.exceptions.ResourceConflictException:
+            if not statement_id:
+                raise
+            return False
+        return True
+
+    def policy_statements(self, qualifier=None):
+        """The statements of the function's resource policy, or with
+        qualifier its alias's or version's"""
+        kwargs = {'Qualifier': qualifier} if qualifier else {}
+        try:
+            policy = self.lambdaClient.get_policy(FunctionName=self._function_name, **kwargs)
+        except self.lambdaClient.exceptions.ResourceNotFoundException:
+            return []
+        return json.loads(policy['Policy']).get('Statement', [])
+
+    def remove_permission(self, statement_id, qualifier=None):
+        kwargs = {'Qualifier': qualifier} if qualifier else {}
+        try:
+            self.lambdaClient.remove_permission(
+                FunctionName=self._function_name, StatementId=statement_id, **kwargs)
+        except self.lambdaClient.exceptions.ResourceNotFoundException:
+            pass
+
+    def publish_alias(self, alias, description=''):
+        """Publish a version and point alias at it, creating the alias if
+        need be. Lambda hands back the latest version rather than publishing
+        when nothing changed since, so this is safe to repeat. Returns the
+        version if the alias was created or moved, else None."""
+        self.lambdaClient.get_waiter('function_updated').wait(
+            FunctionName=self._function_name)
+        version = self.lambdaClient.publish_version(
+            FunctionName=self._function_name)['Version']
+        try:
+            current = self.lambdaClient.get_alias(
+                FunctionName=self._function_name, Name=alias)['FunctionVersion']
+        except self.lambdaClient.exceptions.ResourceNotFoundException:
+            self.lambdaClient.create_alias(
+                FunctionName=self._function_name,
+                Name=alias,
+                FunctionVersion=version,
+                Description=description)
+            return version
+        if current == version:
+            return None
+        self.lambdaClient.update_alias(
             FunctionName=self._function_name,
-            Principal=principal,
-            StatementId=str(uuid.uuid4()),
-            SourceArn=arn)
+            Name=alias,
+            FunctionVersion=version)
+        return version
+
+    def get_provisioned_concurrency(self, alias):
+        try:
+            return self.lambdaClient.get_provisioned_concurrency_config(
+                FunctionName=self._function_name,
+                Qualifier=alias)['RequestedProvisionedConcurrentExecutions']
+        except self.lambdaClient.exceptions.ProvisionedConcurrencyConfigNotFoundException:
+            return 0
+
+    def provisioned_concurrency(self, alias, count):
+        """Keep count execution environments initialized for alias; 0 removes
+        the setting. Returns True if that changed anything."""
+        if count == self.get_provisioned_concurrency(alias):
+            return False
+        if count:
+            self.lambdaClient.put_provisioned_concurrency_config(
+                FunctionName=self._function_name,
+                Qualifier=alias,
+                ProvisionedConcurrentExecutions=count)
+        else:
+            self.lambdaClient.delete_provisioned_concurrency_config(
+                FunctionName=self._function_name,
+                Qualifier=alias)
+        return True
+
+    def reserved_concurrency(self, count):
+        """Reserve count concurrent executions for the function; None
+        returns it to the unreserved pool. Returns True if that changed
+        anything."""
+        current = self.lambdaClient.get_function_concurrency(
+            FunctionName=self._function_name).get('ReservedConcurrentExecutions')
+        if count == current:
+            return False
+        if count is None:
+            self.lambdaClient.delete_function_concurrency(
+                FunctionName=self._function_name)
+        else:
+            self.lambdaClient.put_function_concurrency(
+                FunctionName=self._function_name,
+                ReservedConcurrentExecutions=count)
+        return True
+
+    def autoscale(self, alias, min_capacity, max_capacity, target_utilization=0.7):
+        """Have Application Auto Scaling track alias's provisioned
+        concurrency utilization at target_utilization, between min_capacity
+        and max_capacity; max_capacity None stops it. Returns True if that
+        changed anything."""
+        c = self.autoscalingClient
+        target = {
+            'ServiceNamespace': 'lambda',
+            'ResourceId': f'function:{self._function_name}:{alias}',
+            'ScalableDimension': 'lambda:function:ProvisionedConcurrency',
+        }
+        policy_name = f'{self._function_name}-{alias}-utilization'
+        registered = c.describe_scalable_targets(
+            ServiceNamespace='lambda',
+            ResourceIds=[target['ResourceId']],
+            ScalableDimension=target['ScalableDimension'])['ScalableTargets']
+        if max_capacity is None:
+            if not registered:
+                return False
+            c.deregister_scalable_target(**target)
+            return True
+
+        changed = False
+        if not registered or (registered[0]['MinCapacity'], registered[0]['MaxCapacity']) \
+                != (min_capacity, max_capacity):
+            c.register_scalable_target(MinCapacity=min_capacity,
+                                       MaxCapacity=max_capacity, **target)
+            changed = True
+        tracking = {
+            'TargetValue': target_utilization,
+            'PredefinedMetricSpecification': {
+                'PredefinedMetricType': 'LambdaProvisionedConcurrencyUtilization'
+            }
+        }
+        policies = c.describe_scaling_policies(PolicyNames=[policy_name],
+                                               **target)['ScalingPolicies']
+        if not policies or policies[0].get(
+                'TargetTrackingScalingPolicyConfiguration', {}).get('TargetValue') \
+                != target_utilization:
+            c.put_scaling_policy(
+                PolicyName=policy_name,
+                PolicyType='TargetTrackingScaling',
+                TargetTrackingScalingPolicyConfiguration=tracking,
+                **target)
+            changed = True
+        return changed
+
+    def create_url(self, auth_type='NONE', invoke_mode='BUFFERED'):
+        """Give the function an HTTPS endpoint. invoke_mode RESPONSE_STREAM
+        pairs with renlabs.runtime.aws.wsgi.streaming; BUFFERED with the other
+        handlers (function URL events use the API Gateway v2 payload)."""
+        url_config = self.lambdaClient.create_function_url_config(
+            FunctionName=self._function_name,
+            AuthType=auth_type,
+            InvokeMode=invoke_mode)
+        if auth_type == 'NONE':
+            self.lambdaClient.add_permission(
+                Action='lambda:InvokeFunctionUrl',
+                FunctionName=self._function_name,
+                Principal='*',
+                StatementId='FunctionURLAllowPublicAccess',
+                FunctionUrlAuthType='NONE')
+        self._function_url = url_config['FunctionUrl']
+        return self
+
+    def update_url(self, invoke_mode):
+        self.lambdaClient.update_function_url_config(
+            FunctionName=self._function_name,
+            InvokeMode=invoke_mode)
+        return self
 
     def destroy(self):
+        self.state.invalidate('function', self._function_name)
         try:
             self.lambdaClient.get_function(FunctionName=self._function_name)
             try:
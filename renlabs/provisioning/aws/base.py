@@ -1,4 +1,6 @@
-import boto3, logging
+import logging
+from . import clients
+from .state import StateCache
 
 logger = logging.getLogger(__name__)
 
@@ -9,17 +11,19 @@ class AWSBase:
     application-specific AWS manipulation objects that don't need per-instance
     or per-class configuration. (A similar thing could be done by passing
     around a configuration object, but this might hide the details better)
+
+    Clients come from the shared registry in clients, for the configured
+    region and role. Resource lookups are remembered in state, a StateCache
+    shared by all instances.
     """
 
     app = dict()
-    _iamClient = None
     _iam_get_user = None
     _account = None
     _region = None
+    _role = None
     _provisioning_tag = None
-    _lambdaClient = None
-    _apiClient = None
-    _s3Client = None
+    state = StateCache()
 
     def __init__(self):
         if self.__class__ == AWSBase:
@@ -27,20 +31,25 @@ class AWSBase:
 Run AWSBase.class_configure once, and build on subclass instances.""")
 
     @classmethod
-    def class_configure(cls, region, provisioning_tag, app={}):
+    def class_configure(cls, region, provisioning_tag, app={}, role=None, state_ttl=None):
         """
         Do some basic AWS lookups once, so subclass instances have basic info
-        available.
+        available. With role, an IAM role ARN, AWS is manipulated as that role.
+        Looked-up state is kept state_ttl seconds, by default until changed
+        through these classes.
         """
         cls.app.update(app)
 
         cls._region = region
+        cls._role = role
         cls._provisioning_tag = provisioning_tag
+        cls.state = StateCache(state_ttl)
 
-        # Lazy-instantiate clients where we can, but need this one now
-        cls._iamClient = boto3.client('iam')
-        cls._iam_get_user = cls._iamClient.get_user()['User']
-        cls._account = cls._iam_get_user['Arn'].split(':')[4]
+        if role:
+            cls._account = role.split(':')[4]
+        else:
+            cls._iam_get_user = clients.client('iam').get_user()['User']
+            cls._account = cls._iam_get_user['Arn'].split(':')[4]
 
     @property
     def account(self):
@@ -54,27 +63,27 @@ Run AWSBase.class_configure once, and build on subclass instances.""")
     def provisioning_tag(self):
         return self._provisioning_tag
 
+    def client(self, service):
+        return clients.client(service, self._region, self._role)
+
     @property
     def iamClient(self):
-        if not self._iamClient:
+        if not self._account:
             logger.warning('Did you call AWSBase.class_configure()?')
-            self._iamClient = boto3.client('iam')
-        return self._iamClient
+        return clients.client('iam', None, self._role)
 
     @property
     def lambdaClient(self):
-        if not self._lambdaClient:
-            self._lambdaClient = boto3.client('lambda')
-        return self._lambdaClient
+        return self.client('lambda')
 
     @property
     def apiClient(self):
-        if not self._apiClient:
-            self._apiClient = boto3.client('apigatewayv2')
-        return self._apiClient
+        return self.client('apigatewayv2')
 
     @property
     def s3Client(self):
-        if not self._s3Client:
-            self._s3Client = boto3.client('s3')
-        return self._s3Client
+        return self.client('s3')
+
+    @property
+    def autoscalingClient(self):
+        return self.client('application-autoscaling')
@@ -0,0 +1,108 @@
+"""\
+Capacity settings for a deployed app, applied in one step:
+
+    CapacityProfile(provisioned=2, provisioned_max=10, reserved=20,
+                    burst_limit=200, rate_limit=100,
+                    route_throttles={('POST', 'upload'): (10, 5)}).apply()
+
+publishes the function's current code as a version behind an alias ('live'),
+points the API's integration at the alias, keeps provisioned execution
+environments ready on it (with provisioned_max, Application Auto Scaling moves
+their number between the two on utilization) and reserves concurrency for the
+function.
+The stage gets default burst/rate throttles, and named routes their own.
+
+Settings left None are left as they are. Each is read back first and only
+written if it differs, so applying the same profile again changes nothing.
+"""
+
+from .base import AWSBase
+from .awslambda import LambdaFunction
+from .apigatewayv2 import GatewayApi, Route
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class CapacityProfile(AWSBase):
+    def __init__(self, alias='live', provisioned=None, provisioned_max=None,
+                 target_utilization=0.7, reserved=None, burst_limit=None,
+                 rate_limit=None, route_throttles=None):
+        """route_throttles maps (method, path) as for Route, (None, None) for
+        $default, to (burst_limit, rate_limit)"""
+        super().__init__()
+        if provisioned_max is not None and not provisioned:
+            raise ValueError("provisioned_max needs a provisioned minimum")
+        if provisioned_max is not None and provisioned_max < provisioned:
+            raise ValueError("provisioned_max is less than provisioned")
+        if reserved is not None and max(provisioned or 0, provisioned_max or 0) > reserved:
+            raise ValueError("Provisioned concurrency can't exceed reserved")
+        if (burst_limit is None) != (rate_limit is None):
+            raise ValueError("Give both burst_limit and rate_limit, or neither")
+        self.alias = alias
+        self.provisioned = provisioned
+        self.provisioned_max = provisioned_max
+        self.target_utilization = target_utilization
+        self.reserved = reserved
+        self.burst_limit = burst_limit
+        self.rate_limit = rate_limit
+        self.route_throttles = dict(route_throttles or {})
+
+    def apply(self):
+        """Bring the deployment to this profile. Returns a list of what
+        changed, empty if it already matched."""
+        changes = []
+        function = LambdaFunction().find()
+        name = function._function_name
+
+        version = function.publish_alias(self.alias)
+        if version is not None:
+            changes.append(f"lambda -> {name}:{self.alias} = version {version}")
+
+        # Reserve first: provisioned concurrency must fit under it
+        if self.reserved is not None and function.reserved_concurrency(self.reserved):
+            changes.append(f"lambda -> {name} reserved concurrency {self.reserved}")
+
+        if self.provisioned is not None:
+            if self.provisioned_max is None:
+                if function.autoscale(self.alias, None, None):
+                    changes.append(f"lambda -> {name}:{self.alias} autoscaling off")
+                if function.provisioned_concurrency(self.alias, self.provisioned):
+                    changes.append(f"lambda -> {name}:{self.alias} "
+                                   f"provisioned concurrency {self.provisioned}")
+            else:
+                # Once scaling, the current count is the scaler's business
+                if (function.get_provisioned_concurrency(self.alias) == 0
+                        and function.provisioned_concurrency(self.alias, self.provisioned)):
+                    changes.append(f"lambda -> {name}:{self.alias} "
+                                   f"provisioned concurrency {self.provisioned}")
+                if function.autoscale(self.alias, self.provisioned, self.provisioned_max,
+                                      self.target_utilization):
+                    changes.append(
+                        f"lambda -> {name}:{self.alias} autoscaling "
+                        f"{self.provisioned}-{self.provisioned_max} "
+                        f"at {self.target_utilization:.0%}")
+
+        gateway = GatewayApi()
+        if gateway.find_all():
+            changes.extend(self._apply_gateway(gateway, name))
+        elif self.burst_limit is not None or self.route_throttles:
+            raise RuntimeError(f"No GatewayApi {self.app['name']!r} to throttle")
+
+        for change in changes:
+            logger.info(change)
+        return changes
+
+    def _apply_gateway(self, gateway, name):
+        changes = []
+        if gateway.use_alias(self.alias):
+            changes.append(f"apigatewayv2 -> integration to {name}:{self.alias}")
+        if self.burst_limit is not None and gateway.throttle(self.burst_limit, self.rate_limit):
+            changes.append(f"apigatewayv2 -> {self.app['gateway_stage_name']} throttle "
+                           f"{self.burst_limit} burst, {self.rate_limit}/s")
+        for (method, path), (burst_limit, rate_limit) in self.route_throttles.items():
+            route = Route(method, path)
+            if route.throttle(burst_limit, rate_limit):
+                changes.append(f"apigatewayv2 -> {route._routeKey} throttle "
+                               f"{burst_limit} burst, {rate_limit}/s")
+        return changes
@@ -0,0 +1,122 @@
+"""\
+One boto3 client per (service, region, role), shared by everything that
+provisions.
+
+Building a client means resolving its endpoint and loading the service model,
+tens of milliseconds each time, and every client has its own connection pool.
+Provisioning code gets its clients here instead, from a single boto3.Session
+and with one botocore Config: connection pools big enough for the concurrent
+teardown and discovery, adaptive retries (the client slows itself down when
+throttled), and bounded timeouts. configure() swaps either.
+
+With a role ARN, clients run on credentials assumed from it, renewed as they
+near expiry.
+
+At DEBUG, client construction times are logged, and stats() (logged by
+log_stats()) reports per client how many requests went over how many
+connections.
+"""
+
+import threading, time
+import boto3
+from botocore.config import Config
+
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = Config(
+    max_pool_connections=32,
+    retries={'mode': 'adaptive', 'max_attempts': 10},
+    connect_timeout=5,
+    read_timeout=60)
+
+# Assumed-role clients are rebuilt this long before their credentials expire
+ROLE_REFRESH_MARGIN = 300
+
+
+class ClientRegistry:
+    def __init__(self, session=None, config=None):
+        self.session = session or boto3.Session()
+        self.config = config or DEFAULT_CONFIG
+        self._clients = {}  # (service, region, role) -> (client, expiry or None)
+        self._build_seconds = {}
+        self._lock = threading.RLock()
+
+    def client(self, service, region=None, role=None):
+        key = (service, region, role)
+        entry = self._clients.get(key)
+        if entry is not None and (entry[1] is None or entry[1] > time.time()):
+            return entry[0]
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= time.time()):
+                started = time.perf_counter()
+                entry = self._clients[key] = self._build(service, region, role)
+                seconds = time.perf_counter() - started
+                self._build_seconds[key] = self._build_seconds.get(key, 0.0) + seconds
+                logger.debug(f"{__name__} built {service} client for "
+                             f"{region or 'default region'}{f' as {role}' if role else ''} "
+                             f"in {seconds * 1000.0:.1f}ms")
+            return entry[0]
+
+    def _build(self, service, region, role):
+        kwargs = {'config': self.config}
+        if region:
+            kwargs['region_name'] = region
+        if not role:
+            return self.session.client(service, **kwargs), None
+        # sts itself comes from the registry, on the session's own credentials
+        credentials = self.client('sts', region).assume_role(
+            RoleArn=role, RoleSessionName='renlabs-provisioning')['Credentials']
+        c = self.session.client(
+            service,
+            aws_access_key_id=credentials['AccessKeyId'],
+            aws_secret_access_key=credentials['SecretAccessKey'],
+            aws_session_token=credentials['SessionToken'],
+            **kwargs)
+        return c, credentials['Expiration'].timestamp() - ROLE_REFRESH_MARGIN
+
+    def stats(self):
+        """{(service, region, role): {...}}: seconds spent building the
+        client, and the requests it made over how many connections"""
+        stats = {}
+        for key, (c, _) in list(self._clients.items()):
+            requests = connections = 0
+            try:
+                # urllib3 pools behind botocore's http session; private, so
+                # best effort
+                manager = c._endpoint.http_session._manager
+                for pool_key in manager.pools.keys():
+                    pool = manager.pools.get(pool_key)
+                    if pool is not None:
+                        requests += pool.num_requests
+                        connections += pool.num_connections
+            except AttributeError:
+                requests = connections = None
+            stats[key] = {'build_seconds': round(self._build_seconds.get(key, 0.0), 4),
+                          'requests': requests, 'connections': connections}
+        return stats
+
+    def log_stats(self):
+        if logger.isEnabledFor(logging.DEBUG):
+            for (service, region, role), s in self.stats().items():
+                logger.debug(f"{__name__} {service} {region or '-'} {role or '-'}: "
+                             f"built in {s['build_seconds'] * 1000.0:.1f}ms, "
+                             f"{s['requests']} requests over {s['connections']} connections")
+
+
+registry = ClientRegistry()
+
+
+def configure(session=None, config=None):
+    """Start a new registry on this session and/or botocore Config (merged
+    over DEFAULT_CONFIG); clients built so far are dropped"""
+    global registry
+    if config is not None:
+        config = DEFAULT_CONFIG.merge(config)
+    registry = ClientRegistry(session, config)
+    return registry
+
+
+def client(service, region=None, role=None):
+    return registry.client(service, region, role)
@@ -0,0 +1,111 @@
+"""\
+Running dependent AWS operations concurrently: each node as soon as the nodes
+it comes after have finished. Teardown and the plan/apply engine build their
+work as nodes and run it here.
+"""
+
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Node:
+    def __init__(self, key, label, action, after=()):
+        self.key = key
+        self.label = label  # "service -> what"
+        self.action = action
+        self.after = set(after)
+
+
+def _prerequisites(nodes):
+    return {key: node.after & nodes.keys() for key, node in nodes.items()}
+
+
+def waves(nodes):
+    """Lists of nodes (from {key: node}) in an order they can run: each
+    wave only after the one before, the nodes within a wave independently"""
+    remaining = _prerequisites(nodes)
+    result = []
+    while remaining:
+        ready = sorted((k for k, after in remaining.items() if not after), key=str)
+        if not ready:
+            raise RuntimeError(f"Dependency cycle among {sorted(remaining, key=str)}")
+        result.append([nodes[k] for k in ready])
+        for k in ready:
+            del remaining[k]
+        for after in remaining.values():
+            after.difference_update(ready)
+    return result
+
+
+def plan_lines(nodes):
+    """A line per node under a line per wave"""
+    lines = []
+    for n, wave in enumerate(waves(nodes), 1):
+        lines.append(f"wave {n}:")
+        lines.extend(f"  {node.label}" for node in wave)
+    return lines
+
+
+def run(nodes, execute, max_workers=16, progress=print):
+    """Call execute(node) for each of {key: node} on up to max_workers
+    threads, each as soon as what it comes after is done. progress gets a
+    line per node as it finishes. A node whose execute raises is recorded,
+    and whatever waits on it is skipped. Returns ({key: what execute
+    returned}, {label: exception})."""
+    waves(nodes)  # fail early on a cycle
+    remaining = _prerequisites(nodes)
+    dependents = defaultdict(set)
+    for key, after in remaining.items():
+        for prerequisite in after:
+            dependents[prerequisite].add(key)
+
+    outcomes = {}
+    failures = {}
+    total = len(remaining)
+    finished = 0
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = {}
+
+        def start(key):
+            del remaining[key]
+            running[pool.submit(execute, nodes[key])] = key
+
+        def skip(key):
+            nonlocal finished
+            for dependent in dependents[key]:
+                if dependent in remaining:
+                    del remaining[dependent]
+                    finished += 1
+                    progress(f"[{finished}/{total}] skipped {nodes[dependent].label}")
+                    skip(dependent)
+
+        for key in [k for k, after in remaining.items() if not after]:
+            start(key)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                node = nodes[key]
+                finished += 1
+                try:
+                    outcome = outcomes[key] = future.result()
+                except Exception as e:
+                    failures[node.label] = e
+                    logger.error(f"{node.label} failed: {e}")
+                    progress(f"[{finished}/{total}] FAILED {node.label}: {e}")
+                    skip(key)
+                    continue
+                progress(f"[{finished}/{total}] {outcome} {node.label}")
+                for dependent in dependents[key]:
+                    if dependent in remaining:
+                        remaining[dependent].discard(key)
+                        if not remaining[dependent]:
+                            start(dependent)
+    logger.info(f"{len(outcomes)} of {total} done, {len(failures)} failed, "
+                f"in {time.monotonic() - started:.1f}s")
+    return outcomes, failures
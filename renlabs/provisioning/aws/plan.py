@@ -0,0 +1,308 @@
+"""\
+Declarative provisioning: say what the app's role, function and HTTP API
+should look like, and get only the changes that takes.
+
+    d = Deployment('function.zip', routes=[('GET', 'items'), ('POST', 'items')])
+    plan = d.plan()     # reads what's there, in one concurrent sweep
+    print(plan)         # the steps, in waves; "No changes" if none
+    d.apply(plan)       # runs them, independent steps concurrently
+
+Deployment observes the execution role and its managed policies, the
+function's configuration, code hash and invoke permissions, and the API with
+its integration, stage and routes. Whatever is missing is created with the
+LambdaExecutionRole, LambdaFunction, GatewayApi and Route methods; a changed
+configuration or code package is updated in place; routes not in the spec are
+deleted (unless prune_routes is False). Nothing is destroyed and recreated.
+Re-planning an unchanged deployment makes read calls only.
+
+What's observed also seeds AWSBase.state, so the classes don't look it up
+again while applying.
+"""
+
+import json, time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+
+from . import graph
+from .graph import Node
+from .base import AWSBase
+from .awslambda import LambdaExecutionRole, LambdaFunction
+from .apigatewayv2 import GatewayApi, Route, route_key, invoke_statement_id
+
+import logging
+logger = logging.getLogger(__name__)
+
+GONE_CODES = {'NoSuchEntity', 'ResourceNotFoundException', 'NotFoundException'}
+# A role just created can take a few seconds before Lambda may assume it
+ROLE_PROPAGATION_SECONDS = 30
+
+
+def _or_none(call, **kwargs):
+    try:
+        return call(**kwargs)
+    except ClientError as e:
+        if e.response['Error']['Code'] in GONE_CODES:
+            return None
+        raise
+
+
+class Plan:
+    def __init__(self, nodes):
+        self.nodes = nodes  # {key: graph.Node}
+
+    def __bool__(self):
+        return bool(self.nodes)
+
+    def lines(self):
+        return graph.plan_lines(self.nodes) if self.nodes else ["No changes"]
+
+    def __str__(self):
+        return "\n".join(self.lines())
+
+
+class Deployment(AWSBase):
+    def __init__(self, code_filename, routes=((None, None),), timeout=3,
+                 memory_size=128, alias=None, prune_routes=True, max_workers=8):
+        """routes are (method, path) as for Route, (None, None) for $default.
+        alias names the function alias the API should invoke (published
+        here when missing, and moved to new code); None for the unqualified
+        function."""
+        super().__init__()
+        self.code_filename = code_filename
+        self.routes = {route_key(method, path): (method, path) for method, path in routes}
+        self.timeout = timeout
+        self.memory_size = memory_size
+        self.alias = alias
+        self.prune_routes = prune_routes
+        self.max_workers = max_workers
+        self.failures = {}
+        self._execution_role = LambdaExecutionRole()
+        self._function = LambdaFunction()
+
+    # Observing
+
+    def observe(self):
+        """What's there now, as a dict; reads only"""
+        iam, lam, api = self.iamClient, self.lambdaClient, self.apiClient
+        role_name = self._execution_role.name
+        function_name = self._function._function_name
+        qualifier = {'Qualifier': self.alias} if self.alias else {}
+
+        def attached_policies():
+            return {p['PolicyArn']
+                    for page in iam.get_paginator('list_attached_role_policies').paginate(
+                        RoleName=role_name)
+                    for p in page['AttachedPolicies']}
+
+        def policy_sids():
+            policy = _or_none(lam.get_policy, FunctionName=function_name, **qualifier)
+            if policy is None:
+                return set()
+            return {s['Sid'] for s in json.loads(policy['Policy']).get('Statement', [])}
+
+        def apis():
+            return [item
+                    for page in api.get_paginator('get_apis').paginate()
+                    for item in page['Items']
+                    if item['Name'] == self.app['name']]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            role = pool.submit(_or_none, iam.get_role, RoleName=role_name)
+            policies = pool.submit(lambda: _or_none(attached_policies))
+            function = pool.submit(_or_none, lam.get_function, FunctionName=function_name)
+            alias = pool.submit(lambda: self.alias and _or_none(
+                lam.get_alias, FunctionName=function_name, Name=self.alias))
+            sids = pool.submit(policy_sids)
+            code_sha256 = pool.submit(self._function.code_sha256, self.code_filename)
+            my_apis = pool.submit(apis)
+
+            observed = {
+                'role': role.result() and role.result()['Role'],
+                'policies': policies.result() or set(),
+                'function': function.result() and function.result()['Configuration'],
+                'alias': alias.result() or None,
+                'sids': sids.result(),
+                'code_sha256': code_sha256.result(),
+                'api': (my_apis.result() or [None])[0],
+            }
+            api_id = observed['api'] and observed['api']['ApiId']
+            if api_id:
+                integrations = pool.submit(api.get_integrations, ApiId=api_id)
+                stage = pool.submit(_or_none, api.get_stage, ApiId=api_id,
+                                    StageName=self.app['gateway_stage_name'])
+                routes = pool.submit(lambda: {
+                    item['RouteKey']: item['RouteId']
+                    for page in api.get_paginator('get_routes').paginate(ApiId=api_id)
+                    for item in page['Items']})
+                items = integrations.result()['Items']
+                observed['integration'] = items[0] if items else None
+                observed['stage'] = stage.result()
+                observed['routes'] = routes.result()
+        self._seed(observed)
+        return observed
+
+    def _seed(self, observed):
+        """Tell AWSBase.state what was seen"""
+        if observed['role']:
+            self.state.put(('role', self._execution_role.name), observed['role']['Arn'])
+        if observed['function']:
+            self.state.put(('function', self._function._function_name),
+                           observed['function']['FunctionArn'])
+        self.state.put(('apis', self.app['name']), [observed['api']] if observed['api'] else [])
+        if observed['api']:
+            api_id = observed['api']['ApiId']
+            integration = observed['integration']
+            self.state.put(('integration', api_id),
+                           integration and integration['IntegrationId'])
+            self.state.put(('routes', api_id), dict(observed['routes']))
+
+    # Planning
+
+    def _configuration(self, role_arn):
+        return {
+            'Runtime': self.app.get('lambda_runtime', 'python3.8'),
+            'Handler': LambdaFunction.HANDLER,
+            'Role': role_arn,
+            'Description': self.app.get('lambda_description', ''),
+            'Timeout': self.timeout,
+            'MemorySize': self.memory_size,
+        }
+
+    def plan(self, observed=None):
+        """The Plan taking what's observed (by default, observed now) to this
+        spec"""
+        if observed is None:
+            observed = self.observe()
+        nodes = {}
+
+        def step(key, label, action, after=()):
+            nodes[key] = Node(key, label, action, [a for a in after if a in nodes])
+
+        role_name, function_name = self._execution_role.name, self._function._function_name
+        if observed['role'] is None:
+            step('role', f"iam -> create role {role_name}", self._create_role)
+        else:
+            wanted = {LambdaExecutionRole.policy_arn(p): p
+                      for p in LambdaExecutionRole.MANAGED_POLICIES}
+            missing = [name for arn, name in wanted.items() if arn not in observed['policies']]
+            if missing:
+                step('role-policies', f"iam -> attach {', '.join(missing)} to {role_name}",
+                     lambda: LambdaExecutionRole().attach_policies(missing))
+
+        function = observed['function']
+        if function is None:
+            step('function', f"lambda -> create {function_name}", self._create_function,
+                 after=['role'])
+        else:
+            wanted = self._configuration(observed['role'] and observed['role']['Arn'])
+            if observed['role'] is None:
+                del wanted['Role']  # known once created; set by the role step
+            changes = {k: v for k, v in wanted.items() if function.get(k) != v}
+            if changes or 'role' in nodes:
+                step('function-config',
+                     f"lambda -> update {function_name} {', '.join(sorted(changes)) or 'Role'}",
+                     lambda: self._update_configuration(changes),
+                     after=['role'])
+            if function.get('CodeSha256') != observed['code_sha256']:
+                step('function-code', f"lambda -> update {function_name} code",
+                     lambda: LambdaFunction().find().update_handler(self.code_filename, force=True),
+                     after=['function-config'])
+
+        # A published version freezes code and configuration alike
+        latest_changed = any(k in nodes for k in ('function', 'function-config', 'function-code'))
+        if self.alias and (observed['alias'] is None or latest_changed):
+            step('alias', f"lambda -> {function_name}:{self.alias} to latest version",
+                 lambda: LambdaFunction().find().publish_alias(self.alias),
+                 after=['function', 'function-config', 'function-code'])
+
+        api = observed['api']
+        if api is None:
+            step('api', f"apigatewayv2 -> create {self.app['name']} with integration and stage",
+                 lambda: GatewayApi().create(), after=['function'])
+            existing_routes = {}
+        else:
+            if observed['integration'] is None:
+                step('integration', f"apigatewayv2 -> create {api['ApiId']} integration",
+                     lambda: GatewayApi().find().create_integration(), after=['function'])
+            if observed['stage'] is None:
+                step('stage', f"apigatewayv2 -> create {api['ApiId']} stage "
+                     f"{self.app['gateway_stage_name']}",
+                     lambda: GatewayApi().find().create_stage(), after=['function'])
+            existing_routes = observed['routes']
+
+        target = self._target_unchanged(observed)
+        if not target:
+            step('target', f"apigatewayv2 -> integration to {function_name}"
+                 f"{':' + self.alias if self.alias else ''}, with invoke permission",
+                 lambda: GatewayApi().use_alias(self.alias),
+                 after=['api', 'integration', 'function', 'alias'])
+
+        for key, (method, path) in sorted(self.routes.items()):
+            if key not in existing_routes:
+                step(('route', key), f"apigatewayv2 -> create route {key}",
+                     lambda method=method, path=path: Route(method, path).create(permit=False),
+                     after=['api', 'integration', 'function'])
+        if self.prune_routes:
+            for key in sorted(set(existing_routes) - set(self.routes)):
+                method, _, path = key.partition(' /')
+                if key != '$default' and route_key(method, path) != key:
+                    logger.warning(f"Route can't address {key!r}; left alone")
+                    continue
+                step(('route-delete', key), f"apigatewayv2 -> delete route {key}",
+                     lambda method=method, path=path: Route(
+                         method if path else None, path or None).destroy(),
+                     after=['function'])
+        return Plan(nodes)
+
+    def _target_unchanged(self, observed):
+        """Whether the integration already invokes the function (or alias),
+        with the permission use_alias() grants"""
+        api, integration, function = observed['api'], observed.get('integration'), observed['function']
+        if not (api and integration and function):
+            return False
+        arn = function['FunctionArn'] + (f":{self.alias}" if self.alias else '')
+        sid = invoke_statement_id(api['ApiId'], self.alias)
+        return integration['IntegrationUri'].endswith(f"/functions/{arn}/invocations") \
+            and sid in observed['sids']
+
+    # Applying
+
+    def _create_role(self):
+        LambdaExecutionRole().create()
+
+    def _create_function(self):
+        role_arn = LambdaExecutionRole().find()._role_arn
+        deadline = time.monotonic() + ROLE_PROPAGATION_SECONDS
+        while True:
+            try:
+                return LambdaFunction().create(role_arn, self.code_filename,
+                                               timeout=self.timeout,
+                                               memory_size=self.memory_size)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'InvalidParameterValueException' \
+                        or time.monotonic() > deadline:
+                    raise
+                time.sleep(2.0)
+
+    def _update_configuration(self, changes):
+        changes = dict(changes)
+        if 'Role' not in changes:
+            changes['Role'] = LambdaExecutionRole().find()._role_arn
+        LambdaFunction().find().update_configuration(**changes)
+
+    @staticmethod
+    def _execute(node):
+        node.action()
+        return 'done'
+
+    def apply(self, plan=None, progress=print):
+        """Run plan (by default, a fresh one). Returns the labels of the steps
+        done; failures are in self.failures, and skip what depends on them."""
+        if plan is None:
+            plan = self.plan()
+        if not plan:
+            progress("No changes")
+            return []
+        outcomes, failures = graph.run(plan.nodes, self._execute, self.max_workers, progress)
+        self.failures.update(failures)
+        return [plan.nodes[key].label for key in outcomes]
@@ -0,0 +1,55 @@
+"""\
+Looked-up resource state shared by every AWSBase object of a configuration.
+
+Lookups like "which function ARN", "which API and integration", "which
+routes" are made once and remembered, so that building a GatewayApi per Route
+and a LambdaFunction per GatewayApi costs nothing after the first. Code that
+creates or destroys a resource updates or invalidates its entry. Entries last
+until then, or with a ttl (seconds) until they're that old; resources changed
+behind our back call for a ttl, or invalidate().
+
+AWSBase.class_configure() starts a new cache; AWSBase.state is the current one.
+"""
+
+import threading, time
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class StateCache:
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._entries = {}  # key tuple -> (value, expiry or None)
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        """The value for key, calling load() for it when there's none fresh.
+        Exceptions from load() aren't cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        value = load()
+        logger.debug(f"{__name__} loaded {key!r}")
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        expiry = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expiry)
+        return value
+
+    def invalidate(self, *key):
+        """Forget key, and every longer key it's a prefix of; no key forgets
+        everything"""
+        with self._lock:
+            for k in [k for k in self._entries if k[:len(key)] == key]:
+                del self._entries[k]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
@@ -0,0 +1,268 @@
+"""\
+Dependency-ordered, concurrent deletion of provisioned resources.
+
+A Teardown collects resources - tagged ARNs from the Resource Groups Tagging
+API, and IAM role names - and expands each into the pieces that have to go
+first: an HTTP API's routes, integrations (after the routes targeting them)
+and stages; a function's resource-policy statements, its own and its
+aliases'; a role's attached and inline policies. Nodes whose prerequisites are
+gone are deleted concurrently, retrying with exponential backoff while AWS
+answers TooManyRequests, throttling or conflict errors (the clients' own
+adaptive retries take the first few throttles). Anything already gone
+counts as deleted, so a teardown can be run again after a partial one.
+
+    td = Teardown(region)
+    td.add_arns(get_gettable_tagged_things_arns(region, tag))
+    td.add_roles(get_tagged_role_names(tag))
+    td.run(dry_run=True)   # print the plan, in waves
+    td.run()               # print progress; returns what was deleted
+"""
+
+import json, random, re, time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from . import clients, graph
+from .graph import Node
+
+import logging
+logger = logging.getLogger(__name__)
+
+RETRY_CODES = {
+    'TooManyRequestsException', 'ThrottlingException', 'Throttling',
+    'ConflictException', 'ResourceConflictException',
+    'ConcurrentModification', 'DeleteConflict',
+}
+GONE_CODES = {'NotFoundException', 'ResourceNotFoundException', 'NoSuchEntity'}
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 0.5  # seconds, doubled each attempt, jittered
+BACKOFF_MAX = 16.0
+
+_ARN_PATTERNS = [
+    ('restapi', re.compile(r'arn:aws:apigateway:[^:]*::/restapis/(?P<id>[^/]+)$')),
+    ('api', re.compile(r'arn:aws:apigateway:[^:]*::/apis/(?P<id>[^/]+)$')),
+    ('stage', re.compile(r'arn:aws:apigateway:[^:]*::/apis/(?P<id>[^/]+)/stages/(?P<name>[^/]+)$')),
+    ('function', re.compile(r'arn:aws:lambda:[^:]*:\d*:function:(?P<name>[^:]+)$')),
+]
+
+
+def _gone(e):
+    return e.response['Error']['Code'] in GONE_CODES
+
+
+class Teardown:
+    def __init__(self, region=None, max_workers=16, role=None):
+        self.region = region
+        self.role = role
+        self.max_workers = max_workers
+        self.nodes = {}
+        self.roots = []  # keys of the nodes for the resources asked for
+        self.failures = {}  # label -> exception
+
+    def _client(self, service):
+        return clients.client(service, None if service == 'iam' else self.region, self.role)
+
+    def _add(self, nodes):
+        for node in nodes:
+            if node.key in self.nodes:
+                self.nodes[node.key].after |= node.after
+            else:
+                self.nodes[node.key] = node
+
+    def _expand(self, expanders):
+        """Run the (function, argument) expanders concurrently, adding the
+        nodes they return. One whose lookups fail is recorded in
+        self.failures, and the other resources go ahead without it."""
+        def expand(function, argument):
+            try:
+                return function(argument)
+            except Exception as e:
+                label = f"lookup of {argument}"
+                logger.error(f"{label} failed: {e}")
+                self.failures[label] = e
+                return []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for nodes in pool.map(lambda fa: expand(*fa), expanders):
+                self._add(nodes)
+        return self
+
+    def add_arns(self, arns):
+        """Tagged resources by ARN: REST and HTTP APIs, HTTP API stages and
+        Lambda functions. Other ARNs are logged and left alone."""
+        expanders = []
+        for arn in arns:
+            for kind, pattern in _ARN_PATTERNS:
+                m = pattern.match(arn)
+                if m:
+                    break
+            else:
+                logger.warning(f"Teardown doesn't know how to delete {arn}")
+                continue
+            if kind == 'restapi':
+                expanders.append((self._restapi_nodes, m.group('id')))
+                self.roots.append(('restapi', m.group('id')))
+            elif kind == 'api':
+                expanders.append((self._api_nodes, m.group('id')))
+                self.roots.append(('api', m.group('id')))
+            elif kind == 'stage':
+                self._add([self._stage_node(m.group('id'), m.group('name'))])
+                self.roots.append(('stage', m.group('id'), m.group('name')))
+            else:
+                expanders.append((self._function_nodes, m.group('name')))
+                self.roots.append(('function', m.group('name')))
+        return self._expand(expanders)
+
+    def add_roles(self, role_names):
+        role_names = list(role_names)
+        self.roots.extend(('role', name) for name in role_names)
+        return self._expand([(self._role_nodes, name) for name in role_names])
+
+    # Expanders: the nodes for one resource, looked up now
+
+    def _restapi_nodes(self, api_id):
+        c = self._client('apigateway')
+        return [Node(('restapi', api_id), f"apigateway -> {api_id}",
+                     lambda: c.delete_rest_api(restApiId=api_id))]
+
+    def _stage_node(self, api_id, stage_name):
+        c = self._client('apigatewayv2')
+        return Node(('stage', api_id, stage_name),
+                    f"apigatewayv2 -> {api_id} stage {stage_name}",
+                    lambda: c.delete_stage(ApiId=api_id, StageName=stage_name))
+
+    def _api_nodes(self, api_id):
+        c = self._client('apigatewayv2')
+
+        def items(operation):
+            try:
+                for page in c.get_paginator(operation).paginate(ApiId=api_id):
+                    yield from page['Items']
+            except ClientError as e:
+                if not _gone(e):
+                    raise
+
+        routes, integrations, stages = [], [], []
+        for route in items('get_routes'):
+            route_id = route['RouteId']
+            routes.append(Node(
+                ('route', api_id, route_id),
+                f"apigatewayv2 -> {api_id} route {route['RouteKey']}",
+                lambda route_id=route_id: c.delete_route(ApiId=api_id, RouteId=route_id)))
+        for integration in items('get_integrations'):
+            integration_id = integration['IntegrationId']
+            integrations.append(Node(
+                ('integration', api_id, integration_id),
+                f"apigatewayv2 -> {api_id} integration {integration_id}",
+                lambda integration_id=integration_id: c.delete_integration(
+                    ApiId=api_id, IntegrationId=integration_id),
+                after=[r.key for r in routes]))
+        for stage in items('get_stages'):
+            stages.append(self._stage_node(api_id, stage['StageName']))
+        api = Node(('api', api_id), f"apigatewayv2 -> {api_id}",
+                   lambda: c.delete_api(ApiId=api_id),
+                   after=[n.key for n in routes + integrations + stages])
+        return routes + integrations + stages + [api]
+
+    def _function_nodes(self, name):
+        c = self._client('lambda')
+        qualifiers = [None]
+        try:
+            for page in c.get_paginator('list_aliases').paginate(FunctionName=name):
+                qualifiers.extend(a['Name'] for a in page['Aliases'])
+        except ClientError as e:
+            if _gone(e):
+                return []
+            raise
+
+        permissions = []
+        for qualifier in qualifiers:
+            kwargs = {'Qualifier': qualifier} if qualifier else {}
+            try:
+                policy = json.loads(c.get_policy(FunctionName=name, **kwargs)['Policy'])
+            except ClientError as e:
+                if _gone(e):
+                    continue  # no policy
+                raise
+            for statement in policy.get('Statement', []):
+                sid = statement['Sid']
+                where = f"{name}:{qualifier}" if qualifier else name
+                permissions.append(Node(
+                    ('permission', name, qualifier, sid),
+                    f"lambda -> {where} permission {sid}",
+                    lambda sid=sid, kwargs=kwargs: c.remove_permission(
+                        FunctionName=name, StatementId=sid, **kwargs)))
+        function = Node(('function', name), f"lambda -> {name}",
+                        lambda: c.delete_function(FunctionName=name),
+                        after=[p.key for p in permissions])
+        return permissions + [function]
+
+    def _role_nodes(self, name):
+        c = self._client('iam')
+        policies = []
+        try:
+            for page in c.get_paginator('list_attached_role_policies').paginate(RoleName=name):
+                for policy in page['AttachedPolicies']:
+                    arn = policy['PolicyArn']
+                    policies.append(Node(
+                        ('role-policy', name, arn),
+                        f"iam -> {name} policy {policy['PolicyName']}",
+                        lambda arn=arn: c.detach_role_policy(RoleName=name, PolicyArn=arn)))
+            for page in c.get_paginator('list_role_policies').paginate(RoleName=name):
+                for policy_name in page['PolicyNames']:
+                    policies.append(Node(
+                        ('inline-policy', name, policy_name),
+                        f"iam -> {name} inline policy {policy_name}",
+                        lambda policy_name=policy_name: c.delete_role_policy(
+                            RoleName=name, PolicyName=policy_name)))
+        except ClientError as e:
+            if _gone(e):
+                return []
+            raise
+        role = Node(('role', name), f"iam -> {name}",
+                    lambda: c.delete_role(RoleName=name),
+                    after=[p.key for p in policies])
+        return policies + [role]
+
+    # Ordering and running
+
+    def waves(self):
+        """Node lists in an order they can be deleted: each wave only after
+        the one before, the nodes within a wave independently"""
+        return graph.waves(self.nodes)
+
+    def plan(self):
+        """The dry-run listing, a line per node under a line per wave"""
+        return graph.plan_lines(self.nodes)
+
+    def _delete(self, node):
+        """'deleted' or 'gone', retrying while throttled or in conflict"""
+        delay = BACKOFF_BASE
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                node.action()
+                return 'deleted'
+            except ClientError as e:
+                if _gone(e):
+                    return 'gone'
+                if e.response['Error']['Code'] not in RETRY_CODES or attempt == MAX_ATTEMPTS:
+                    raise
+                logger.debug(f"{node.label}: {e.response['Error']['Code']}, retry {attempt}")
+                time.sleep(random.uniform(delay / 2, delay))
+                delay = min(delay * 2, BACKOFF_MAX)
+
+    def run(self, dry_run=False, progress=print):
+        """Delete everything, each node as soon as its prerequisites are gone.
+        progress gets a line per node as it finishes (or, dry run, the plan).
+        A node that fails is recorded in self.failures and whatever waits on
+        it is skipped. Returns the labels of nodes deleted, or for a dry run
+        of those that would be."""
+        if dry_run:
+            for line in self.plan():
+                progress(line)
+            return [node.label for wave in self.waves() for node in wave]
+
+        outcomes, failures = graph.run(self.nodes, self._delete, self.max_workers, progress)
+        self.failures.update(failures)
+        clients.registry.log_stats()
+        return [self.nodes[key].label for key, outcome in outcomes.items()
+                if outcome == 'deleted']
@@ -11,35 +11,97 @@ sources:
        - [ ] v1 payload option: wsgi_lambda_handler_APIGatewayv1
        - [ ] v2 payload option: wsgi_lambda_handler_APIGatewayv2
    Or wsgi_lambda_handler_APIGateway to auto-detect between them at small runtime cost.
- - [ ] Lambda@Edge
- - [ ] Elastic Load Balancer
+ - [ ] Lambda@Edge, viewer- or origin-request trigger:
+       wsgi_lambda_handler_LambdaAtEdge. Requests outside
+       WSGI_EDGE_INCLUDE_PREFIXES, or inside WSGI_EDGE_EXCLUDE_PREFIXES, go
+       on to the origin untouched without reaching the app.
+ - [ ] Application Load Balancer, single- or multi-value headers:
+       wsgi_lambda_handler_ALB
+
+factory.make_handler(app, source=...) does the detection and path setup once and
+returns a ready lambda_handler, cheaper per request than any of the above.
+
+wsgi_lambda_handler_batch runs HTTP-shaped SQS or Kinesis records through the
+app, reporting failed records as batchItemFailures; see the batch module.
+
+wsgi_lambda_handler_streaming streams the response instead, for function URLs
+with InvokeMode RESPONSE_STREAM; see the streaming module for how it runs.
+
+WSGI_RESPONSE_CACHE_BYTES turns on a per-container cache of GET/HEAD responses
+the app marks fresh (API Gateway and Lambda@Edge); see the cache module.
+
+Conditional requests (If-None-Match, If-Modified-Since) get bodiless 304s, and
+WSGI_ETAG_MAX_BYTES gives smaller 200s an ETag; see the conditional module.
+
+Keep-warm pings (scheduled events, or WSGI_WARMUP_MARKER) are answered
+without calling the app, and prime(app) or make_handler() run the
+WSGI_WARMUP_REQUESTS through the app during INIT; see the warmup module.
+
+ASGI apps: asgi_lambda_handler_APIGatewayv1, _APIGatewayv2, _APIGateway and
+_LambdaAtEdge (or asgi_lambda_handler to detect), keeping one event loop and
+the app's lifespan across warm invocations; see the asgi module.
 
 """
 
 # LEVEL set at Lambda affects logging outside of request context.
 # LEVEL set at API Gateway (or L@E? ELB?) affects logging during request processing.
+# Logging is configured here, once; submodule loggers inherit the level.
 import logging, os
 logging.basicConfig(datefmt='')
 logger = logging.getLogger(__name__)
 logger.setLevel(int(os.environ.get('LEVEL', logging.DEBUG)))
 
-# Import more symbols than necessary (convenience package imports). Cost of
-# doing so is tiny as they're already loaded.
-from .lambda_edge import (
-    wsgi_lambda_handler_LambdaAtEdge,
-    wsgi_lambda_handler_LambdaAtEdge_viewer,
-    wsgi_lambda_handler_LambdaAtEdge_origin )
-from .apigateway import wsgi_lambda_handler_APIGateway
-from .apigatewayv1 import wsgi_lambda_handler_APIGatewayv1
-from .apigatewayv2 import wsgi_lambda_handler_APIGatewayv2
+# Small, and wsgi_lambda_handler needs it for every event
+from .warmup import is_warmup, warmup_response
+
+# Handlers load on first use (convenience package attributes), so a
+# lambda_function importing one adapter doesn't pay cold-start time for the
+# rest.
+_lazy_handlers = {
+    'wsgi_lambda_handler_LambdaAtEdge': 'lambda_edge',
+    'wsgi_lambda_handler_LambdaAtEdge_viewer': 'lambda_edge',
+    'wsgi_lambda_handler_LambdaAtEdge_origin': 'lambda_edge',
+    'wsgi_lambda_handler_APIGateway': 'apigateway',
+    'wsgi_lambda_handler_APIGatewayv1': 'apigatewayv1',
+    'wsgi_lambda_handler_APIGatewayv2': 'apigatewayv2',
+    'wsgi_lambda_handler_ALB': 'alb',
+    'wsgi_lambda_handler_batch': 'batch',
+    'make_handler': 'factory',
+    'wsgi_lambda_handler_streaming': 'streaming',
+    'prime': 'warmup',
+    'asgi_lambda_handler': 'asgi',
+    'asgi_lambda_handler_APIGateway': 'asgi',
+    'asgi_lambda_handler_APIGatewayv1': 'asgi',
+    'asgi_lambda_handler_APIGatewayv2': 'asgi',
+    'asgi_lambda_handler_LambdaAtEdge': 'asgi',
+}
+
+def __getattr__(name):
+    module_name = _lazy_handlers.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    import importlib
+    value = getattr(importlib.import_module(f'.{module_name}', __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_handlers))
 
 def wsgi_lambda_handler(app_object, event, context):
+    if is_warmup(event):
+        return warmup_response(event)
     r = event.get('Records')
     if r and 'cf' in r[0]:
+        from .lambda_edge import wsgi_lambda_handler_LambdaAtEdge
         return wsgi_lambda_handler_LambdaAtEdge(app_object, event, context)
-    elif event.get('elb'):
-        raise RuntimeError("Elastic Load Balancer not yet supported for WSGI by this module")
+    elif r and r[0].get('eventSource') in ('aws:sqs', 'aws:kinesis'):
+        from .batch import wsgi_lambda_handler_batch
+        return wsgi_lambda_handler_batch(app_object, event, context)
+    elif 'elb' in (event.get('requestContext') or {}):
+        from .alb import wsgi_lambda_handler_ALB
+        return wsgi_lambda_handler_ALB(app_object, event, context)
     elif event.get('version'):
+        from .apigateway import wsgi_lambda_handler_APIGateway
         return wsgi_lambda_handler_APIGateway(app_object, event, context)
     raise RuntimeError("Unrecognized event payload schema")
-
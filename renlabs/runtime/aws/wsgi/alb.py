@@ -0,0 +1,112 @@
+# see __init__.py for note about environ context
+import json
+from .common import Headers, ResponseWrapperMixin, DirectResponse, run_app
+from .apigateway_common import body_from_event, environ_for_APIGateway, log_preview
+from . import metrics
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ResponseMixinALB(ResponseWrapperMixin):
+    """Match Application Load Balancer expectations. With multi-value headers
+    on for the target group every header goes in multiValueHeaders, otherwise
+    in headers, one value apiece. Set multi_value to match the request
+    event."""
+
+    multi_value = False
+
+    def headers_from_wsgi(self):
+        headers = {}
+        for k, v in self.headers.to_wsgi_list():
+            headers.setdefault(k, []).append(v)
+        if self.multi_value:
+            return headers
+        single = {}
+        for k, vv in headers.items():
+            if len(vv) > 1 and k.lower() == 'set-cookie':
+                logger.warning(f'{__name__} dropping all but the last of {len(vv)} '
+                               'Set-Cookie headers; enable multi-value headers '
+                               'on the target group')
+                single[k] = vv[-1]
+            else:
+                single[k] = ', '.join(vv)
+        return single
+
+    def body_from_wsgi(self):
+        return self.encoded_body()
+
+    def response_dict(self, prepared_headers, prepared_body):
+        """Override base supplying an ALB response from WSGI response"""
+        rd = {
+            'statusCode': self.status_code,
+            'statusDescription': self.status,
+            'isBase64Encoded': self.is_base64,
+            'multiValueHeaders' if self.multi_value else 'headers': prepared_headers,
+            'body': prepared_body or '',
+        }
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f'{__name__} response dict: {log_preview(rd)!r}')
+        return rd
+
+
+class DirectResponseALB(ResponseMixinALB, DirectResponse):
+    """ALB response collected by run_app()"""
+
+
+def _query_item(k, v):
+    # "a=" and "a" differ to many frameworks; ALB gives both as "", so
+    # only a missing value makes a bare key
+    return k if v is None else f'{k}={v}'
+
+
+def query_string_from_alb(event):
+    """ALB passes query parameters through still percent-encoded"""
+    mvqsp = event.get('multiValueQueryStringParameters')
+    if mvqsp is not None:
+        return '&'.join(_query_item(k, v) for k, vv in mvqsp.items() for v in vv)
+    qsp = event.get('queryStringParameters') or {}
+    return '&'.join(_query_item(k, v) for k, v in qsp.items())
+
+
+def headers_from_alb(event):
+    h = Headers()
+    mvh = event.get('multiValueHeaders')
+    if mvh is not None:
+        for k, vv in mvh.items():
+            for v in vv:
+                h.add(k.lower(), v)
+    else:
+        for k, v in (event.get('headers') or {}).items():
+            h.add(k.lower(), v)
+    return h
+
+
+def wsgi_lambda_handler_ALB(app_object, event, context):
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f'{__name__} event: {json.dumps(log_preview(event, 200))}')
+    multi_value = 'multiValueHeaders' in event
+    timings = metrics.start('ALB', event['requestContext']['elb'].get('targetGroupArn'))
+
+    query_string = query_string_from_alb(event)
+    headers = headers_from_alb(event)
+    proto = headers.get('x-forwarded-proto', 'https')
+    port = headers.get('x-forwarded-port', '443' if proto == 'https' else '80')
+    base_url = f'{proto}://{headers.get("host", "localhost")}:{port}'
+    timings.lap('headers')
+
+    data = body_from_event(event)
+    timings.size('RequestBytes', len(data) if data else 0)
+    timings.lap('decode')
+
+    environ = environ_for_APIGateway(event['httpMethod'], query_string, headers,
+                                     base_url, event['path'], data)
+    timings.lap('environ')
+    wrapped = run_app(app_object, environ, DirectResponseALB)
+    timings.lap('app')
+    wrapped.multi_value = multi_value
+    wrapped.set_request(event['httpMethod'], headers)
+    response = wrapped.get_response()
+    timings.lap('encode')
+    timings.finish(response)
+    return response
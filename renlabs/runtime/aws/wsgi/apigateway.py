@@ -1,9 +1,9 @@
 # see __init__.py for note about environ context
-import logging, os
-logging.basicConfig(datefmt='', level=int(os.environ.get('LEVEL', logging.DEBUG)))
+import logging
 logger = logging.getLogger(__name__)
 
 from .apigatewayv1 import wsgi_lambda_handler_APIGatewayv1
+from .apigatewayv2 import wsgi_lambda_handler_APIGatewayv2
 
 def wsgi_lambda_handler_APIGateway(app_object, event, context):
     if event.get('version') == '2.0':
@@ -1,35 +1,39 @@
 import json
-import base64
+import binascii
 import os
-import copy
-from werkzeug.test import Client, EnvironBuilder
-from .common import ResponseWrapperBase
+from .common import (
+    ResponseWrapperMixin,
+    DirectResponse,
+    build_environ,
+    run_app)
+from .metrics import NULL_TIMINGS
+from .cache import cached_response, store_response
 
 import logging
 logger = logging.getLogger(__name__)
-logger.setLevel(int(os.environ.get('LEVEL', logging.DEBUG)))
+
+# Run requests through werkzeug's test Client as before, rather than building
+# the environ directly. Slower; kept for comparison and as a fallback.
+COMPAT_CLIENT = bool(os.environ.get('WSGI_COMPAT_CLIENT'))
 
 def set_level_for_apigateway_event(logger, event):
     level = (event.get('stageVariables') or {}).get('LEVEL')
     if level:
-        saveLevel = logger.getLevel()
-        logger.setLevel(level)
+        saveLevel = logger.level
+        logger.setLevel(int(level) if level.isdigit() else level)
     else:
         saveLevel = None
     return saveLevel
 
 
 def restore_level(logger, saveLevel):
-    if saveLevel:
+    if saveLevel is not None:
         logger.setLevel(saveLevel)
 
-class ResponseWrapperAPIGateway(ResponseWrapperBase):
+class ResponseMixinAPIGateway(ResponseWrapperMixin):
     """Match AWS Gateway API expectations. v2 accepts v1 response, so that's what
     we provide here."""
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
     def headers_from_wsgi(self):
         headers1 = {}
         headersN = {}
@@ -45,8 +49,7 @@ class ResponseWrapperAPIGateway(ResponseWrapperBase):
         return (headers1, headersN)
 
     def body_from_wsgi(self):
-        body = base64.b64encode(self.data)
-        return body
+        return self.encoded_body()
 
     def response_dict(self, prepared_headers, prepared_body):
         """Override base supplying APIGateway response from WSGI response"""
@@ -54,19 +57,72 @@ class ResponseWrapperAPIGateway(ResponseWrapperBase):
             'statusCode': self.status_code,
             'headers': prepared_headers[0],
             'multiValueHeaders': prepared_headers[1],
-            'isBase64Encoded': True
+            'isBase64Encoded': self.is_base64
         }
-        d = copy.deepcopy(rd)
         if prepared_body:
             rd['body'] = prepared_body
-            d['body'] = (prepared_body[:20] + b'...'
-                         if len(prepared_body) > 25
-                         else prepared_body)
-        logger.info(f'{__name__} response dict: {d!r}')
-        if prepared_body:
-            logger.debug(f'{__name__} ... Full body: {base64.b64decode(prepared_body)!r}')
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f'{__name__} response dict: {log_preview(rd)!r}')
         return rd
 
+
+class DirectResponseAPIGateway(ResponseMixinAPIGateway, DirectResponse):
+    """APIGateway response collected by run_app()"""
+
+
+# Oops, a difference of opinion: Werkzeug accepts PUT/POST/PATCH without a
+# body and supplies no Content-Length, but wsgidav responds 411 to
+# PUT/POST/PATCH without a Content-Length.
+methods_expecting_body = ['POST', 'PUT', 'PATCH']
+
+
+def truncated(value, limit):
+    """str or bytes cut to about limit, for logging"""
+    if len(value) <= limit:
+        return value
+    return value[:limit - 5] + (b'...' if isinstance(value, bytes) else '...')
+
+
+def log_preview(d, limit=25):
+    """Shallow copy of an event or response dict for logging, its body cut
+    short; the body itself isn't copied"""
+    body = d.get('body')
+    if not isinstance(body, (str, bytes)) or len(body) <= limit:
+        return d
+    return dict(d, body=truncated(body, limit))
+
+
+def body_from_event(event):
+    """Request body from an API Gateway (or function URL) event: bytes, str or
+    None. base64 is decoded straight from the event's str, without an
+    intermediate bytes copy."""
+    data = None
+    body = event.get('body')
+    if body:
+        data = binascii.a2b_base64(body) if event.get('isBase64Encoded') else body
+    if logger.isEnabledFor(logging.DEBUG):
+        if isinstance(data, (bytes, str)):
+            data_present = truncated(data, 200)
+        elif data is None:
+            data_present = None
+        else:
+            data_present = f'(unexpected type {type(data)})'
+        logger.debug(f'{__name__} established body data:{data_present!r}, headers follow...')
+    return data
+
+
+def environ_for_APIGateway(method, query_string, headers, base_url, adjusted_path, data):
+    content_length = None
+    if not data and method in methods_expecting_body:
+        content_length = 0
+        logger.warning(f'Supplying missing content-length:0 for method:{method!r}')
+    environ = build_environ(method, adjusted_path, query_string, headers,
+                            base_url, data, content_length)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f'{__name__} environ: {environ}')
+    return environ
+
+
 def wsgi_lambda_handler_APIGateway_common(app_object,
                                           event,
                                           context,
@@ -74,43 +130,60 @@ def wsgi_lambda_handler_APIGateway_common(app_object,
                                           query_string,
                                           headers,
                                           base_url,
-                                          adjusted_path):
+                                          adjusted_path,
+                                          timings=NULL_TIMINGS):
     saveLevel = set_level_for_apigateway_event(logger, event)
-    logger.debug(f'{__name__} event: {json.dumps(event)}')
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f'{__name__} event: {json.dumps(log_preview(event, 200))}')
 
-    data = None
-    body = event.get('body')
-    if body:
-        data = base64.b64decode(body) if event.get('isBase64Encoded') else body
-    if isinstance(data, bytes):
-        data_present = data if len(data) < 200 else (data[:200] + b'...')
-    elif isinstance(data, str):
-        data_present = data if len(data) < 200 else (data[:200] + '...')
-    elif data is None:
-        data_present = None
-    else:
-        data_present = f'(unexpected type {type(data)})'
-    logger.debug(f'{__name__} established body data:{data_present!r}, headers follow...')
-
-    b = EnvironBuilder(
-        path=adjusted_path,
-        base_url=base_url,
-        headers=headers,
-        data=data,
-        query_string=query_string,
-        method=method)
-
-    # Oops, a difference of opinion: Werkzeug accepts PUT/POST/PATCH without a
-    # body and supplies no Content-Length, but wsgidav responds 411 to
-    # PUT/POST/PATCH without a Content-Length.
-    methods_expecting_body = ['POST', 'PUT', 'PATCH']
-    if (
-            b.headers.get('content-length') is None
-            and method in methods_expecting_body):
-        b.headers['content-length'] = 0
-        logger.warning(f'Supplying missing content-length:0 for method:{method!r}')
+    cache_key, response = cached_response(method, base_url, adjusted_path,
+                                          query_string, headers, timings)
+    if response is not None:
+        timings.lap('cache')
+        timings.finish(response)
+        restore_level(logger, saveLevel)
+        return response
+
+    data = body_from_event(event)
+    timings.size('RequestBytes', len(data) if data else 0)
+    timings.lap('decode')
+
+    if COMPAT_CLIENT:
+        from .compat import Client, EnvironBuilder, ResponseWrapperAPIGateway
+        b = EnvironBuilder(
+            path=adjusted_path,
+            base_url=base_url,
+            headers=headers,
+            data=data,
+            query_string=query_string,
+            method=method)
+        if (
+                b.headers.get('content-length') is None
+                and method in methods_expecting_body):
+            b.headers['content-length'] = 0
+            logger.warning(f'Supplying missing content-length:0 for method:{method!r}')
 
-    logger.debug(f'{__name__} environ: {b.get_environ()}')
-    response = Client(app_object, ResponseWrapperAPIGateway).open(b).get_response()
+        logger.debug(f'{__name__} environ: {b.get_environ()}')
+        timings.lap('environ')
+        wrapped = Client(app_object, ResponseWrapperAPIGateway).open(b)
+    else:
+        environ = environ_for_APIGateway(method, query_string, headers,
+                                         base_url, adjusted_path, data)
+        timings.lap('environ')
+        wrapped = run_app(app_object, environ, DirectResponseAPIGateway)
+    timings.lap('app')
+    wrapped.set_request(method, headers)
+    response = wrapped.get_response()
+    timings.lap('encode')
+    store_response(cache_key, headers, wrapped, response)
+    timings.finish(response)
     restore_level(logger, saveLevel)
     return response
+
+
+def __getattr__(name):
+    # ResponseWrapperAPIGateway needs werkzeug; load it only if asked for.
+    if name == 'ResponseWrapperAPIGateway':
+        from .compat import ResponseWrapperAPIGateway
+        return ResponseWrapperAPIGateway
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1,48 +1,54 @@
 # see __init__.py for note about environ context
-import os
-from werkzeug.datastructures import Headers
+from .common import Headers
 from .apigateway_common import wsgi_lambda_handler_APIGateway_common
+from . import metrics
 
 import logging
-logging.basicConfig(datefmt='')
 logger = logging.getLogger(__name__)
-logger.setLevel(int(os.environ.get('LEVEL', logging.DEBUG)))
+
+def query_string_from_v1(qsp, mvqsp):
+    out = []
+    for k in mvqsp:
+        out.append((k, ','.join(mvqsp[k])))
+    for k in qsp:
+        if k not in mvqsp:
+            out.append((k, qsp[k]))
+    return '&'.join(map(lambda x: '='.join(x) if len(x) > 1 else x[0], out))
+
+
+def werkzeug_headers_from_v1(h1, hN):
+    h = Headers()
+    for k, vv in hN.items():
+        for v in vv:
+            h.add(k.lower(), v)
+    for k, v in h1.items():
+        h.add(k.lower(), v)  # docs unclear; repeating should be okay
+    return h
+
+
+def base_url_and_path_from_v1(event):
+    rctx = event['requestContext']
+    epath = rctx['path']
+    estage = rctx.get('stage')
+    if estage and estage != '$default' and estage == epath[1:len(estage)+1]:
+        maybe_slash_stage = f'/{estage}'
+        adjusted_path = epath[len(estage)+1:]
+    else:
+        maybe_slash_stage = ''
+        adjusted_path = epath
+    return (f'http://{rctx["domainName"]}:443{maybe_slash_stage}',
+            adjusted_path)
+
 
 def wsgi_lambda_handler_APIGatewayv1(app_object, event, context):
-    def qs(qsp, mvqsp):
-        out = []
-        for k in mvqsp:
-            out.append((k, ','.join(mvqsp[k])))
-        for k in qsp:
-            if k not in mvqsp:
-                out.append((k, qsp[k]))
-        return '&'.join(map(lambda x: '='.join(x) if len(x) > 1 else x[0], out))
-    query_string = qs(event.get('queryStringParameters') or {},
-                      event.get('multiValueQueryStringParameters') or {})
-
-    def werkzeug_headers_from_v1(h1, hN):
-        h = Headers()
-        for k, vv in hN.items:
-            for v in vv:
-                h.add(k.lower(), v)
-        for k, v in h1.items():
-            h.add(k.lower(), v)  # docs unclear; repeating should be okay
-        return h
-    wzh = werkzeug_headers_from_v1(event.get('headers'), event.get('multiValueHeaders'))
-
-    def _(event):
-        rctx = event['requestContext']
-        epath = rctx['path']
-        estage = rctx.get('stage')
-        if estage and estage != '$default' and estage == epath[1:len(estage)+1]:
-            maybe_slash_stage = f'/{estage}'
-            adjusted_path = epath[len(estage)+1:]
-        else:
-            maybe_slash_stage = ''
-            adjusted_path = epath
-        return (f'http://{rctx["domainName"]}:443{maybe_slash_stage}',
-                adjusted_path)
-    base_url, adjusted_path  = _(event)
+    timings = metrics.start('APIGatewayv1', event.get('resource'))
+
+    query_string = query_string_from_v1(event.get('queryStringParameters') or {},
+                                        event.get('multiValueQueryStringParameters') or {})
+    wzh = werkzeug_headers_from_v1(event.get('headers') or {},
+                                   event.get('multiValueHeaders') or {})
+    base_url, adjusted_path  = base_url_and_path_from_v1(event)
+    timings.lap('headers')
 
     return wsgi_lambda_handler_APIGateway_common(
         app_object, event, context,
@@ -50,5 +56,5 @@ def wsgi_lambda_handler_APIGatewayv1(app_object, event, context):
         query_string,
         wzh,
         base_url,
-        adjusted_path)
-
+        adjusted_path,
+        timings)
@@ -0,0 +1,292 @@
+"""\
+ASGI counterparts of the API Gateway and Lambda@Edge handlers:
+
+    from renlabs.runtime.aws.wsgi.asgi import asgi_lambda_handler_APIGatewayv2
+    def lambda_handler(event, context):
+        return asgi_lambda_handler_APIGatewayv2(app, event, context)
+
+One asyncio event loop is kept for the life of the container, so tasks,
+connection pools and other loop-bound state survive from one warm invocation
+to the next. The app's lifespan protocol runs once per app per container: the
+first request sends lifespan.startup and waits for it to complete; the
+shutdown message goes out at interpreter exit, best effort. Apps that don't
+speak lifespan are run without it. Anything the app keeps in the lifespan
+state dict appears as scope['state'] in each request.
+
+The request body is delivered in one http.request message; the response is
+collected in full and shaped into the same dicts the WSGI adapters return.
+The raw event and context are in scope['aws.event'] and scope['aws.context'].
+Lambda@Edge requests outside the app's paths (see lambda_edge.app_path) go
+on to the origin without reaching the app, as with the WSGI handler.
+"""
+
+import asyncio
+import atexit
+from urllib.parse import unquote, urlsplit
+from .apigateway_common import (
+    DirectResponseAPIGateway,
+    body_from_event,
+    set_level_for_apigateway_event,
+    restore_level)
+from .apigatewayv1 import (
+    query_string_from_v1,
+    werkzeug_headers_from_v1,
+    base_url_and_path_from_v1)
+from .apigatewayv2 import werkzeug_headers_from_v2, base_url_and_path_from_v2
+from . import lambda_edge
+from .lambda_edge import (
+    DirectResponseLambdaAtEdge,
+    headers_from_cloudfront,
+    divide_base_from_full_path,
+    body_from_cloudfront)
+from . import metrics
+from .warmup import is_warmup, warmup_response
+
+import logging
+logger = logging.getLogger(__name__)
+
+_loop = None
+_lifespans = {}  # id(app) -> Lifespan
+
+
+def event_loop():
+    """The container's event loop, created on first use"""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+
+class Lifespan:
+    """One app's lifespan protocol conversation, kept open between requests"""
+
+    def __init__(self, app_object):
+        self.app_object = app_object
+        self.state = {}
+        self.supported = None
+        self._receive = None
+        self._startup = None
+        self._shutdown = None
+        self._task = None
+
+    async def startup(self):
+        loop = asyncio.get_running_loop()
+        self._receive = asyncio.Queue()
+        self._startup = loop.create_future()
+        self._shutdown = loop.create_future()
+        self._task = loop.create_task(self._main())
+        await self._receive.put({'type': 'lifespan.startup'})
+        self.supported = await self._startup
+        logger.info(f'{__name__} lifespan startup done, supported: {self.supported}')
+
+    async def shutdown(self):
+        if not self.supported or self._task.done():
+            return
+        await self._receive.put({'type': 'lifespan.shutdown'})
+        await self._shutdown
+
+    async def _main(self):
+        scope = {'type': 'lifespan',
+                 'asgi': {'version': '3.0', 'spec_version': '2.0'},
+                 'state': self.state}
+        try:
+            await self.app_object(scope, self._receive.get, self._send)
+        except Exception as e:
+            if self._startup.done():
+                logger.exception(f'{__name__} lifespan failed')
+            else:
+                logger.info(f'{__name__} app has no lifespan support ({e!r})')
+                self._startup.set_result(False)
+        finally:
+            for f in (self._startup, self._shutdown):
+                if not f.done():
+                    f.set_result(False)
+
+    async def _send(self, message):
+        kind = message['type']
+        if kind == 'lifespan.startup.complete':
+            self._startup.set_result(True)
+        elif kind == 'lifespan.startup.failed':
+            self._startup.set_exception(
+                RuntimeError(f'ASGI lifespan startup failed: {message.get("message", "")}'))
+        elif kind == 'lifespan.shutdown.complete':
+            self._shutdown.set_result(True)
+        elif kind == 'lifespan.shutdown.failed':
+            logger.error(f'{__name__} lifespan shutdown failed: {message.get("message", "")}')
+            self._shutdown.set_result(False)
+
+
+def lifespan_for(app_object):
+    """The app's Lifespan, running its startup on first call"""
+    lifespan = _lifespans.get(id(app_object))
+    if lifespan is None:
+        lifespan = Lifespan(app_object)
+        event_loop().run_until_complete(lifespan.startup())
+        _lifespans[id(app_object)] = lifespan
+    return lifespan
+
+
+@atexit.register
+def shutdown():
+    """Send lifespan.shutdown to every started app"""
+    if _loop is None or _loop.is_closed():
+        return
+    for lifespan in list(_lifespans.values()):
+        try:
+            _loop.run_until_complete(asyncio.wait_for(lifespan.shutdown(), 5.0))
+        except Exception:
+            logger.exception(f'{__name__} lifespan shutdown')
+    _lifespans.clear()
+
+
+def scope_for(method, path, query_string, headers, base_url, state, event, context,
+              client=None):
+    """ASGI http scope; arguments as for build_environ()"""
+    url = urlsplit(base_url)
+    host, _, port = url.netloc.partition(':')
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0', 'spec_version': '2.3'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': url.scheme,
+        'path': unquote(path),
+        'raw_path': path.encode('utf-8'),
+        'query_string': query_string.encode('utf-8'),
+        'root_path': url.path.rstrip('/'),
+        'headers': [(k.lower().encode('latin1'), v.encode('latin1'))
+                    for k, v in headers.to_wsgi_list()],
+        'client': client,
+        'server': (host, int(port) if port.isdigit() else (443 if url.scheme == 'https' else 80)),
+        'state': dict(state),
+        'aws.event': event,
+        'aws.context': context,
+    }
+
+
+async def run_asgi_app(app_object, scope, data, response_wrapper):
+    """Call the ASGI app with the whole body, collect the response, and return
+    response_wrapper(body_chunks, status, headers) like run_app()"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    start = {}
+    body = []
+    done = asyncio.Event()
+    request = [{'type': 'http.request', 'body': data or b'', 'more_body': False}]
+
+    async def receive():
+        if request:
+            return request.pop()
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        kind = message['type']
+        if kind == 'http.response.start':
+            start['status'] = message['status']
+            start['headers'] = [(k.decode('latin1'), v.decode('latin1'))
+                                for k, v in message.get('headers', [])]
+        elif kind == 'http.response.body':
+            body.append(message.get('body', b''))
+            if not message.get('more_body'):
+                done.set()
+
+    try:
+        await app_object(scope, receive, send)
+    finally:
+        done.set()
+    if not start:
+        raise RuntimeError('ASGI app finished without starting a response')
+    return response_wrapper(body, str(start['status']), start['headers'])
+
+
+def _handle(app_object, event, context, adapter, route, response_wrapper,
+            method, query_string, headers, base_url, path, data, client):
+    timings = metrics.start(adapter, route)
+    timings.size('RequestBytes', len(data) if data else 0)
+    lifespan = lifespan_for(app_object)
+    scope = scope_for(method, path, query_string, headers, base_url, lifespan.state,
+                      event, context, client)
+    timings.lap('environ')
+    wrapped = event_loop().run_until_complete(
+        run_asgi_app(app_object, scope, data, response_wrapper))
+    timings.lap('app')
+    wrapped.set_request(method, headers)
+    response = wrapped.get_response()
+    timings.lap('encode')
+    timings.finish(response)
+    return response
+
+
+def _APIGateway(app_object, event, context, adapter, route, method, query_string,
+                headers, base_url, adjusted_path, client):
+    saveLevel = set_level_for_apigateway_event(logger, event)
+    try:
+        return _handle(app_object, event, context, adapter, route,
+                       DirectResponseAPIGateway, method, query_string, headers,
+                       base_url, adjusted_path, body_from_event(event), client)
+    finally:
+        restore_level(logger, saveLevel)
+
+
+def asgi_lambda_handler_APIGatewayv2(app_object, event, context):
+    rctx = event['requestContext']
+    base_url, adjusted_path = base_url_and_path_from_v2(event)
+    return _APIGateway(app_object, event, context, 'ASGI-APIGatewayv2', event.get('routeKey'),
+                       rctx['http']['method'],
+                       event['rawQueryString'],
+                       werkzeug_headers_from_v2(event.get('headers') or {}),
+                       base_url, adjusted_path,
+                       (rctx['http'].get('sourceIp'), 0))
+
+
+def asgi_lambda_handler_APIGatewayv1(app_object, event, context):
+    rctx = event['requestContext']
+    base_url, adjusted_path = base_url_and_path_from_v1(event)
+    source_ip = (rctx.get('identity') or {}).get('sourceIp')
+    return _APIGateway(app_object, event, context, 'ASGI-APIGatewayv1', event.get('resource'),
+                       event['httpMethod'],
+                       query_string_from_v1(event.get('queryStringParameters') or {},
+                                            event.get('multiValueQueryStringParameters') or {}),
+                       werkzeug_headers_from_v1(event.get('headers') or {},
+                                                event.get('multiValueHeaders') or {}),
+                       base_url, adjusted_path,
+                       (source_ip, 0) if source_ip else None)
+
+
+def asgi_lambda_handler_APIGateway(app_object, event, context):
+    if event.get('version') == '2.0' or (event.get('version') != '1.0' and 'rawPath' in event):
+        return asgi_lambda_handler_APIGatewayv2(app_object, event, context)
+    return asgi_lambda_handler_APIGatewayv1(app_object, event, context)
+
+
+def asgi_lambda_handler_LambdaAtEdge(app_object, event, context):
+    r = event['Records']
+    if len(r) != 1:
+        raise RuntimeError("Unexpected count of Records in event, not 1")
+    cf = r[0]['cf']
+    if 'response' in cf:
+        raise RuntimeError("ASGI install is only appropriate on ...Request triggers, not ...Response")
+    req = cf['request']
+    if not lambda_edge.app_path(req['uri']):
+        return req
+    headers = headers_from_cloudfront(req['headers'])
+    base_path, path = divide_base_from_full_path(req['uri'])
+    return _handle(app_object, event, context, 'ASGI-LambdaAtEdge',
+                   cf.get('config', {}).get('eventType'),
+                   DirectResponseLambdaAtEdge,
+                   req['method'], req.get('querystring') or '', headers,
+                   f'http://{headers["host"]}{base_path}', path, body_from_cloudfront(req),
+                   (req['clientIp'], 0) if req.get('clientIp') else None)
+
+
+def asgi_lambda_handler(app_object, event, context):
+    if is_warmup(event):
+        return warmup_response(event)
+    r = event.get('Records')
+    if r and 'cf' in r[0]:
+        return asgi_lambda_handler_LambdaAtEdge(app_object, event, context)
+    elif event.get('version') or 'httpMethod' in event:
+        return asgi_lambda_handler_APIGateway(app_object, event, context)
+    raise RuntimeError("Unrecognized event payload schema")
@@ -0,0 +1,129 @@
+"""\
+Run a WSGI app over a batch of HTTP-shaped SQS or Kinesis records.
+
+Each record carries one request as JSON (the SQS message body, or the Kinesis
+record data):
+
+    {"method": "POST", "path": "/ingest", "queryString": "a=1",
+     "headers": {"content-type": "application/json"},
+     "body": "...", "isBase64Encoded": false}
+
+Only method and path are required. Records run through the app on a bounded
+thread pool (WSGI_BATCH_WORKERS, default 4, kept across warm invocations),
+but in order where the source promises it: one after another within an SQS
+FIFO message group, or a Kinesis shard. Records whose requests fail or get
+non-2xx responses come back in batchItemFailures, so with
+ReportBatchItemFailures enabled on the event source mapping only those are
+retried; in a group or shard, so is everything after the first failure, which
+isn't run. A record without a message id or sequence number fails the whole
+invocation, for Lambda to retry the batch.
+"""
+
+import base64
+import json
+import os
+from .common import Headers, DirectResponse, run_app
+from .apigateway_common import body_from_event, environ_for_APIGateway
+
+import logging
+logger = logging.getLogger(__name__)
+
+BATCH_WORKERS = int(os.environ.get('WSGI_BATCH_WORKERS') or 4)
+
+_executor = None
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS)
+    return _executor
+
+
+def request_from_record(record):
+    """(item identifier, request dict) for an SQS or Kinesis record"""
+    if record.get('eventSource') == 'aws:kinesis':
+        kinesis = record['kinesis']
+        return (kinesis['sequenceNumber'],
+                json.loads(base64.b64decode(kinesis['data'])))
+    return record['messageId'], json.loads(record['body'])
+
+
+def status_for_request(app_object, request):
+    headers = Headers()
+    for k, v in (request.get('headers') or {}).items():
+        headers.add(k.lower(), v)
+    environ = environ_for_APIGateway(
+        request['method'].upper(),
+        request.get('queryString', ''),
+        headers,
+        f'http://{headers.get("host", "localhost")}',
+        request['path'],
+        body_from_event(request))
+    environ['wsgi.multithread'] = True
+    response = run_app(app_object, environ, DirectResponse)
+    logger.debug(f'{__name__} {request["method"]} {request["path"]}: {response.status}')
+    return response.status_code
+
+
+def item_identifier(record):
+    """The id batchItemFailures reports record by"""
+    if record.get('eventSource') == 'aws:kinesis':
+        item_id = (record.get('kinesis') or {}).get('sequenceNumber')
+    else:
+        item_id = record.get('messageId')
+    if not item_id:
+        raise RuntimeError(f'{__name__} record without an identifier; failing the batch')
+    return item_id
+
+
+def ordering_key(record):
+    """What record must run in order within: its FIFO message group or
+    Kinesis shard, else None"""
+    if record.get('eventSource') == 'aws:kinesis':
+        return 'shard', record.get('eventID', '').split(':', 1)[0]
+    group = (record.get('attributes') or {}).get('MessageGroupId')
+    return ('group', group) if group else None
+
+
+def _run_record(app_object, record):
+    """(item identifier, whether the request succeeded)"""
+    item_id = item_identifier(record)
+    try:
+        item_id, request = request_from_record(record)
+    except (KeyError, ValueError) as e:
+        logger.error(f'{__name__} unreadable record {item_id}: {e!r}')
+        return item_id, False
+    try:
+        status = status_for_request(app_object, request)
+    except Exception:
+        logger.exception(f'{__name__} record {item_id} failed')
+        return item_id, False
+    return item_id, 200 <= status < 300
+
+
+def _run_lane(app_object, records):
+    """Item identifiers of the records that failed, running them in order
+    and, after the first failure, not at all"""
+    for n, record in enumerate(records):
+        item_id, ok = _run_record(app_object, record)
+        if not ok:
+            return [item_id] + [item_identifier(r) for r in records[n + 1:]]
+    return []
+
+
+def wsgi_lambda_handler_batch(app_object, event, context):
+    records = event['Records']
+    ids = [item_identifier(r) for r in records]  # before running any
+    lanes = {}
+    for n, record in enumerate(records):
+        lanes.setdefault(ordering_key(record) or n, []).append(record)
+    failed = set()
+    for lane_failures in _pool().map(lambda lane: _run_lane(app_object, lane),
+                                     lanes.values()):
+        failed.update(lane_failures)
+    failures = [{'itemIdentifier': item_id} for item_id in ids if item_id in failed]
+    logger.info(f'{__name__} {len(records)} records in {len(lanes)} lanes, '
+                f'{len(failures)} failed')
+    return {'batchItemFailures': failures}
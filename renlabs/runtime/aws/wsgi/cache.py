@@ -0,0 +1,183 @@
+"""\
+Opt-in cache of finished response dicts, kept in the container between warm
+invocations. Set WSGI_RESPONSE_CACHE_BYTES to the most body and header bytes
+to hold; unset or 0 leaves it off.
+
+Only GET and HEAD are cached, and only responses the app marks fresh with
+Cache-Control max-age (or s-maxage) > 0. Nothing is stored for no-store,
+no-cache or private responses, responses setting cookies, Vary: *, or (unless
+public) requests carrying Authorization. The cache is shared by every caller
+of the container, like a proxy's.
+
+Entries are keyed on method, base URL, path and the query string with its
+parameters sorted, plus the values of the request headers the response names
+in Vary (Accept-Encoding included, when the body was compressible). A hit
+returns the stored dict without building an environ or calling the app. Least
+recently used entries go first when the byte bound is reached.
+
+A stored 200 with an ETag or Last-Modified also keeps its 304 form, which a
+hit answers instead when the request's If-None-Match or If-Modified-Since
+says the client has it already (see conditional). Responses otherwise go out
+as stored; no Age header is added.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+
+from .conditional import client_has
+
+import logging
+logger = logging.getLogger(__name__)
+
+CACHE_BYTES = int(os.environ.get('WSGI_RESPONSE_CACHE_BYTES') or 0)
+
+CACHEABLE_METHODS = ('GET', 'HEAD')
+# RFC 7231 6.1, cacheable by default given explicit freshness
+CACHEABLE_STATUS = {200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501}
+
+
+def cache_control(value):
+    """{directive: argument or True} from a Cache-Control header value"""
+    directives = {}
+    for item in (value or '').split(','):
+        name, _, arg = item.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else True
+    return directives
+
+
+def _seconds(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class ResponseCache:
+    """LRU of response dicts bounded by total bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = self.misses = self.stores = self.evictions = 0
+        # (key, vary values) -> (expires, size, response, validators)
+        self._entries = OrderedDict()
+        self._vary = {}  # key -> [vary header names, count of entries]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(method, base_url, path, query_string):
+        return (method, base_url, path,
+                tuple(sorted(parse_qsl(query_string, keep_blank_values=True))))
+
+    def lookup(self, key, request_headers):
+        """A copy of the cached response dict for the request - its 304 form
+        if the request's validators match - or None"""
+        if 'no-cache' in cache_control(request_headers.get('cache-control')):
+            self.misses += 1
+            return None
+        with self._lock:
+            vary = self._vary.get(key)
+            entry = None
+            if vary is not None:
+                full_key = (key, tuple(request_headers.get(h) for h in vary[0]))
+                entry = self._entries.get(full_key)
+                if entry is not None and entry[0] <= time.monotonic():
+                    self._remove(full_key)
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(full_key)
+            self.hits += 1
+        _, _, response, validators = entry
+        if validators is not None and client_has(request_headers, *validators[:2]):
+            return dict(validators[2])
+        return dict(response)
+
+    def store(self, key, request_headers, wrapped, response):
+        """Keep response, the dict made from wrapped (the response wrapper),
+        if it's cacheable"""
+        headers = wrapped.headers
+        if wrapped.status_code not in CACHEABLE_STATUS or 'Set-Cookie' in headers:
+            return
+        cc = cache_control(headers.get('Cache-Control'))
+        if 'no-store' in cc or 'no-cache' in cc or 'private' in cc:
+            return
+        if request_headers.get('authorization') and not ('public' in cc or 's-maxage' in cc):
+            return
+        max_age = _seconds(cc.get('s-maxage', cc.get('max-age')))
+        if max_age <= 0:
+            return
+        vary = tuple(sorted({v.strip().lower()
+                             for v in (headers.get('Vary') or '').split(',') if v.strip()}))
+        if '*' in vary:
+            return
+        size = (len(response.get('body') or '')
+                + sum(len(k) + len(v) for k, v in headers.to_wsgi_list()))
+        if size > self.max_bytes:
+            return
+        etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+        validators = None
+        if wrapped.status_code == 200 and (etag or last_modified):
+            validators = (etag, last_modified, wrapped.not_modified_response())
+
+        full_key = (key, tuple(request_headers.get(h) for h in vary))
+        with self._lock:
+            if full_key in self._entries:
+                self._remove(full_key)
+            known = self._vary.get(key)
+            if known is not None and known[0] != vary:
+                # The app changed its Vary; older variants can't be found now
+                for stale in [k for k in self._entries if k[0] == key]:
+                    self._remove(stale)
+                known = None
+            if known is None:
+                known = self._vary[key] = [vary, 0]
+            known[1] += 1
+            self._entries[full_key] = (time.monotonic() + max_age, size, response, validators)
+            self.bytes += size
+            self.stores += 1
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, full_key):
+        size = self._entries.pop(full_key)[1]
+        self.bytes -= size
+        known = self._vary.get(full_key[0])
+        if known is not None:
+            known[1] -= 1
+            if known[1] <= 0:
+                del self._vary[full_key[0]]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores,
+                'evictions': self.evictions, 'entries': len(self._entries),
+                'bytes': self.bytes}
+
+
+RESPONSE_CACHE = ResponseCache(CACHE_BYTES) if CACHE_BYTES > 0 else None
+
+
+def cached_response(method, base_url, path, query_string, headers, timings):
+    """(key, cached response dict or None) for a request; key is None if the
+    request can't be cached, else pass it to store_response() after a miss"""
+    cache = RESPONSE_CACHE
+    if cache is None or method not in CACHEABLE_METHODS:
+        return None, None
+    key = cache.key(method, base_url, path, query_string)
+    response = cache.lookup(key, headers)
+    timings.count('CacheHit', response is not None)
+    if logger.isEnabledFor(logging.DEBUG):
+        outcome = 'hit' if response is not None else 'miss'
+        logger.debug(f'{__name__} {outcome} {method} {path}: {cache.stats()}')
+    return key, response
+
+
+def store_response(key, headers, wrapped, response):
+    if key is not None and RESPONSE_CACHE is not None:
+        RESPONSE_CACHE.store(key, headers, wrapped, response)
@@ -1,8 +1,98 @@
-from werkzeug.wrappers import BaseResponse
+import sys
+from urllib.parse import unquote, quote, urlsplit
+from .encoding import encode_body
+from .conditional import (
+    ETAG_MAX_BYTES,
+    CONDITIONAL_METHODS,
+    etag_for,
+    with_coding,
+    matching_etag,
+    not_modified_since,
+    not_modified_headers)
 
-class ResponseWrapperBase(BaseResponse):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+
+class Headers:
+    """The slice of werkzeug.datastructures.Headers the adapters use: an
+    ordered list of (key, value) pairs, keys matched case-insensitively.
+    Importing werkzeug at all loads its test client and dev server, which is
+    most of a cold start, so the fast path does without."""
+
+    def __init__(self, defaults=None):
+        self._list = []
+        if defaults:
+            for key, value in defaults:
+                self.add(key, value)
+
+    def add(self, key, value):
+        self._list.append((key, str(value)))
+
+    def get(self, key, default=None):
+        ikey = key.lower()
+        for k, v in self._list:
+            if k.lower() == ikey:
+                return v
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        """Replace the first key in place, dropping any later ones"""
+        ikey = key.lower()
+        out = []
+        replaced = False
+        for item in self._list:
+            if item[0].lower() == ikey:
+                if not replaced:
+                    out.append((item[0], str(value)))
+                    replaced = True
+            else:
+                out.append(item)
+        if not replaced:
+            out.append((key, str(value)))
+        self._list = out
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __iter__(self):
+        return iter(self._list)
+
+    def __len__(self):
+        return len(self._list)
+
+    def items(self):
+        return list(self._list)
+
+    def to_wsgi_list(self):
+        return list(self._list)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self._list!r})'
+
+
+class ResponseWrapperMixin:
+    """Shape a finished WSGI response into the dict a Lambda trigger
+    expects. Classes mixing this in supply status_code, headers (Headers
+    here, or werkzeug's) and data (the full body as bytes).
+
+    Call set_request() with the request's method and headers to allow
+    compression and conditional (304) responses; encoded_body() leaves
+    is_base64 saying how the body went out."""
+
+    accept_encoding = None
+    request_method = None
+    request_headers = None
+    is_base64 = True
+    _generated_etag = None
+
+    def set_request(self, method, headers):
+        self.request_method = method
+        self.request_headers = headers
+        self.accept_encoding = headers.get('accept-encoding')
 
     def headers_from_wsgi(self):
         raise RuntimeError("To be overridden in subclass")
@@ -13,9 +103,238 @@ class ResponseWrapperBase(BaseResponse):
     def response_dict(self, prepared_headers, prepared_body):
         raise RuntimeError("To be overridden in subclass")
 
+    def body_chunks(self):
+        """The body as a list of bytes, which encoded_body() may empty"""
+        return [self.data]
+
+    def encoded_body(self):
+        """Body as str, plain or base64; may add Content-Encoding etc. to
+        self.headers, so call before reading them. Call once: the body
+        chunks are consumed."""
+        body, self.is_base64 = encode_body(
+            self.body_chunks(), self.status_code, self.headers, self.accept_encoding)
+        coding = self.headers.get('Content-Encoding')
+        if self._generated_etag and coding:
+            self.headers['ETag'] = with_coding(self._generated_etag, coding)
+        return body
+
+    def not_modified(self):
+        """Give a 200 to GET an ETag if configured (see conditional), then
+        turn it into a bodiless 304 if the request's conditional headers say
+        the client has it already. True if so. HEAD gets no generated ETag:
+        its empty body would hash to a different tag than GET's."""
+        if self.request_method not in CONDITIONAL_METHODS or self.status_code != 200:
+            return False
+        headers = self.headers
+        etag = headers.get('ETag')
+        if (
+                etag is None
+                and ETAG_MAX_BYTES > 0
+                and self.request_method == 'GET'
+                and 'no-store' not in headers.get('Cache-Control', '')):
+            chunks = self.body_chunks()
+            if sum(map(len, chunks)) <= ETAG_MAX_BYTES:
+                etag = self._generated_etag = etag_for(chunks)
+                headers['ETag'] = etag
+
+        if_none_match = self.request_headers.get('if-none-match')
+        if if_none_match is not None:
+            etag = matching_etag(if_none_match, etag)
+            if etag is None:
+                return False
+        elif not not_modified_since(self.request_headers.get('if-modified-since'),
+                                    headers.get('Last-Modified')):
+            return False
+        self._become_not_modified(etag)
+        return True
+
+    def _become_not_modified(self, etag):
+        self.headers = type(self.headers)(not_modified_headers(self.headers, etag))
+        self.status_code = 304
+        self.status = '304 Not Modified'
+        self.is_base64 = False
+
+    def not_modified_response(self):
+        """The bodiless 304 response dict standing for this 200, once
+        get_response() has made it: what a cached copy answers a matching
+        conditional request with. Leaves this response as it was."""
+        saved = self.headers, self.status_code, self.status, self.is_base64
+        try:
+            self._become_not_modified(self.headers.get('ETag'))
+            return self.response_dict(prepared_headers=self.headers_from_wsgi(),
+                                      prepared_body='')
+        finally:
+            self.headers, self.status_code, self.status, self.is_base64 = saved
+
     def get_response(self):
+        if self.not_modified():
+            prepared_body = ''
+        else:
+            prepared_body = self.body_from_wsgi()
         response_dict = self.response_dict(
             prepared_headers=self.headers_from_wsgi(),
-            prepared_body=self.body_from_wsgi())
+            prepared_body=prepared_body)
         return response_dict
 
+
+class DirectResponse(ResponseWrapperMixin):
+    """Just enough of BaseResponse to feed ResponseWrapperMixin, built
+    straight from what run_app() collects. Constructor signature matches
+    BaseResponse's (app_iter, status, headers)."""
+
+    def __init__(self, response, status, headers):
+        self.response = response
+        self.status = status
+        self.status_code = int(status.split(None, 1)[0])
+        self.headers = Headers(headers)
+
+    @property
+    def data(self):
+        return b''.join(self.response)
+
+    def body_chunks(self):
+        return self.response
+
+
+class InputStream:
+    """Read-only wsgi.input over the request body (bytes or bytearray),
+    without copying it: reading the whole body at once returns
+    the bytes object itself, and other reads copy only what they return."""
+
+    def __init__(self, data=b''):
+        self._data = data
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def _take(self, end):
+        start, self._pos = self._pos, end
+        if start == 0 and end == len(self._view) and isinstance(self._data, bytes):
+            return self._data
+        return self._view[start:end].tobytes()
+
+    def read(self, size=-1):
+        end = len(self._view)
+        if size is not None and size >= 0:
+            end = min(end, self._pos + size)
+        return self._take(end)
+
+    def readline(self, size=-1):
+        end = len(self._view)
+        if size is not None and size >= 0:
+            end = min(end, self._pos + size)
+        newline = self._data.find(b'\n', self._pos, end)
+        return self._take(end if newline < 0 else newline + 1)
+
+    def readlines(self, hint=-1):
+        lines = []
+        total = 0
+        for line in self:
+            lines.append(line)
+            total += len(line)
+            if 0 < hint <= total:
+                break
+        return lines
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def close(self):
+        pass
+
+
+def _path_encode(path):
+    """werkzeug's url_unquote + wsgi_encoding_dance: PEP 3333 latin-1 str"""
+    return unquote(path).encode('utf-8').decode('latin1')
+
+
+def build_environ(method, path, query_string, headers, base_url, data=None,
+                  content_length=None):
+    """Build a WSGI environ dict equivalent to what
+    werkzeug.test.EnvironBuilder(...).get_environ() produces for these
+    arguments, without the builder. headers is a Headers object; data
+    is bytes, bytearray, str or None, and wsgi.input reads it in place.
+    As with EnvironBuilder, any Content-Length in headers is ignored:
+    it's taken from data, or else from content_length.
+
+    One deliberate difference: werkzeug's test Client then drops HTTP_COOKIE
+    (its empty cookie jar replaces it); here the request's Cookie header is
+    kept."""
+    url = urlsplit(base_url)
+    host = url.netloc
+    pieces = host.split(':', 1)
+    if len(pieces) == 2 and pieces[1].isdigit():
+        server_port = pieces[1]
+    else:
+        server_port = '443' if url.scheme == 'https' else '80'
+    request_uri = quote(path, safe="/:~+%!$&'()*,;=@").encode('utf-8').decode('latin1')
+
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    elif data is None:
+        data = b''
+
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': _path_encode(url.path.rstrip('/')),
+        'PATH_INFO': _path_encode(path),
+        'QUERY_STRING': query_string.encode('utf-8').decode('latin1'),
+        'REQUEST_URI': request_uri,
+        'RAW_URI': request_uri,
+        'SERVER_NAME': pieces[0],
+        'SERVER_PORT': server_port,
+        'HTTP_HOST': host,
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': url.scheme,
+        'wsgi.input': InputStream(data),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+    content_type = headers.get('content-type')
+    if data:
+        content_length = len(data)
+    elif content_type is not None and content_type.split(';', 1)[0].strip().lower() \
+            == 'application/x-www-form-urlencoded':
+        content_length = 0  # EnvironBuilder encodes its (empty) form
+
+    if content_type is not None:
+        environ['CONTENT_TYPE'] = content_type
+    if content_length is not None:
+        environ['CONTENT_LENGTH'] = str(content_length)
+
+    for key, value in headers.to_wsgi_list():
+        if key.lower() != 'content-length':
+            environ['HTTP_' + key.upper().replace('-', '_')] = value
+    if content_length is not None:
+        environ['HTTP_CONTENT_LENGTH'] = str(content_length)
+
+    return environ
+
+
+def run_app(app_object, environ, response_wrapper):
+    """Call the WSGI app with our own start_response, collect its body, and
+    return response_wrapper(body_chunks, status, headers)."""
+    response = []
+    body = []
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info is not None:
+            raise exc_info[1].with_traceback(exc_info[2])
+        response[:] = [status, headers]
+        return body.append  # legacy write() callable
+
+    app_rv = app_object(environ, start_response)
+    try:
+        body.extend(app_rv)
+    finally:
+        close = getattr(app_rv, 'close', None)
+        if close is not None:
+            close()
+    return response_wrapper(body, response[0], response[1])
@@ -0,0 +1,29 @@
+"""\
+werkzeug test-Client machinery for compatibility mode (WSGI_COMPAT_CLIENT).
+Importing werkzeug is a large share of a cold start, so the adapters only load
+this module when they need it.
+"""
+
+from werkzeug.test import Client, EnvironBuilder
+from werkzeug.wrappers import BaseResponse
+from .common import ResponseWrapperMixin
+from .apigateway_common import ResponseMixinAPIGateway
+from .lambda_edge import ResponseMixinLambdaAtEdge
+
+
+class ResponseWrapperBase(ResponseWrapperMixin, BaseResponse):
+    """Response wrapper for werkzeug's test Client (compatibility mode)"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+
+class ResponseWrapperAPIGateway(ResponseMixinAPIGateway, ResponseWrapperBase):
+    """APIGateway response via werkzeug's test Client (compatibility mode)"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+
+class ResponseWrapperLambdaAtEdge(ResponseMixinLambdaAtEdge, ResponseWrapperBase):
+    """Lambda@Edge response via werkzeug's test Client (compatibility mode)"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
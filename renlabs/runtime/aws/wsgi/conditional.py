@@ -0,0 +1,97 @@
+"""\
+ETags and 304 Not Modified for the response wrappers.
+
+With WSGI_ETAG_MAX_BYTES set, a 200 response to GET without an ETag, not
+marked no-store, and with a body no bigger than that gets a strong ETag from a
+hash of its body. HEAD responses don't: hashing their empty body would give
+the resource a different tag than GET does. Compressed bodies get the coding appended
+("...-gzip"), so each representation has its own tag. Unset or 0 leaves
+ETags to the app.
+
+Either way, when the request's If-None-Match matches the response's ETag (or,
+without If-None-Match, If-Modified-Since is no earlier than its
+Last-Modified), the response becomes a bodiless 304 and the body is never
+encoded. The response cache answers the same way from what it stored.
+Streamed responses don't pass through here.
+"""
+
+import os
+
+ETAG_MAX_BYTES = int(os.environ.get('WSGI_ETAG_MAX_BYTES') or 0)
+
+CONDITIONAL_METHODS = ('GET', 'HEAD')
+_CODING_SUFFIXES = ('-gzip', '-br')
+# RFC 7232 4.1: what a 304 carries over from the 200 it stands for
+_NOT_MODIFIED_HEADERS = {'cache-control', 'content-location', 'date', 'etag',
+                         'expires', 'vary', 'last-modified'}
+
+
+def etag_for(chunks):
+    """Strong ETag for a body given as a list of bytes chunks"""
+    import hashlib
+    h = hashlib.blake2b(digest_size=16)
+    for chunk in chunks:
+        h.update(chunk)
+    return f'"{h.hexdigest()}"'
+
+
+def with_coding(etag, coding):
+    return f'{etag[:-1]}-{coding}"' if coding else etag
+
+
+def _opaque(tag):
+    """Bare tag from an entity-tag, weak or strong, minus any coding suffix"""
+    tag = tag.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    for suffix in _CODING_SUFFIXES:
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)]
+    return tag
+
+
+def matching_etag(if_none_match, etag):
+    """The ETag for a 304 if an If-None-Match entry matches etag (weak
+    comparison), else None. That's the entry as sent, so it keeps any coding
+    suffix, but strong if etag is."""
+    if not if_none_match or not etag:
+        return None
+    if if_none_match.strip() == '*':
+        return etag
+    wanted = _opaque(etag)
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag and _opaque(tag) == wanted:
+            if tag.startswith('W/') and not etag.startswith('W/'):
+                tag = tag[2:]
+            return tag
+    return None
+
+
+def not_modified_since(if_modified_since, last_modified):
+    if not if_modified_since or not last_modified:
+        return False
+    from email.utils import parsedate_to_datetime
+    try:
+        return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+
+def client_has(request_headers, etag, last_modified):
+    """Whether the request's If-None-Match matches etag or, without
+    If-None-Match, its If-Modified-Since is no earlier than last_modified"""
+    if_none_match = request_headers.get('if-none-match')
+    if if_none_match is not None:
+        return matching_etag(if_none_match, etag) is not None
+    return not_modified_since(request_headers.get('if-modified-since'), last_modified)
+
+
+def not_modified_headers(headers, etag=None):
+    """The (key, value) list a 304 keeps from a 200's headers"""
+    kept = [(k, v) for k, v in headers.to_wsgi_list()
+            if k.lower() in _NOT_MODIFIED_HEADERS and k.lower() != 'etag']
+    if etag:
+        kept.append(('ETag', etag))
+    return kept
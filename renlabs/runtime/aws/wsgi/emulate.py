@@ -0,0 +1,430 @@
+"""\
+Local HTTP front end for a lambda_handler, for load testing without AWS.
+
+    python -m renlabs.runtime.aws.wsgi.emulate lambda_function:lambda_handler \\
+        --source apigw-v2 --port 8000 --concurrency 10
+
+Each HTTP request becomes an API Gateway v1/v2, ALB or Lambda@Edge
+(origin-request) event, runs through the handler, and the returned dict goes
+back out as the HTTP response. Point any HTTP load generator at the port.
+
+Handlers run in a pool of "containers": separate, single-threaded processes,
+each handling one event at a time, started on demand (cold start: a fresh
+interpreter imports the handler module) up to --concurrency, then reused
+warm. Containers idle past --idle-timeout are retired, so later requests
+start cold again. With --throttle a request finding every container busy gets
+429 instead of waiting, as Lambda would when reserved concurrency is used up.
+
+Throughput, latency percentiles and cold-start counts are printed every
+--report-every seconds and on exit, and served as JSON from /__emulator/stats.
+"""
+
+import argparse
+import base64
+import json
+import multiprocessing
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+import logging
+logger = logging.getLogger(__name__)
+
+STATS_PATH = '/__emulator/stats'
+_TEXTUAL = ('text/', 'application/json', 'application/xml',
+            'application/javascript', 'application/x-www-form-urlencoded')
+
+
+def _container_main(connection, handler_spec, sys_path):
+    """Body of one container process: import the handler, then serve events"""
+    sys.path[:0] = sys_path
+    import importlib
+    module_name, _, attr = handler_spec.partition(':')
+    started = time.perf_counter()
+    handler = getattr(importlib.import_module(module_name), attr or 'lambda_handler')
+    init_ms = (time.perf_counter() - started) * 1000.0
+    while True:
+        event = connection.recv()
+        if event is None:
+            return
+        started = time.perf_counter()
+        try:
+            response, error = handler(event, None), None
+        except Exception as e:
+            logger.exception('handler failed')
+            response, error = None, f'{type(e).__name__}: {e}'
+        connection.send((response, error, init_ms, (time.perf_counter() - started) * 1000.0))
+        init_ms = None
+
+
+class Container:
+    _context = multiprocessing.get_context('spawn')
+
+    def __init__(self, handler_spec):
+        self.connection, child = self._context.Pipe()
+        self.process = self._context.Process(
+            target=_container_main, args=(child, handler_spec, list(sys.path)), daemon=True)
+        self.process.start()
+        self.last_used = time.monotonic()
+
+    def invoke(self, event):
+        self.connection.send(event)
+        result = self.connection.recv()
+        self.last_used = time.monotonic()
+        return result
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class ContainerPool:
+    def __init__(self, handler_spec, concurrency, idle_timeout, throttle):
+        self._handler_spec = handler_spec
+        self._concurrency = concurrency
+        self._idle_timeout = idle_timeout
+        self._throttle = throttle
+        self._idle = []
+        self._count = 0
+        self._lock = threading.Condition()
+
+    def acquire(self):
+        """An idle container, a new one, or None if throttled"""
+        with self._lock:
+            while True:
+                self._retire_idle()
+                if self._idle:
+                    return self._idle.pop()
+                if self._count < self._concurrency:
+                    self._count += 1
+                    break
+                if self._throttle:
+                    return None
+                self._lock.wait()
+        try:
+            return Container(self._handler_spec)
+        except BaseException:
+            # Give the slot back, or it's lost for good
+            with self._lock:
+                self._count -= 1
+                self._lock.notify()
+            raise
+
+    def release(self, container, healthy=True):
+        with self._lock:
+            if healthy:
+                self._idle.append(container)
+            else:
+                self._count -= 1
+                container.stop()
+            self._lock.notify()
+
+    def _retire_idle(self):
+        if self._idle_timeout is None:
+            return
+        cutoff = time.monotonic() - self._idle_timeout
+        for c in [c for c in self._idle if c.last_used < cutoff]:
+            self._idle.remove(c)
+            self._count -= 1
+            c.stop()
+
+    def close(self):
+        with self._lock:
+            for c in self._idle:
+                c.stop()
+            self._idle = []
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._latencies = []
+        self._handler_ms = []
+        self._init_ms = []
+        self._throttled = 0
+        self._errors = 0
+
+    def record(self, latency_ms, handler_ms=None, init_ms=None, error=False, throttled=False):
+        with self._lock:
+            self._latencies.append(latency_ms)
+            if handler_ms is not None:
+                self._handler_ms.append(handler_ms)
+            if init_ms is not None:
+                self._init_ms.append(init_ms)
+            self._errors += bool(error)
+            self._throttled += bool(throttled)
+
+    def summary(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._started
+            latencies = sorted(self._latencies)
+            handler_ms = sorted(self._handler_ms)
+
+            def pct(values, p):
+                if not values:
+                    return None
+                return round(values[min(len(values) - 1, int(p / 100.0 * len(values)))], 3)
+
+            return {
+                'requests': len(latencies),
+                'elapsed_s': round(elapsed, 3),
+                'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+                'latency_ms': {p: pct(latencies, int(p[1:])) for p in ('p50', 'p90', 'p99')},
+                'handler_ms': {p: pct(handler_ms, int(p[1:])) for p in ('p50', 'p90', 'p99')},
+                'cold_starts': len(self._init_ms),
+                'cold_init_ms': {p: pct(sorted(self._init_ms), int(p[1:])) for p in ('p50', 'p99')},
+                'throttled': self._throttled,
+                'errors': self._errors,
+            }
+
+
+def _body_fields(body, content_type):
+    if not body:
+        return None, False
+    if content_type and content_type.startswith(_TEXTUAL):
+        try:
+            return body.decode('utf-8'), False
+        except UnicodeDecodeError:
+            pass
+    return base64.b64encode(body).decode('ascii'), True
+
+
+def event_from_request(source, method, target, headers, body, client_ip, stage, host):
+    """Lambda event for one HTTP request. headers is a list of (key, value)."""
+    url = urlsplit(target)
+    path, raw_query = url.path or '/', url.query
+    query = parse_qsl(raw_query, keep_blank_values=True)
+    content_type = next((v for k, v in headers if k.lower() == 'content-type'), None)
+    body_text, is_base64 = _body_fields(body, content_type)
+    request_id = str(uuid.uuid4())
+    slash_stage = f'/{stage}' if stage and stage != '$default' else ''
+
+    single, multi = {}, {}
+    for k, v in headers:
+        multi.setdefault(k.lower(), []).append(v)
+        single[k.lower()] = v
+
+    if source == 'apigw-v2':
+        cookies = multi.pop('cookie', [])
+        event = {
+            'version': '2.0',
+            'routeKey': '$default',
+            'rawPath': slash_stage + path,
+            'rawQueryString': raw_query,
+            'headers': {k: ','.join(vv) for k, vv in multi.items()},
+            'requestContext': {
+                'domainName': host,
+                'http': {'method': method, 'path': slash_stage + path,
+                         'protocol': 'HTTP/1.1', 'sourceIp': client_ip},
+                'requestId': request_id,
+                'routeKey': '$default',
+                'stage': stage or '$default',
+                'timeEpoch': int(time.time() * 1000),
+            },
+            'isBase64Encoded': is_base64,
+        }
+        if cookies:
+            event['cookies'] = [c.strip() for cc in cookies for c in cc.split(';')]
+        if query:
+            event['queryStringParameters'] = {k: v for k, v in query}
+    elif source in ('apigw-v1', 'alb'):
+        mvqsp = {}
+        for k, v in query:
+            mvqsp.setdefault(k, []).append(v)
+        event = {
+            'httpMethod': method,
+            'path': path,
+            'headers': single,
+            'multiValueHeaders': multi,
+            'queryStringParameters': {k: vv[-1] for k, vv in mvqsp.items()} or None,
+            'multiValueQueryStringParameters': mvqsp or None,
+            'isBase64Encoded': is_base64,
+        }
+        if source == 'alb':
+            # ALB passes query values through undecoded
+            raw = [p.partition('=') for p in raw_query.split('&') if p]
+            event['multiValueQueryStringParameters'] = {}
+            for k, _, v in raw:
+                event['multiValueQueryStringParameters'].setdefault(k, []).append(v)
+            del event['queryStringParameters']
+            event['requestContext'] = {'elb': {'targetGroupArn': 'arn:aws:elasticloadbalancing:'
+                                               'local:000000000000:targetgroup/emulated/0'}}
+        else:
+            event['version'] = '1.0'
+            event['resource'] = '/{proxy+}'
+            event['path'] = slash_stage + path
+            event['requestContext'] = {
+                'domainName': host,
+                'httpMethod': method,
+                'path': slash_stage + path,
+                'requestId': request_id,
+                'stage': stage or '$default',
+            }
+    elif source == 'edge':
+        request = {
+            'clientIp': client_ip,
+            'method': method,
+            'uri': path,
+            'querystring': raw_query,
+            'headers': {k.lower(): [{'key': k, 'value': v}] for k, v in headers},
+        }
+        for k, v in headers:
+            entries = request['headers'][k.lower()]
+            if entries[-1]['value'] != v:
+                entries.append({'key': k, 'value': v})
+        if body:
+            request['body'] = {'action': 'read-only', 'encoding': 'base64',
+                               'inputTruncated': False,
+                               'data': base64.b64encode(body).decode('ascii')}
+        return {'Records': [{'cf': {
+            'config': {'distributionDomainName': host, 'distributionId': 'EMULATED',
+                       'eventType': 'origin-request', 'requestId': request_id},
+            'request': request}}]}
+    else:
+        raise ValueError(f'Unknown source {source!r}')
+
+    if body_text is not None:
+        event['body'] = body_text
+    elif source == 'alb':
+        event['body'] = ''
+    return event
+
+
+def http_from_response(response):
+    """(status, [(key, value)], body bytes) from a handler's response dict"""
+    if not isinstance(response, dict):
+        return 502, [('Content-Type', 'text/plain')], b'handler returned no response dict'
+    if 'uri' in response and 'method' in response:
+        # Lambda@Edge passed the request on; there's no origin here
+        return 502, [('Content-Type', 'text/plain')], b'request forwarded to origin (none emulated)'
+    headers = []
+    if 'statusCode' in response:
+        status = int(response['statusCode'])
+        for k, v in (response.get('headers') or {}).items():
+            headers.append((k, str(v)))
+        for k, vv in (response.get('multiValueHeaders') or {}).items():
+            headers.extend((k, str(v)) for v in vv)
+        headers.extend(('Set-Cookie', c) for c in response.get('cookies') or [])
+        body = response.get('body') or ''
+        is_base64 = response.get('isBase64Encoded')
+    else:
+        status = int(response['status'])
+        for entries in (response.get('headers') or {}).values():
+            headers.extend((e['key'], e['value']) for e in entries)
+        body = response.get('body') or ''
+        is_base64 = response.get('bodyEncoding') == 'base64'
+    if isinstance(body, str):
+        body = base64.b64decode(body) if is_base64 else body.encode('utf-8')
+    elif is_base64:
+        body = base64.b64decode(body)
+    headers = [(k, v) for k, v in headers if k.lower() not in ('content-length', 'transfer-encoding')]
+    return status, headers, body
+
+
+def make_request_handler(pool, stats, source, stage):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _handle(self):
+            started = time.perf_counter()
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            if self.path == STATS_PATH:
+                return self._send(200, [('Content-Type', 'application/json')],
+                                  json.dumps(stats.summary()).encode('utf-8'))
+            event = event_from_request(
+                source, self.command, self.path, list(self.headers.items()), body,
+                self.client_address[0], stage,
+                self.headers.get('Host') or f'localhost:{self.server.server_port}')
+            container = pool.acquire()
+            if container is None:
+                stats.record((time.perf_counter() - started) * 1000.0, throttled=True)
+                return self._send(429, [('Content-Type', 'application/json')],
+                                  b'{"message":"Too Many Requests"}')
+            healthy = True
+            try:
+                response, error, init_ms, handler_ms = container.invoke(event)
+            except (EOFError, OSError) as e:
+                healthy, response, error, init_ms, handler_ms = False, None, repr(e), None, None
+            finally:
+                pool.release(container, healthy)
+            if error:
+                status, headers, out = 502, [('Content-Type', 'text/plain')], error.encode('utf-8')
+            else:
+                status, headers, out = http_from_response(response)
+            self._send(status, headers, out)
+            stats.record((time.perf_counter() - started) * 1000.0, handler_ms, init_ms,
+                         error=bool(error) or status >= 500)
+
+        def _send(self, status, headers, body):
+            self.send_response(status)
+            for k, v in headers:
+                self.send_header(k, v)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = do_OPTIONS = _handle
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return Handler
+
+
+def main(argv=None):
+    a = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    a.add_argument('handler', help='module:function, e.g. lambda_function:lambda_handler')
+    a.add_argument('--source', default='apigw-v2',
+                   choices=['apigw-v1', 'apigw-v2', 'alb', 'edge'])
+    a.add_argument('--stage', default='$default', help='API Gateway stage name')
+    a.add_argument('--host', default='127.0.0.1')
+    a.add_argument('--port', type=int, default=8000)
+    a.add_argument('--concurrency', type=int, default=10, help='most containers at once')
+    a.add_argument('--idle-timeout', type=float, default=None,
+                   help='seconds before an idle container is retired')
+    a.add_argument('--throttle', action='store_true',
+                   help='answer 429 instead of queueing when all containers are busy')
+    a.add_argument('--report-every', type=float, default=10.0)
+    args = a.parse_args(argv)
+
+    sys.path.insert(0, '.')
+    pool = ContainerPool(args.handler, args.concurrency, args.idle_timeout, args.throttle)
+    stats = Stats()
+    server = ThreadingHTTPServer(
+        (args.host, args.port), make_request_handler(pool, stats, args.source, args.stage))
+    server.daemon_threads = True
+
+    stop = threading.Event()
+
+    def report():
+        while not stop.wait(args.report_every):
+            print(json.dumps(stats.summary()), file=sys.stderr, flush=True)
+    threading.Thread(target=report, daemon=True).start()
+
+    print(f'Emulating {args.source} for {args.handler} on '
+          f'http://{args.host}:{args.port}/ (stats at {STATS_PATH})', file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        pool.close()
+        print(json.dumps(stats.summary(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
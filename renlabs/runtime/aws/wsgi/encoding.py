@@ -0,0 +1,151 @@
+"""\
+Response body encoding for Lambda triggers: textual bodies go back as plain
+strings, others as base64; compressible bodies at least COMPRESS_MIN_BYTES long
+are gzip- or brotli-compressed when the request's Accept-Encoding allows.
+
+brotli is optional; without it only gzip is offered.
+
+The body arrives as the list of chunks the app produced and is encoded in one
+pass, emptying the list as it goes, so the chunks can be freed before the
+final str is built. Peak memory is about twice the body's size (base64
+bodies: twice the encoded size).
+"""
+
+import binascii
+import os
+
+_brotli = None  # module, False if unavailable, None until first looked for
+
+# Negative disables compression.
+COMPRESS_MIN_BYTES = int(os.environ.get('WSGI_COMPRESS_MIN_BYTES') or 1024)
+
+_TEXTUAL_TYPES = {
+    'application/json',
+    'application/javascript',
+    'application/ecmascript',
+    'application/xml',
+    'application/xhtml+xml',
+    'application/x-www-form-urlencoded',
+    'application/x-javascript',
+    'application/graphql',
+    'image/svg+xml',
+}
+_PLAIN_CHARSETS = {'utf-8', 'utf8', 'us-ascii', 'ascii'}
+
+
+def _mimetype_and_charset(content_type):
+    if not content_type:
+        return '', None
+    pieces = content_type.split(';')
+    charset = None
+    for p in pieces[1:]:
+        k, _, v = p.strip().partition('=')
+        if k.lower() == 'charset':
+            charset = v.strip().strip('"').lower()
+    return pieces[0].strip().lower(), charset
+
+
+def is_textual(mimetype):
+    return (mimetype.startswith('text/')
+            or mimetype in _TEXTUAL_TYPES
+            or mimetype.endswith('+json')
+            or mimetype.endswith('+xml'))
+
+
+def negotiate(accept_encoding):
+    """Pick 'br', 'gzip' or None from an Accept-Encoding header value"""
+    if not accept_encoding:
+        return None
+    q = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        q[coding.strip().lower()] = weight
+    star = q.get('*', 0.0)
+    if q.get('br', star) > 0 and _brotli_module():
+        return 'br'
+    if q.get('gzip', q.get('x-gzip', star)) > 0:
+        return 'gzip'
+    return None
+
+
+def _brotli_module():
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+    return _brotli
+
+
+def compress(data, coding):
+    return compress_chunks([data], coding)
+
+
+def compress_chunks(chunks, coding):
+    """Compress a list of bytes chunks, emptying the list as it goes"""
+    if coding == 'br':
+        compressor = _brotli_module().Compressor(quality=4)
+        feed, flush = compressor.process, compressor.finish
+    else:
+        import zlib
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip wrapper
+        feed, flush = compressor.compress, compressor.flush
+    out = []
+    chunks.reverse()
+    while chunks:
+        out.append(feed(chunks.pop()))
+    out.append(flush())
+    return b''.join(out)
+
+
+def _joined(chunks):
+    """One bytes object from a list of chunks, emptying the list"""
+    data = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+    chunks.clear()
+    return data
+
+
+def encode_body(chunks, status_code, headers, accept_encoding):
+    """Return (body, is_base64) for the response body chunks (a list, emptied
+    here), compressing per accept_encoding. headers (a Headers) is updated in
+    place with Content-Encoding, Vary and Content-Length as needed."""
+    mimetype, charset = _mimetype_and_charset(headers.get('Content-Type'))
+    already_encoded = headers.get('Content-Encoding', 'identity').lower() != 'identity'
+    textual = not already_encoded and is_textual(mimetype)
+
+    if (
+            textual
+            and COMPRESS_MIN_BYTES >= 0
+            and sum(map(len, chunks)) >= COMPRESS_MIN_BYTES
+            and status_code not in (204, 206, 304)
+            and 'no-transform' not in headers.get('Cache-Control', '')):
+        vary = headers.get('Vary')
+        if not vary:
+            headers['Vary'] = 'Accept-Encoding'
+        elif vary != '*' and 'accept-encoding' not in vary.lower():
+            headers['Vary'] = f'{vary}, Accept-Encoding'
+        coding = negotiate(accept_encoding)
+        if coding:
+            chunks[:] = [compress_chunks(chunks, coding)]
+            headers['Content-Encoding'] = coding
+            if 'Content-Length' in headers:
+                headers['Content-Length'] = str(len(chunks[0]))
+            textual = False
+
+    data = _joined(chunks)
+    if textual and (charset is None or charset in _PLAIN_CHARSETS):
+        try:
+            return data.decode('utf-8'), False
+        except UnicodeDecodeError:
+            pass
+    data = binascii.b2a_base64(data, newline=False)
+    return data.decode('ascii'), True
@@ -0,0 +1,195 @@
+"""\
+make_handler() settles the event source and path handling once, at init, and
+returns a lambda_handler(event, context) specialized for it:
+
+    from renlabs.runtime.aws.wsgi.factory import make_handler
+    lambda_handler = make_handler(app, source='apigw-v2')
+
+source is one of 'apigw-v1', 'apigw-v2', 'alb', 'edge', 'batch', or None to
+settle it from the first event. stage names the API Gateway stage whose path
+prefix to strip (default: whatever each event's requestContext says).
+base_path is a further prefix, moved from PATH_INFO to SCRIPT_NAME when
+present.
+
+With fallback=True an event that doesn't fit the source is re-detected and
+passed to wsgi_lambda_handler; otherwise it raises.
+
+Warm-up events are answered without calling the app, and warmup_requests
+(default: WSGI_WARMUP_REQUESTS) run through the app right away, during INIT;
+see the warmup module.
+"""
+
+from .apigateway_common import wsgi_lambda_handler_APIGateway_common
+from . import metrics
+from .warmup import is_warmup, warmup_response, prime
+
+import logging
+logger = logging.getLogger(__name__)
+
+SOURCES = ('apigw-v1', 'apigw-v2', 'alb', 'edge', 'batch')
+
+
+def _is_edge(event):
+    r = event.get('Records')
+    return bool(r) and 'cf' in r[0]
+
+
+def _is_batch(event):
+    r = event.get('Records')
+    return bool(r) and r[0].get('eventSource') in ('aws:sqs', 'aws:kinesis')
+
+
+def detect_source(event):
+    if _is_edge(event):
+        return 'edge'
+    if _is_batch(event):
+        return 'batch'
+    if 'elb' in (event.get('requestContext') or {}):
+        return 'alb'
+    if event.get('version') == '2.0' or 'rawPath' in event:
+        return 'apigw-v2'
+    if 'httpMethod' in event:
+        return 'apigw-v1'
+    raise RuntimeError("Unrecognized event payload schema")
+
+
+class _Prefixes:
+    """base_url and stage/base-path prefix per (domain, stage), computed once"""
+
+    def __init__(self, stage, base_path):
+        self._stage = stage
+        if base_path and base_path[0] != '/':
+            base_path = '/' + base_path
+        self._base_path = (base_path or '').rstrip('/')
+        self._cache = {}
+
+    def split(self, domain, event_stage, path):
+        """(base_url, adjusted_path) for a request"""
+        stage = self._stage if self._stage is not None else event_stage
+        key = (domain, stage)
+        entry = self._cache.get(key)
+        if entry is None:
+            slash_stage = f'/{stage}' if stage and stage != '$default' else ''
+            entry = (f'http://{domain}:443', slash_stage, self._base_path)
+            if len(self._cache) < 256:
+                self._cache[key] = entry
+        root, slash_stage, base_path = entry
+        if slash_stage and path.startswith(slash_stage):
+            path = path[len(slash_stage):]
+        else:
+            slash_stage = ''
+        if base_path and (path == base_path or path.startswith(base_path + '/')):
+            return root + slash_stage + base_path, path[len(base_path):]
+        return root + slash_stage, path
+
+
+def _v2_handler(app_object, prefixes):
+    from .apigatewayv2 import werkzeug_headers_from_v2
+
+    def lambda_handler(event, context):
+        timings = metrics.start('APIGatewayv2', event.get('routeKey'))
+        rctx = event['requestContext']
+        headers = werkzeug_headers_from_v2(event.get('headers') or {})
+        base_url, adjusted_path = prefixes.split(
+            rctx['domainName'], rctx.get('stage'), event['rawPath'])
+        timings.lap('headers')
+        return wsgi_lambda_handler_APIGateway_common(
+            app_object, event, context,
+            rctx['http']['method'],
+            event['rawQueryString'],
+            headers,
+            base_url,
+            adjusted_path,
+            timings)
+    return lambda_handler
+
+
+def _v1_handler(app_object, prefixes):
+    from .apigatewayv1 import query_string_from_v1, werkzeug_headers_from_v1
+
+    def lambda_handler(event, context):
+        timings = metrics.start('APIGatewayv1', event.get('resource'))
+        rctx = event['requestContext']
+        query_string = query_string_from_v1(
+            event.get('queryStringParameters') or {},
+            event.get('multiValueQueryStringParameters') or {})
+        headers = werkzeug_headers_from_v1(event.get('headers') or {},
+                                           event.get('multiValueHeaders') or {})
+        base_url, adjusted_path = prefixes.split(
+            rctx['domainName'], rctx.get('stage'), rctx['path'])
+        timings.lap('headers')
+        return wsgi_lambda_handler_APIGateway_common(
+            app_object, event, context,
+            event['httpMethod'],
+            query_string,
+            headers,
+            base_url,
+            adjusted_path,
+            timings)
+    return lambda_handler
+
+
+def _bound_handler(app_object, module_name, function_name):
+    import importlib
+    function = getattr(importlib.import_module(f'.{module_name}', __package__),
+                       function_name)
+
+    def lambda_handler(event, context):
+        return function(app_object, event, context)
+    return lambda_handler
+
+
+def _specialize(app_object, source, prefixes):
+    if source == 'apigw-v2':
+        return _v2_handler(app_object, prefixes)
+    if source == 'apigw-v1':
+        return _v1_handler(app_object, prefixes)
+    if source == 'alb':
+        return _bound_handler(app_object, 'alb', 'wsgi_lambda_handler_ALB')
+    if source == 'edge':
+        return _bound_handler(app_object, 'lambda_edge', 'wsgi_lambda_handler_LambdaAtEdge')
+    if source == 'batch':
+        return _bound_handler(app_object, 'batch', 'wsgi_lambda_handler_batch')
+    raise ValueError(f"source must be one of {SOURCES} or None, not {source!r}")
+
+
+_FITS = {
+    'apigw-v2': lambda event: 'rawPath' in event,
+    'apigw-v1': lambda event: ('httpMethod' in event
+                               and 'elb' not in (event.get('requestContext') or {})),
+    'alb': lambda event: 'elb' in (event.get('requestContext') or {}),
+    'edge': _is_edge,
+    'batch': _is_batch,
+}
+
+
+def make_handler(app_object, source=None, stage=None, base_path=None, fallback=True,
+                 warmup_requests=None):
+    """Return lambda_handler(event, context) running app_object for events from
+    source; see module docstring"""
+    prefixes = _Prefixes(stage, base_path)
+    settled = []  # [source, handler, fits] once known
+
+    def settle(source):
+        settled[:] = [source, _specialize(app_object, source, prefixes), _FITS[source]]
+
+    if source is not None:
+        settle(source)
+
+    def lambda_handler(event, context):
+        if is_warmup(event):
+            return warmup_response(event)
+        if not settled:
+            settle(detect_source(event))
+            logger.info(f'{__name__} settled on event source {settled[0]!r}')
+        source, handler, fits = settled
+        if fits(event):
+            return handler(event, context)
+        if not fallback:
+            raise RuntimeError(f"Event doesn't match event source {source!r}")
+        logger.warning(f"{__name__} event doesn't match {source!r}, re-detecting")
+        from . import wsgi_lambda_handler
+        return wsgi_lambda_handler(app_object, event, context)
+
+    prime(app_object, warmup_requests)
+    return lambda_handler
@@ -1,15 +1,20 @@
 # see __init__.py for note about environ context
+import binascii
+import json
 import logging, os
-logging.basicConfig(datefmt='')
 logger = logging.getLogger(__name__)
-logger.setLevel(int(os.environ.get('LEVEL', logging.DEBUG)))
 
-import werkzeug.datastructures
-from .common import ResponseWrapperBase
+from .common import Headers, ResponseWrapperMixin, DirectResponse, run_app
+from . import apigateway_common
+from .apigateway_common import log_preview, environ_for_APIGateway, methods_expecting_body
+from . import metrics
+from .cache import cached_response, store_response
 
-class ResponseWrapperLambdaAtEdge(ResponseWrapperBase):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+# Generated-response body limits, by trigger
+BODY_LIMITS = {'viewer-request': 40 * 1024, 'origin-request': 1024 * 1024}
+
+class ResponseMixinLambdaAtEdge(ResponseWrapperMixin):
+    """Match Lambda@Edge (CloudFront) expectations"""
 
     def headers_from_wsgi(self):
         """want {'content-type': [{ 'key': 'Content-Type', 'value': '' }], ... }"""
@@ -29,27 +34,90 @@ class ResponseWrapperLambdaAtEdge(ResponseWrapperBase):
         return headers
 
     def body_from_wsgi(self):
-        body = base64.b64encode(self.data)
-        return body
+        return self.encoded_body()
 
     def response_dict(self, prepared_headers, prepared_body):
         """Override providing a Lambda@Edge response from WSGI response"""
-        trunc_body = (prepared_body[:20] + b'...'
-                      if len(prepared_body) > 25
-                      else prepared_body)
         d = {
-            'status': self.status_code,  # statusDescription not req'd per docs
-            'body': trunc_body,
-            'bodyEncoding': 'base64',
+            'status': str(self.status_code),  # statusDescription not req'd per docs
+            'body': prepared_body,
+            'bodyEncoding': 'base64' if self.is_base64 else 'text',
             'headers': prepared_headers,
         }
-        logger.info(d)
-        logger.debug('Full body:', repr(prepared_body))
-        d['body'] = prepared_body
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f'{__name__} response dict: {log_preview(d)!r}')
         return d
 
+
+class DirectResponseLambdaAtEdge(ResponseMixinLambdaAtEdge, DirectResponse):
+    """Lambda@Edge response collected by run_app()"""
+
+
+def headers_from_cloudfront(cf_headers):
+    """Headers from CloudFront's {'lowerkey': [{'key': ..., 'value': ...}]}"""
+    h = Headers()
+    for lowerkey, items in cf_headers.items():
+        for item in items:
+            h.add(lowerkey, item['value'])
+    return h
+
+
+def divide_base_from_full_path(uri):
+    """(base path, path) with base path from BASE_PATH, if uri starts with it"""
+    env_base = os.environ.get('BASE_PATH', '')
+    if env_base and env_base[0] != '/':
+        env_base = '/' + env_base
+    if env_base and env_base[-1] == '/':
+        env_base = env_base[:-1]
+    if env_base:
+        eblen = len(env_base)
+        if env_base == uri[:eblen]:
+            return env_base, uri[eblen:]
+    return '', uri
+
+
+def path_matcher(include=(), exclude=()):
+    """Return match(uri): True if uri starts with one of the include prefixes
+    (or include is empty) and with none of the exclude prefixes."""
+    include = tuple(p for p in include if p)
+    exclude = tuple(p for p in exclude if p)
+    if include and exclude:
+        return lambda uri: uri.startswith(include) and not uri.startswith(exclude)
+    if include:
+        return lambda uri: uri.startswith(include)
+    if exclude:
+        return lambda uri: not uri.startswith(exclude)
+    return lambda uri: True
+
+
+def _prefixes(name):
+    return [p.strip() for p in os.environ.get(name, '').split(',')]
+
+
+# Requests whose uri doesn't match go on to the origin untouched
+app_path = path_matcher(_prefixes('WSGI_EDGE_INCLUDE_PREFIXES'),
+                        _prefixes('WSGI_EDGE_EXCLUDE_PREFIXES'))
+
+
+def set_app_paths(include=(), exclude=()):
+    """Replace the include/exclude prefixes from the environment"""
+    global app_path
+    app_path = path_matcher(include, exclude)
+
+
+def body_from_cloudfront(req):
+    """Request body (needs "Include body" on the trigger): bytes, str or None"""
+    body = req.get('body')
+    if not body or not body.get('data'):
+        return None
+    if body.get('inputTruncated'):
+        logger.warning(f'{__name__} request body truncated by CloudFront')
+    if body.get('encoding') == 'base64':
+        return binascii.a2b_base64(body['data'])
+    return body['data']
+
+
 def wsgi_lambda_handler_LambdaAtEdge_origin(app_object, event, context):
-    logger.debug(f'event: {json.dumps(event)}')
     r = event['Records']
     if len(r) != 1:
         raise RuntimeError("Unexpected count of Records in event, not 1")
@@ -57,38 +125,59 @@ def wsgi_lambda_handler_LambdaAtEdge_origin(app_object, event, context):
     if 'response' in cf:
         raise RuntimeError("WSGI install is only appropriate on ...Request triggers, not ...Response")
     req = cf['request']
+    if not app_path(req['uri']):
+        return req
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f'{__name__} event: {json.dumps(event)}')
+    event_type = cf.get('config', {}).get('eventType')
+    timings = metrics.start('LambdaAtEdge', event_type)
 
-    def werkzeug_headers_from_cloudfront(cf_headers):
-        h = werkzeug.datastructures.Headers()
-        for lowerkey, hobj in cf_headers.items():
-            for k, v in hobj.items():
-                h.add(lowerkey, v)
-        return h
-    wzh = werkzeug_headers_from_cloudfront(req['headers'])
-
-    def divide_base_from_full_path(uri):
-        env_base = os.environ.get('BASE_PATH', '')
-        if env_base and env_base[0] != '/':
-            env_base = '/' + env_base
-        if ev_base[-1] == '/':
-            env_base = env_base[:-1]
-        if env_base:
-            eblen = len(env_base)
-            if env_base == uri[:eblen]:
-                return env_base, uri[eblen:]
-        return '', uri
+    wzh = headers_from_cloudfront(req['headers'])
     base_path, path = divide_base_from_full_path(req['uri'])
+    base_url = f'http://{wzh["host"]}{base_path}'
+    method = req['method']
+    query_string = req.get('querystring') or ''
+    timings.lap('headers')
+
+    cache_key, response = cached_response(method, base_url, path, query_string, wzh, timings)
+    if response is not None:
+        timings.lap('cache')
+        timings.finish(response)
+        return response
 
-    base_url = f'http://{wzh["host"]}/{base_path}'
-    b = EnvironBuilder(
-        path=path,
-        base_url=base_url,
-        headers=wzh.to_wsgi_list(),
-        query_string=req.get('querystring') or '',
-        method=req['method'])
-    logger.debug(f'cf environ: {b.get_environ()}')
-    response = Client(app_object, ResponseWrapperAPIGateway).open(b).get_response()
+    data = body_from_cloudfront(req)
+    timings.size('RequestBytes', len(data) if data else 0)
+    timings.lap('decode')
 
+    if apigateway_common.COMPAT_CLIENT:
+        from .compat import Client, EnvironBuilder, ResponseWrapperLambdaAtEdge
+        b = EnvironBuilder(
+            path=path,
+            base_url=base_url,
+            headers=wzh.to_wsgi_list(),
+            data=data,
+            query_string=query_string,
+            method=method)
+        if b.headers.get('content-length') is None and method in methods_expecting_body:
+            b.headers['content-length'] = 0
+        timings.lap('environ')
+        wrapped = Client(app_object, ResponseWrapperLambdaAtEdge).open(b)
+    else:
+        environ = environ_for_APIGateway(method, query_string, wzh, base_url, path, data)
+        timings.lap('environ')
+        wrapped = run_app(app_object, environ, DirectResponseLambdaAtEdge)
+    timings.lap('app')
+    wrapped.set_request(method, wzh)
+    response = wrapped.get_response()
+    timings.lap('encode')
+    store_response(cache_key, wzh, wrapped, response)
+    timings.finish(response)
+
+    limit = BODY_LIMITS.get(event_type)
+    if limit and len(response['body']) > limit:
+        logger.warning(f'{__name__} {len(response["body"])}-byte body is over the '
+                       f'{limit}-byte limit for {event_type} responses; CloudFront will '
+                       'answer 502')
     return response
 
 
@@ -99,3 +188,10 @@ def wsgi_lambda_handler_LambdaAtEdge_viewer(app_object, event, context):
 def wsgi_lambda_handler_LambdaAtEdge(app_object, event, context):
     return wsgi_lambda_handler_LambdaAtEdge_origin(app_object, event, context)
 
+
+def __getattr__(name):
+    # ResponseWrapperLambdaAtEdge needs werkzeug; load it only if asked for.
+    if name == 'ResponseWrapperLambdaAtEdge':
+        from .compat import ResponseWrapperLambdaAtEdge
+        return ResponseWrapperLambdaAtEdge
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,116 @@
+"""\
+Optional per-request phase timings, written to stdout as one CloudWatch
+Embedded Metric Format (EMF) line per sampled request. Lambda forwards stdout
+to CloudWatch Logs, which extracts the metrics.
+
+Set WSGI_METRICS_SAMPLE_RATE (0.0 to 1.0) to turn this on; unset or 0 leaves it
+off, and each adapter then only pays for a few no-op method calls.
+
+Adapters call start() once per request, lap(name) at the end of each phase,
+size() and count() for other per-request values, and finish() with the
+response dict.
+"""
+
+import json
+import os
+import sys
+import time
+
+SAMPLE_RATE = float(os.environ.get('WSGI_METRICS_SAMPLE_RATE') or 0)
+NAMESPACE = os.environ.get('WSGI_METRICS_NAMESPACE', 'renlabs/wsgi')
+
+_cold_start = True
+
+
+class NullTimings:
+    """Stand-in when a request isn't sampled"""
+
+    def lap(self, phase):
+        pass
+
+    def size(self, name, value):
+        pass
+
+    def count(self, name, value):
+        pass
+
+    def finish(self, response):
+        pass
+
+
+NULL_TIMINGS = NullTimings()
+
+
+class Timings:
+    """Phase timings for one sampled request"""
+
+    def __init__(self, adapter, route, cold_start):
+        self._adapter = adapter
+        self._route = route
+        self._cold_start = cold_start
+        self._started = self._last = time.perf_counter()
+        self._values = {}
+        self._counts = set()
+
+    def lap(self, phase):
+        """Record milliseconds since the previous lap (or start) as phase"""
+        now = time.perf_counter()
+        self._values[phase] = self._values.get(phase, 0.0) + (now - self._last) * 1000.0
+        self._last = now
+
+    def size(self, name, value):
+        self._values[name] = value
+
+    def count(self, name, value):
+        self._values[name] = int(value)
+        self._counts.add(name)
+
+    def finish(self, response):
+        self._values['total'] = (time.perf_counter() - self._started) * 1000.0
+        body = response.get('body') if isinstance(response, dict) else None
+        self._values.setdefault('ResponseBytes', len(body) if body else 0)
+        status = None
+        if isinstance(response, dict):
+            status = response.get('statusCode', response.get('status'))
+        sys.stdout.write(self.emf(status) + '\n')
+
+    def emf(self, status=None):
+        metrics = []
+        for name in self._values:
+            if name in self._counts:
+                unit = 'Count'
+            elif name.endswith('Bytes'):
+                unit = 'Bytes'
+            else:
+                unit = 'Milliseconds'
+            metrics.append({'Name': name, 'Unit': unit})
+        metrics.append({'Name': 'ColdStart', 'Unit': 'Count'})
+        d = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': [['Adapter', 'Route'], ['Adapter']],
+                    'Metrics': metrics,
+                }],
+            },
+            'Adapter': self._adapter,
+            'Route': self._route,
+            'ColdStart': 1 if self._cold_start else 0,
+            'StatusCode': status,
+        }
+        d.update(self._values)
+        return json.dumps(d)
+
+
+def start(adapter, route):
+    """Begin timing a request: a Timings if sampled, else NULL_TIMINGS"""
+    global _cold_start
+    cold_start, _cold_start = _cold_start, False
+    if not SAMPLE_RATE:
+        return NULL_TIMINGS
+    if SAMPLE_RATE < 1.0:
+        from random import random
+        if random() >= SAMPLE_RATE:
+            return NULL_TIMINGS
+    return Timings(adapter, route or '-', cold_start)
@@ -0,0 +1,223 @@
+"""\
+Stream a WSGI app's response back through Lambda response streaming, for
+function URLs configured with InvokeMode RESPONSE_STREAM (see
+LambdaFunction.create_url in renlabs.provisioning.aws). Events arrive in API
+Gateway v2 payload format.
+
+The stream is an HTTP integration response: a JSON prelude carrying
+statusCode, headers and cookies, eight NUL bytes, then the body bytes as the
+app produces them. Small chunks are coalesced up to STREAM_BUFFER_BYTES before
+being written, so neither memory nor write count grows with the body.
+
+Lambda's Python runtime doesn't stream, so this runs as a custom runtime
+(provided.al2 or similar) with a bootstrap like:
+
+    #!/bin/sh
+    exec python3 -m renlabs.runtime.aws.wsgi.streaming my_module:app
+
+To check an app locally without AWS:
+
+    prelude, body, chunks = collect_stream(app, event)
+"""
+
+import base64
+import json
+import os
+import sys
+import traceback
+
+from .apigateway_common import body_from_event, environ_for_APIGateway, log_preview
+from .apigatewayv2 import werkzeug_headers_from_v2, base_url_and_path_from_v2
+
+import logging
+logger = logging.getLogger(__name__)
+
+STREAM_BUFFER_BYTES = int(os.environ.get('WSGI_STREAM_BUFFER_BYTES') or 16384)
+CONTENT_TYPE = 'application/vnd.awslambda.http-integration-response'
+PRELUDE_DELIMITER = b'\0' * 8
+
+
+def prelude_bytes(status, headers):
+    """JSON prelude plus delimiter for a WSGI status line and header list"""
+    joined = {}
+    cookies = []
+    for k, v in headers:
+        if k.lower() == 'set-cookie':
+            cookies.append(v)
+        elif k in joined:
+            joined[k] = f'{joined[k]}, {v}'
+        else:
+            joined[k] = v
+    prelude = {
+        'statusCode': int(status.split(None, 1)[0]),
+        'headers': joined,
+        'cookies': cookies,
+    }
+    return json.dumps(prelude).encode('utf-8') + PRELUDE_DELIMITER
+
+
+def wsgi_lambda_handler_streaming(app_object, event, context, write):
+    """Run app_object for a function URL event, passing the response stream to
+    write(bytes) as it's produced"""
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f'{__name__} event: {json.dumps(log_preview(event, 200))}')
+    headers = werkzeug_headers_from_v2(event.get('headers') or {})
+    base_url, adjusted_path = base_url_and_path_from_v2(event)
+    environ = environ_for_APIGateway(
+        event['requestContext']['http']['method'],
+        event.get('rawQueryString', ''),
+        headers,
+        base_url,
+        adjusted_path,
+        body_from_event(event))
+
+    response = []
+    pending = []
+    pending_size = 0
+    prelude_written = False
+
+    def flush():
+        nonlocal pending_size, prelude_written
+        if not prelude_written:
+            write(prelude_bytes(*response))
+            prelude_written = True
+        if pending:
+            write(b''.join(pending))
+            pending.clear()
+            pending_size = 0
+
+    def out(chunk):
+        nonlocal pending_size
+        if not chunk:
+            return
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= STREAM_BUFFER_BYTES:
+            flush()
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info is not None and prelude_written:
+            raise exc_info[1].with_traceback(exc_info[2])
+        response[:] = [status, headers]
+        return out  # legacy write() callable
+
+    app_rv = app_object(environ, start_response)
+    try:
+        for chunk in app_rv:
+            out(chunk)
+    finally:
+        close = getattr(app_rv, 'close', None)
+        if close is not None:
+            close()
+    flush()
+
+
+class LocalStreamWriter:
+    """Collects what a handler streams, for local checks"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+
+    def parse(self):
+        """(prelude dict, body bytes) from the collected stream"""
+        stream = b''.join(self.chunks)
+        prelude, _, body = stream.partition(PRELUDE_DELIMITER)
+        return json.loads(prelude), body
+
+
+def collect_stream(app_object, event):
+    """Run app_object for event with no AWS involved; return (prelude dict,
+    body bytes, list of written chunks)"""
+    writer = LocalStreamWriter()
+    wsgi_lambda_handler_streaming(app_object, event, None, writer.write)
+    prelude, body = writer.parse()
+    return prelude, body, writer.chunks
+
+
+class RuntimeAPIWriter:
+    """Chunked, streaming POST of one invocation's response to the Lambda
+    Runtime API. The request starts on the first write."""
+
+    def __init__(self, connection, request_id):
+        self._connection = connection
+        self._path = f'/2018-06-01/runtime/invocation/{request_id}/response'
+        self.started = False
+
+    def write(self, data):
+        c = self._connection
+        if not self.started:
+            c.putrequest('POST', self._path)
+            c.putheader('Lambda-Runtime-Function-Response-Mode', 'streaming')
+            c.putheader('Transfer-Encoding', 'chunked')
+            c.putheader('Content-Type', CONTENT_TYPE)
+            c.putheader('Trailer', 'Lambda-Runtime-Function-Error-Type, '
+                        'Lambda-Runtime-Function-Error-Body')
+            c.endheaders()
+            self.started = True
+        if data:
+            c.send(b'%x\r\n' % len(data) + data + b'\r\n')
+
+    def close(self, error=None):
+        """End the stream, reporting error (an exception) in trailers"""
+        c = self._connection
+        if not self.started:
+            self.write(b'')
+        trailers = b''
+        if error is not None:
+            error_body = base64.b64encode(json.dumps(_error_dict(error)).encode('utf-8'))
+            trailers = (b'Lambda-Runtime-Function-Error-Type: '
+                        + type(error).__name__.encode('ascii') + b'\r\n'
+                        + b'Lambda-Runtime-Function-Error-Body: ' + error_body + b'\r\n')
+        c.send(b'0\r\n' + trailers + b'\r\n')
+        c.getresponse().read()
+
+
+def _error_dict(error):
+    return {
+        'errorMessage': str(error),
+        'errorType': type(error).__name__,
+        'stackTrace': traceback.format_exception(type(error), error, error.__traceback__),
+    }
+
+
+def serve_runtime_api(app_object, runtime_api=None):
+    """Custom-runtime loop: fetch invocations from the Runtime API and stream
+    each response back. Doesn't return."""
+    import http.client
+    runtime_api = runtime_api or os.environ['AWS_LAMBDA_RUNTIME_API']
+    connection = http.client.HTTPConnection(runtime_api)
+    while True:
+        connection.request('GET', '/2018-06-01/runtime/invocation/next')
+        r = connection.getresponse()
+        event = json.loads(r.read())
+        request_id = r.headers['Lambda-Runtime-Aws-Request-Id']
+        writer = RuntimeAPIWriter(connection, request_id)
+        try:
+            wsgi_lambda_handler_streaming(app_object, event, None, writer.write)
+        except Exception as e:
+            logger.exception(f'{__name__} request {request_id} failed')
+            if writer.started:
+                writer.close(e)
+            else:
+                connection.request(
+                    'POST', f'/2018-06-01/runtime/invocation/{request_id}/error',
+                    body=json.dumps(_error_dict(e)),
+                    headers={'Lambda-Runtime-Function-Error-Type': type(e).__name__})
+                connection.getresponse().read()
+        else:
+            writer.close()
+
+
+def main(argv):
+    import importlib
+    module_name, _, attr = argv[1].partition(':')
+    app_object = getattr(importlib.import_module(module_name), attr or 'app')
+    serve_runtime_api(app_object)
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.environ.get('LAMBDA_TASK_ROOT', os.getcwd()))
+    main(sys.argv)
@@ -0,0 +1,84 @@
+"""\
+Keep-warm pings and init-phase priming.
+
+wsgi_lambda_handler, asgi_lambda_handler and make_handler() handlers answer
+warm-up events straight away, without touching the app: EventBridge
+(CloudWatch Events) scheduled events, and events carrying the marker named by
+WSGI_WARMUP_MARKER, either a key ("warmer") or key=value
+("source=serverless-plugin-warmup").
+
+prime(app) runs synthetic requests through the app, meant for module level in
+lambda_function.py, where Lambda's INIT phase runs at full CPU; the first real
+request then finds the app's lazy imports and caches already loaded.
+make_handler() does this itself. The requests come from WSGI_WARMUP_REQUESTS,
+comma-separated, each an optional method and a path with optional query:
+"/health, GET /api/items?limit=1".
+"""
+
+import os
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+WARMUP_MARKER = os.environ.get('WSGI_WARMUP_MARKER') or None
+WARMUP_REQUESTS = os.environ.get('WSGI_WARMUP_REQUESTS', '')
+
+_marker_key, _, _marker_value = (WARMUP_MARKER or '').partition('=')
+
+
+def is_warmup(event):
+    if event.get('detail-type') == 'Scheduled Event':
+        return True
+    if _marker_key and _marker_key in event:
+        return not _marker_value or str(event[_marker_key]) == _marker_value
+    return False
+
+
+def warmup_response(event):
+    logger.info(f'{__name__} warm-up event, app not called')
+    return {'warmup': True}
+
+
+def parse_requests(spec):
+    """[(method, path, query_string)] from WSGI_WARMUP_REQUESTS syntax"""
+    requests = []
+    for item in spec.split(','):
+        words = item.split()
+        if not words:
+            continue
+        method, target = ('GET', words[0]) if len(words) == 1 else (words[0].upper(), words[1])
+        path, _, query_string = target.partition('?')
+        requests.append((method, path, query_string))
+    return requests
+
+
+def prime(app_object, requests=None):
+    """Run warm-up requests through the app: a list of (method, path,
+    query_string), or by default those in WSGI_WARMUP_REQUESTS. Failures are
+    logged, not raised. Returns [(method, path, status or None)]."""
+    if requests is None:
+        requests = parse_requests(WARMUP_REQUESTS)
+    if not requests:
+        return []
+    from .common import Headers, run_app
+    from .apigateway_common import DirectResponseAPIGateway, environ_for_APIGateway
+    results = []
+    for method, path, query_string in requests:
+        started = time.perf_counter()
+        headers = Headers([('host', 'localhost'), ('accept-encoding', 'gzip'),
+                           ('user-agent', 'renlabs-warmup')])
+        try:
+            environ = environ_for_APIGateway(method, query_string, headers,
+                                             'http://localhost', path, None)
+            wrapped = run_app(app_object, environ, DirectResponseAPIGateway)
+            wrapped.set_request(method, headers)
+            wrapped.get_response()
+            status = wrapped.status_code
+        except Exception:
+            logger.exception(f'{__name__} warm-up {method} {path} failed')
+            status = None
+        logger.info(f'{__name__} warm-up {method} {path}: {status} in '
+                    f'{(time.perf_counter() - started) * 1000.0:.1f}ms')
+        results.append((method, path, status))
+    return results
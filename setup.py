@@ -33,5 +33,8 @@ setup(
     author='Steve Work',
     author_email='steve@work.renlabs.com',
     packages=packages,
-    install_requires=install_requires
+    install_requires=install_requires,
+    extras_require={
+        'brotli': ['brotli'],  # optional response compression
+    }
 )
@@ -0,0 +1,13 @@
+import pytest
+
+from renlabs.runtime.aws.wsgi.alb import query_string_from_alb
+
+
+@pytest.mark.parametrize('event, expected', [
+    ({'queryStringParameters': {'a': '', 'b': '2'}}, 'a=&b=2'),
+    ({'multiValueQueryStringParameters': {'a': ['', '1'], 'b': ['x%20y']}}, 'a=&a=1&b=x%20y'),
+    ({'queryStringParameters': {'a': None}}, 'a'),
+    ({}, ''),
+])
+def test_query_string_keeps_empty_values(event, expected):
+    assert query_string_from_alb(event) == expected
@@ -0,0 +1,154 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from renlabs.provisioning.aws import AWSBase, GatewayApi, RouteSet, clients
+from renlabs.provisioning.aws.apigatewayv2 import APIGATEWAY_PRINCIPAL, invoke_statement_id
+from renlabs.provisioning.aws.state import StateCache
+
+REGION, ACCOUNT = 'us-west-2', '123456789012'
+FUNCTION_ARN = f'arn:aws:lambda:{REGION}:{ACCOUNT}:function:lambda_app'
+
+
+def _statement(sid, api_id, region=REGION, account=ACCOUNT):
+    return {'Sid': sid,
+            'Principal': {'Service': APIGATEWAY_PRINCIPAL},
+            'Condition': {'ArnLike': {
+                'AWS:SourceArn': f'arn:aws:execute-api:{region}:{account}:{api_id}/*/*'}}}
+
+
+class _Paginator:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return iter(self.pages)
+
+
+class FakeLambda:
+    def __init__(self, statements):
+        self.statements = list(statements)
+        self.added = []
+        self.removed = []
+
+    def get_policy(self, FunctionName):
+        return {'Policy': json.dumps({'Statement': self.statements})}
+
+    def add_permission(self, StatementId, SourceArn, **kwargs):
+        self.added.append(StatementId)
+        api_id = SourceArn.split(':')[5].split('/')[0]
+        self.statements.append(_statement(StatementId, api_id))
+
+    def remove_permission(self, FunctionName, StatementId):
+        self.removed.append(StatementId)
+        self.statements = [s for s in self.statements if s['Sid'] != StatementId]
+
+
+class FakeApiGateway:
+    def __init__(self, key, items, routes=None, failing=()):
+        self.key = key
+        self.items = items
+        self.routes = dict(routes or {})  # route key -> id
+        self.failing = set(failing)  # route keys create_route fails for
+        self.calls = []
+
+    def get_paginator(self, operation):
+        if operation == 'get_routes':
+            return _Paginator([{'Items': [{'RouteKey': k, 'RouteId': v}
+                                          for k, v in self.routes.items()]}])
+        return _Paginator([{self.key: self.items}])
+
+    def create_route(self, ApiId, RouteKey, **kwargs):
+        self.calls.append(('create', RouteKey))
+        if RouteKey in self.failing:
+            raise ClientError({'Error': {'Code': 'BadRequestException'}}, 'CreateRoute')
+        self.routes[RouteKey] = f'id-{RouteKey}'
+        return {'RouteId': self.routes[RouteKey]}
+
+    def delete_route(self, ApiId, RouteId):
+        key = next(k for k, v in self.routes.items() if v == RouteId)
+        self.calls.append(('delete', key))
+        del self.routes[key]
+
+
+@pytest.fixture
+def configured(monkeypatch):
+    monkeypatch.setattr(AWSBase, 'app', {'name': 'app', 'gateway_stage_name': 'testing'})
+    for name, value in [('_region', REGION), ('_account', ACCOUNT), ('_role', None),
+                        ('state', StateCache())]:
+        monkeypatch.setattr(AWSBase, name, value)
+    AWSBase.state.put(('function', 'lambda_app'), FUNCTION_ARN)
+    AWSBase.state.put(('apis', 'app'), [{'ApiId': 'a1', 'ApiEndpoint': 'https://a1'}])
+    AWSBase.state.put(('integration', 'a1'), 'i1')
+
+    def install(statements, routes=None, failing=()):
+        fakes = {
+            'lambda': FakeLambda(statements),
+            'apigatewayv2': FakeApiGateway('Items', [{'ApiId': 'a1'}, {'ApiId': 'http2'}],
+                                           routes, failing),
+            'apigateway': FakeApiGateway('items', [{'id': 'rest1'}]),
+        }
+        monkeypatch.setattr(clients, 'client',
+                            lambda service, region=None, role=None: fakes[service])
+        return fakes
+    return install
+
+
+def test_prune_permissions_removes_only_stale_statements_of_this_region_and_account(configured):
+    fakes = configured([
+        _statement(invoke_statement_id('a1'), 'a1'),  # permit_invoke's own
+        _statement('per-route', 'a1'),                # an older one for this API
+        _statement('gone', 'deleted1'),               # an API that's gone
+        _statement('http', 'http2'),                  # another HTTP API
+        _statement('rest', 'rest1'),                  # a REST API
+        _statement('other-region', 'east1', region='us-east-1'),
+        _statement('other-account', 'acct1', account='210987654321'),
+        {'Sid': 'not-apigateway', 'Principal': '*'},
+    ])
+    removed = GatewayApi().find().prune_permissions()
+    assert removed == ['per-route', 'gone']
+    assert fakes['lambda'].removed == ['per-route', 'gone']
+
+
+def test_prune_permissions_lists_apis_only_for_other_apis_statements(configured):
+    fakes = configured([_statement('per-route', 'a1')])
+    del fakes['apigateway']
+    assert GatewayApi().find().prune_permissions() == ['per-route']
+
+
+def test_permit_invoke_adds_the_statement_only_when_missing(configured):
+    fakes = configured([])
+    assert GatewayApi().find().permit_invoke() is True
+    assert GatewayApi().find().permit_invoke() is False
+    assert fakes['lambda'].added == [invoke_statement_id('a1')]
+
+
+def test_reconcile_creates_deletes_and_leaves_routes(configured):
+    fakes = configured([_statement('per-route', 'a1')],
+                       routes={'GET /keep': 'r1', 'GET /old': 'r2'})
+    result = RouteSet([('GET', 'keep'), ('POST', 'new')]).reconcile()
+    assert result == {'created': ['POST /new'], 'deleted': ['GET /old'],
+                      'permissions_removed': ['per-route']}
+    assert set(fakes['apigatewayv2'].routes) == {'GET /keep', 'POST /new'}
+    assert ('create', 'GET /keep') not in fakes['apigatewayv2'].calls
+    assert fakes['lambda'].added == [invoke_statement_id('a1')]
+
+    fakes['apigatewayv2'].calls.clear()
+    again = RouteSet([('GET', 'keep'), ('POST', 'new')]).reconcile()
+    assert again == {'created': [], 'deleted': [], 'permissions_removed': []}
+    assert fakes['apigatewayv2'].calls == []
+    assert fakes['lambda'].added == [invoke_statement_id('a1')]
+
+
+def test_reconcile_failure_leaves_the_route_table_to_be_reread(configured):
+    fakes = configured([], failing={'POST /bad'})
+    with pytest.raises(ClientError):
+        RouteSet([('GET', 'good'), ('POST', 'bad')]).reconcile()
+    assert 'GET /good' in fakes['apigatewayv2'].routes
+
+    fakes['apigatewayv2'].failing.clear()
+    fakes['apigatewayv2'].calls.clear()
+    result = RouteSet([('GET', 'good'), ('POST', 'bad')]).reconcile()
+    assert result['created'] == ['POST /bad']
+    assert fakes['apigatewayv2'].calls == [('create', 'POST /bad')]
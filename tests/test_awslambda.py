@@ -0,0 +1,121 @@
+import hashlib
+from urllib.parse import parse_qs
+
+import pytest
+from botocore.exceptions import ClientError
+
+from renlabs.provisioning.aws import AWSBase, clients
+from renlabs.provisioning.aws.awslambda import LambdaFunction
+from renlabs.provisioning.aws.state import StateCache
+
+FUNCTION_ARN = 'arn:aws:lambda:us-west-2:123456789012:function:lambda_app'
+
+
+class FakeS3:
+    def __init__(self, objects=(), head_error=None):
+        self.objects = dict.fromkeys(objects, b'')  # key -> bytes
+        self.head_error = head_error  # error code for head_object of a missing key
+        self.heads = []
+        self.uploads = []  # (key, ExtraArgs)
+
+    def head_object(self, Bucket, Key):
+        self.heads.append(Key)
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': self.head_error}}, 'HeadObject')
+        return {}
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Config=None):
+        with open(Filename, 'rb') as f:
+            self.objects[Key] = f.read()
+        self.uploads.append((Key, ExtraArgs))
+
+
+class _Waiter:
+    def wait(self, **kwargs):
+        pass
+
+
+class FakeLambda:
+    def __init__(self):
+        self.codes = []  # Code (create) or code keyword arguments (update), in order
+
+    def create_function(self, Code, **kwargs):
+        self.codes.append(Code)
+        return {'FunctionArn': f'{FUNCTION_ARN}:1'}
+
+    def get_waiter(self, name):
+        return _Waiter()
+
+    def update_function_code(self, FunctionName, Publish, **code):
+        self.codes.append(code)
+
+
+@pytest.fixture
+def aws(monkeypatch, tmp_path):
+    fakes = {'s3': FakeS3(head_error='404'), 'lambda': FakeLambda()}
+    monkeypatch.setattr(clients, 'client',
+                        lambda service, region=None, role=None: fakes[service])
+    monkeypatch.setattr(AWSBase, 'app', {'name': 'app', 'provisioning_tag': 'app-tag',
+                                         'code_bucket': 'code'})
+    for name, value in [('_region', 'us-west-2'), ('_role', None),
+                        ('_account', '123456789012'), ('state', StateCache())]:
+        monkeypatch.setattr(AWSBase, name, value)
+    source = tmp_path / 'lambda_function.py'
+    source.write_text('def lambda_handler(event, context):\n    return event\n')
+    fakes['source'] = str(source)
+    return fakes
+
+
+def _key(aws, prefix='lambda/app/'):
+    package = aws['s3'].objects[aws['s3'].uploads[0][0]]
+    return f'{prefix}{hashlib.sha256(package).hexdigest()}.zip'
+
+
+def test_upload_package_uploads_once_under_its_sha256(aws):
+    code = LambdaFunction().upload_package(aws['source'])
+    assert code == {'S3Bucket': 'code', 'S3Key': _key(aws)}
+    ((key, extra),) = aws['s3'].uploads
+    assert parse_qs(extra['Tagging']) == {'provisioning': ['app-tag']}
+
+    assert LambdaFunction().upload_package(aws['source']) == code
+    assert len(aws['s3'].uploads) == 1
+    assert aws['s3'].heads == [key]
+
+
+@pytest.mark.parametrize('code', ['404', 'NoSuchKey', 'NotFound'])
+def test_upload_package_uploads_when_missing_and_skips_when_there(aws, code):
+    aws['s3'].head_error = code
+    key = LambdaFunction().upload_package(aws['source'])['S3Key']
+    assert [k for k, _ in aws['s3'].uploads] == [key]
+    AWSBase.state = StateCache()  # a later run, asking S3 again
+    aws['s3'].uploads.clear()
+    assert LambdaFunction().upload_package(aws['source'])['S3Key'] == key
+    assert aws['s3'].uploads == []
+
+
+def test_upload_package_raises_other_head_errors(aws):
+    aws['s3'].head_error = '403'
+    with pytest.raises(ClientError):
+        LambdaFunction().upload_package(aws['source'])
+    assert aws['s3'].uploads == []
+
+
+def test_code_prefix(aws):
+    AWSBase.app['code_prefix'] = 'builds/'
+    assert LambdaFunction().upload_package(aws['source'])['S3Key'] == _key(aws, 'builds/')
+
+
+def test_create_and_update_handler_deploy_through_s3(aws):
+    function = LambdaFunction().create('arn:aws:iam::123456789012:role/r', aws['source'])
+    assert function.update_handler(aws['source'], force=True) is True
+    expected = {'S3Bucket': 'code', 'S3Key': _key(aws)}
+    assert aws['lambda'].codes == [expected, expected]
+    assert len(aws['s3'].uploads) == 1
+
+
+def test_without_code_bucket_code_goes_inline(aws):
+    del AWSBase.app['code_bucket']
+    LambdaFunction().create('arn:aws:iam::123456789012:role/r', aws['source'])
+    (code,) = aws['lambda'].codes
+    assert list(code) == ['ZipFile'] and code['ZipFile'][:2] == b'PK'
+    assert aws['s3'].heads == []
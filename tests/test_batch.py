@@ -0,0 +1,93 @@
+import base64, json, threading, time
+
+import pytest
+
+from renlabs.runtime.aws.wsgi.batch import wsgi_lambda_handler_batch
+
+
+class App:
+    """Answers ?status= (default 200), slowly for ?slow, recording the
+    order requests arrive in"""
+
+    def __init__(self):
+        self.seen = []
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        query = dict(p.partition('=')[::2] for p in environ['QUERY_STRING'].split('&') if p)
+        if 'slow' in query:
+            time.sleep(0.05)
+        with self._lock:
+            self.seen.append(environ['PATH_INFO'])
+        status = query.get('status', '200')
+        start_response(f'{status} X', [('Content-Type', 'text/plain')])
+        return [b'']
+
+
+def _request(path, query=''):
+    return {'method': 'POST', 'path': path, 'queryString': query}
+
+
+def sqs(message_id, path, query='', group=None):
+    record = {'eventSource': 'aws:sqs', 'messageId': message_id,
+              'body': json.dumps(_request(path, query)), 'attributes': {}}
+    if group:
+        record['attributes']['MessageGroupId'] = group
+    return record
+
+
+def kinesis(sequence_number, path, query='', shard='shardId-000000000001'):
+    data = base64.b64encode(json.dumps(_request(path, query)).encode()).decode()
+    return {'eventSource': 'aws:kinesis', 'eventID': f'{shard}:{sequence_number}',
+            'kinesis': {'sequenceNumber': sequence_number, 'data': data}}
+
+
+def failed_ids(response):
+    return [f['itemIdentifier'] for f in response['batchItemFailures']]
+
+
+def test_standard_queue_reports_only_failed_records():
+    app = App()
+    records = [sqs('m1', '/a'), sqs('m2', '/b', 'status=500'), sqs('m3', '/c'),
+               sqs('m4', '/d', 'status=404')]
+    assert failed_ids(wsgi_lambda_handler_batch(app, {'Records': records}, None)) == ['m2', 'm4']
+    assert sorted(app.seen) == ['/a', '/b', '/c', '/d']
+
+
+def test_fifo_group_runs_in_order_and_stops_at_first_failure():
+    app = App()
+    records = [sqs('g1-1', '/g1/1', 'slow', group='g1'),
+               sqs('g1-2', '/g1/2', 'status=500', group='g1'),
+               sqs('g1-3', '/g1/3', group='g1'),
+               sqs('g2-1', '/g2/1', group='g2'),
+               sqs('g2-2', '/g2/2', group='g2')]
+    response = wsgi_lambda_handler_batch(app, {'Records': records}, None)
+    assert failed_ids(response) == ['g1-2', 'g1-3']
+    assert '/g1/3' not in app.seen
+    assert app.seen.index('/g1/1') < app.seen.index('/g1/2')
+    assert app.seen.index('/g2/1') < app.seen.index('/g2/2')
+
+
+def test_kinesis_shard_runs_in_order_and_stops_at_first_failure():
+    app = App()
+    records = [kinesis('1', '/1', 'slow'), kinesis('2', '/2'), kinesis('3', '/3', 'status=503'),
+               kinesis('4', '/4'), kinesis('5', '/other', shard='shardId-000000000002')]
+    response = wsgi_lambda_handler_batch(app, {'Records': records}, None)
+    assert failed_ids(response) == ['3', '4']
+    assert [p for p in app.seen if p != '/other'] == ['/1', '/2', '/3']
+    assert '/other' in app.seen
+
+
+def test_unreadable_record_fails_by_its_id():
+    record = sqs('m1', '/a')
+    record['body'] = 'not json'
+    assert failed_ids(wsgi_lambda_handler_batch(App(), {'Records': [record]}, None)) == ['m1']
+
+
+def test_record_without_id_fails_the_whole_batch():
+    app = App()
+    record = sqs('m2', '/b')
+    del record['messageId']
+    with pytest.raises(RuntimeError):
+        wsgi_lambda_handler_batch(app, {'Records': [sqs('m1', '/a'), record]}, None)
+    assert app.seen == []
@@ -0,0 +1,80 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+from renlabs.provisioning.aws.clients import ROLE_REFRESH_MARGIN, ClientRegistry
+
+ROLE = 'arn:aws:iam::123456789012:role/deployer'
+
+
+class FakeSTS:
+    def __init__(self, session):
+        self.session = session
+
+    def assume_role(self, RoleArn, RoleSessionName):
+        self.session.assumed.append(RoleArn)
+        n = len(self.session.assumed)
+        return {'Credentials': {'AccessKeyId': f'key{n}', 'SecretAccessKey': 'secret',
+                                'SessionToken': f'token{n}',
+                                'Expiration': datetime.now(timezone.utc) + self.session.lifetime}}
+
+
+class FakeSession:
+    def __init__(self, lifetime=timedelta(hours=1)):
+        self.lifetime = lifetime
+        self.built = []  # (service, kwargs) per client built
+        self.assumed = []
+        self._lock = threading.Lock()
+
+    def client(self, service, **kwargs):
+        with self._lock:
+            self.built.append((service, kwargs))
+        return FakeSTS(self) if service == 'sts' else object()
+
+
+def test_one_client_per_service_region_and_role():
+    session = FakeSession()
+    registry = ClientRegistry(session)
+    iam = registry.client('iam')
+    assert registry.client('iam') is iam
+    west = registry.client('lambda', 'us-west-2')
+    assert registry.client('lambda', 'us-west-2') is west
+    assert registry.client('lambda', 'us-east-1') is not west
+    assumed = registry.client('lambda', 'us-west-2', ROLE)
+    assert assumed is not west
+    assert registry.client('lambda', 'us-west-2', ROLE) is assumed
+    assert [s for s, _ in session.built] == ['iam', 'lambda', 'lambda', 'sts', 'lambda']
+    assert session.assumed == [ROLE]
+    assert session.built[-1][1]['aws_session_token'] == 'token1'
+
+
+def test_concurrent_callers_share_one_client():
+    session = FakeSession()
+    registry = ClientRegistry(session)
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(registry.client('s3', 'us-west-2')))
+               for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(c) for c in got}) == 1
+    assert len(session.built) == 1
+
+
+def test_assumed_role_client_is_rebuilt_near_expiry():
+    session = FakeSession(lifetime=timedelta(seconds=ROLE_REFRESH_MARGIN - 1))
+    registry = ClientRegistry(session)
+    first = registry.client('lambda', 'us-west-2', ROLE)
+    second = registry.client('lambda', 'us-west-2', ROLE)
+    assert second is not first
+    assert session.assumed == [ROLE, ROLE]
+    assert session.built[-1][1]['aws_session_token'] == 'token2'
+    # the sts client, on the session's own credentials, never expires
+    assert [s for s, _ in session.built].count('sts') == 1
+
+
+def test_fresh_assumed_role_client_is_kept():
+    session = FakeSession(lifetime=timedelta(seconds=ROLE_REFRESH_MARGIN + 60))
+    registry = ClientRegistry(session)
+    assert registry.client('iam', None, ROLE) is registry.client('iam', None, ROLE)
+    assert session.assumed == [ROLE]
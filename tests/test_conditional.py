@@ -0,0 +1,108 @@
+import pytest
+
+from renlabs.runtime.aws.wsgi import cache, common
+from renlabs.runtime.aws.wsgi.apigatewayv2 import wsgi_lambda_handler_APIGatewayv2
+from renlabs.runtime.aws.wsgi.lambda_edge import wsgi_lambda_handler_LambdaAtEdge_origin
+
+LAST_MODIFIED = 'Wed, 21 Oct 2015 07:28:00 GMT'
+
+
+class App:
+    """Counts calls; answers a cacheable 200, with Last-Modified if asked"""
+
+    def __init__(self, last_modified=None):
+        self.calls = 0
+        self.last_modified = last_modified
+
+    def __call__(self, environ, start_response):
+        self.calls += 1
+        headers = [('Content-Type', 'text/plain'), ('Cache-Control', 'max-age=60')]
+        if self.last_modified:
+            headers.append(('Last-Modified', self.last_modified))
+        start_response('200 OK', headers)
+        return [] if environ['REQUEST_METHOD'] == 'HEAD' else [b'hello world']
+
+
+def v2_event(method='GET', **headers):
+    return {
+        'version': '2.0',
+        'rawPath': '/items',
+        'rawQueryString': '',
+        'headers': dict({'host': 'example.com'}, **headers),
+        'requestContext': {'domainName': 'example.com', 'stage': '$default',
+                           'http': {'method': method}},
+    }
+
+
+def edge_event(method='GET', **headers):
+    headers = dict({'host': 'example.com'}, **headers)
+    return {'Records': [{'cf': {
+        'config': {'eventType': 'origin-request'},
+        'request': {'method': method, 'uri': '/items', 'querystring': '',
+                    'headers': {k: [{'key': k, 'value': v}] for k, v in headers.items()}}}}]}
+
+
+def v2_status(response):
+    return response['statusCode'], response['headers'].get('ETag')
+
+
+def edge_status(response):
+    etag = response['headers'].get('etag')
+    return int(response['status']), etag and etag[0]['value']
+
+
+ADAPTERS = [
+    (wsgi_lambda_handler_APIGatewayv2, v2_event, v2_status),
+    (wsgi_lambda_handler_LambdaAtEdge_origin, edge_event, edge_status),
+]
+
+
+@pytest.fixture
+def etags(monkeypatch):
+    monkeypatch.setattr(common, 'ETAG_MAX_BYTES', 1024)
+
+
+@pytest.fixture
+def response_cache(monkeypatch):
+    monkeypatch.setattr(cache, 'RESPONSE_CACHE', cache.ResponseCache(1024 * 1024))
+    return cache.RESPONSE_CACHE
+
+
+@pytest.mark.parametrize('handler, event, status', ADAPTERS)
+def test_head_gets_no_generated_etag(etags, handler, event, status):
+    app = App()
+    code, etag = status(handler(app, event('GET'), None))
+    assert code == 200 and etag
+    assert status(handler(app, event('HEAD'), None)) == (200, None)
+
+
+@pytest.mark.parametrize('handler, event, status', ADAPTERS)
+def test_generated_etag_revalidates(etags, handler, event, status):
+    app = App()
+    _, etag = status(handler(app, event(), None))
+    assert status(handler(app, event(**{'if-none-match': etag}), None)) == (304, etag)
+
+
+@pytest.mark.parametrize('handler, event, status', ADAPTERS)
+def test_cache_hit_answers_matching_if_none_match_with_304(
+        etags, response_cache, handler, event, status):
+    app = App()
+    _, etag = status(handler(app, event(), None))
+    response = handler(app, event(**{'if-none-match': etag}), None)
+    assert status(response) == (304, etag)
+    assert not response.get('body')
+    assert status(handler(app, event(**{'if-none-match': '"other"'}), None)) == (200, etag)
+    assert app.calls == 1
+    assert response_cache.hits == 2
+
+
+@pytest.mark.parametrize('handler, event, status', ADAPTERS)
+def test_cache_hit_answers_if_modified_since_with_304(
+        response_cache, handler, event, status):
+    app = App(last_modified=LAST_MODIFIED)
+    assert status(handler(app, event(), None)) == (200, None)
+    response = handler(app, event(**{'if-modified-since': LAST_MODIFIED}), None)
+    assert status(response) == (304, None)
+    earlier = 'Tue, 20 Oct 2015 07:28:00 GMT'
+    assert status(handler(app, event(**{'if-modified-since': earlier}), None))[0] == 200
+    assert app.calls == 1
@@ -0,0 +1,158 @@
+import base64, hashlib, json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from renlabs.provisioning.aws import AWSBase, clients
+from renlabs.provisioning.aws.awslambda import LambdaExecutionRole, LambdaFunction
+from renlabs.provisioning.aws.plan import Deployment
+from renlabs.provisioning.aws.state import StateCache
+
+ROLE_ARN = 'arn:aws:iam::123456789012:role/deployer'
+FUNCTION_ARN = 'arn:aws:lambda:us-west-2:123456789012:function:lambda_app'
+APP = {
+    'name': 'app',
+    'provisioning_tag': 'app-tag',
+    'gateway_stage_name': 'testing',
+}
+
+
+def _gone(code):
+    return ClientError({'Error': {'Code': code}}, 'Get')
+
+
+class _Paginator:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return iter(self.pages(**kwargs))
+
+
+class FakeIAM:
+    def __init__(self, roles):
+        self.roles = roles  # name -> attached policy ARNs
+
+    def get_role(self, RoleName):
+        if RoleName not in self.roles:
+            raise _gone('NoSuchEntity')
+        return {'Role': {'Arn': f'arn:aws:iam::123456789012:role/{RoleName}'}}
+
+    def get_paginator(self, operation):
+        assert operation == 'list_attached_role_policies'
+
+        def pages(RoleName):
+            if RoleName not in self.roles:
+                raise _gone('NoSuchEntity')
+            return [{'AttachedPolicies': [{'PolicyArn': a} for a in self.roles[RoleName]]}]
+        return _Paginator(pages)
+
+
+class FakeLambda:
+    def __init__(self, configuration=None, sids=(), aliases=None):
+        self.configuration = configuration
+        self.sids = sids
+        self.aliases = aliases or {}
+
+    def get_function(self, FunctionName):
+        if self.configuration is None:
+            raise _gone('ResourceNotFoundException')
+        return {'Configuration': dict(self.configuration)}
+
+    def get_alias(self, FunctionName, Name):
+        if Name not in self.aliases:
+            raise _gone('ResourceNotFoundException')
+        return {'Name': Name, 'FunctionVersion': self.aliases[Name]}
+
+    def get_policy(self, FunctionName, Qualifier=None):
+        if not self.sids:
+            raise _gone('ResourceNotFoundException')
+        return {'Policy': json.dumps({'Statement': [{'Sid': s} for s in self.sids]})}
+
+
+class FakeApiGateway:
+    def __init__(self, api=None, integration=None, routes=None):
+        self.api = api
+        self.integration = integration
+        self.routes = routes or {}
+
+    def get_paginator(self, operation):
+        if operation == 'get_apis':
+            return _Paginator(lambda: [{'Items': [self.api] if self.api else []}])
+        assert operation == 'get_routes'
+        return _Paginator(lambda ApiId: [{'Items': [
+            {'RouteKey': k, 'RouteId': v} for k, v in self.routes.items()]}])
+
+    def get_integrations(self, ApiId):
+        return {'Items': [self.integration] if self.integration else []}
+
+    def get_stage(self, ApiId, StageName):
+        return {'StageName': StageName}
+
+
+@pytest.fixture
+def aws(monkeypatch, tmp_path):
+    """Stubbed clients, handed out only for a role ARN string, as the
+    registry would assume it"""
+    fakes = {'iam': FakeIAM({}), 'lambda': FakeLambda(), 'apigatewayv2': FakeApiGateway()}
+
+    def client(service, region=None, role=None):
+        assert role == ROLE_ARN, f"client for {service} asked as {role!r}"
+        return fakes[service]
+
+    monkeypatch.setattr(clients, 'client', client)
+    monkeypatch.setattr(AWSBase, 'app', dict(APP))
+    for name, value in [('_region', 'us-west-2'), ('_role', ROLE_ARN),
+                        ('_account', '123456789012'), ('_provisioning_tag', 'app-tag'),
+                        ('state', StateCache())]:
+        monkeypatch.setattr(AWSBase, name, value)
+
+    package = tmp_path / 'function.zip'
+    package.write_bytes(b'PK package')
+    fakes['package'] = str(package)
+    return fakes
+
+
+def test_plan_creates_everything_when_nothing_exists(aws):
+    plan = Deployment(aws['package'], routes=[('GET', 'items')]).plan()
+    assert set(plan.nodes) == {'role', 'function', 'api', 'target', ('route', 'GET /items')}
+    assert "iam -> create role lambdaExecutionRole_app" in str(plan)
+
+
+def deployed(aws, alias=None):
+    """Make the stubbed account hold the default Deployment, its API
+    invoking alias (or the unqualified function)"""
+    role_arn = 'arn:aws:iam::123456789012:role/lambdaExecutionRole_app'
+    aws['iam'].roles['lambdaExecutionRole_app'] = {
+        LambdaExecutionRole.policy_arn(p) for p in LambdaExecutionRole.MANAGED_POLICIES}
+    code_sha256 = base64.b64encode(hashlib.sha256(b'PK package').digest()).decode('ascii')
+    aws['lambda'].configuration = {
+        'FunctionArn': FUNCTION_ARN, 'Runtime': 'python3.8', 'Handler': LambdaFunction.HANDLER,
+        'Role': role_arn, 'Description': '', 'Timeout': 3, 'MemorySize': 128,
+        'CodeSha256': code_sha256}
+    aws['lambda'].sids = [f"apigateway-a1-{alias or 'unqualified'}"]
+    if alias:
+        aws['lambda'].aliases[alias] = '1'
+    target = f'{FUNCTION_ARN}:{alias}' if alias else FUNCTION_ARN
+    aws['apigatewayv2'].api = {'Name': 'app', 'ApiId': 'a1'}
+    aws['apigatewayv2'].integration = {
+        'IntegrationId': 'i1',
+        'IntegrationUri': f'arn:aws:apigateway:us-west-2:lambda:path/2015-03-31'
+                          f'/functions/{target}/invocations'}
+    aws['apigatewayv2'].routes = {'GET /items': 'r1'}
+
+
+@pytest.mark.parametrize('alias', [None, 'live'])
+def test_plan_has_no_changes_when_deployed(aws, alias):
+    deployed(aws, alias)
+    plan = Deployment(aws['package'], routes=[('GET', 'items')], alias=alias).plan()
+    assert not plan
+    assert str(plan) == "No changes"
+
+
+def test_configuration_change_moves_alias(aws):
+    deployed(aws, 'live')
+    plan = Deployment(aws['package'], routes=[('GET', 'items')], alias='live',
+                      memory_size=256).plan()
+    assert set(plan.nodes) == {'function-config', 'alias'}
+    assert plan.nodes['alias'].after == {'function-config'}
@@ -0,0 +1,36 @@
+import threading
+
+import pytest
+
+from renlabs.runtime.aws.wsgi import emulate
+
+
+def acquire_within(pool, seconds=2.0):
+    """pool.acquire()'s result or exception, failing the test if it waits"""
+    outcome = []
+
+    def acquire():
+        try:
+            outcome.append(pool.acquire())
+        except Exception as e:
+            outcome.append(e)
+
+    waiter = threading.Thread(target=acquire, daemon=True)
+    waiter.start()
+    waiter.join(seconds)
+    assert outcome, 'acquire() is stuck waiting for a slot'
+    return outcome[0]
+
+
+def test_failed_container_start_gives_its_slot_back(monkeypatch):
+    def failing_start(handler_spec):
+        raise OSError('spawn failed')
+
+    monkeypatch.setattr(emulate, 'Container', failing_start)
+    pool = emulate.ContainerPool('app:handler', concurrency=1, idle_timeout=None,
+                                 throttle=False)
+    for _ in range(3):
+        assert isinstance(acquire_within(pool), OSError)
+
+    monkeypatch.setattr(emulate, 'Container', lambda handler_spec: 'container')
+    assert acquire_within(pool) == 'container'
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from renlabs.runtime.aws.wsgi.factory import make_handler
+
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [environ['PATH_INFO'].encode()]
+
+
+def sqs_event(path):
+    return {'Records': [{'eventSource': 'aws:sqs', 'messageId': 'm1', 'attributes': {},
+                         'body': json.dumps({'method': 'GET', 'path': path})}]}
+
+
+def edge_event(uri):
+    return {'Records': [{'cf': {'config': {'eventType': 'origin-request'}, 'request': {
+        'clientIp': '203.0.113.7', 'method': 'GET', 'uri': uri, 'querystring': '',
+        'headers': {'host': [{'key': 'Host', 'value': 'example.com'}]}}}}]}
+
+
+@pytest.mark.parametrize('source, settle_on, other', [
+    ('batch', sqs_event('/a'), edge_event('/b')),
+    ('edge', edge_event('/a'), sqs_event('/b')),
+])
+def test_records_of_the_other_kind_dont_fit(source, settle_on, other):
+    strict = make_handler(app, source=source, fallback=False)
+    strict(settle_on, None)
+    with pytest.raises(RuntimeError):
+        strict(other, None)
+
+
+def test_settled_batch_handler_falls_back_for_an_edge_event():
+    handler = make_handler(app)
+    assert handler(sqs_event('/a'), None) == {'batchItemFailures': []}
+    response = handler(edge_event('/b'), None)
+    assert response['status'] == '200'
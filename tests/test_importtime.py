@@ -0,0 +1,55 @@
+"""\
+Cold-import budget for the Lambda runtime adapters.
+
+Imports each adapter in a fresh interpreter under -X importtime and fails if
+its cumulative import time, best of several runs, is over budget, or if it
+drags in werkzeug. Modules the Lambda Python runtime has already loaded
+before the handler module (logging, json and friends) are imported first, so
+they're not charged to the adapter.
+
+IMPORT_BUDGET_SCALE multiplies every budget, for slow CI machines.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 5
+SCALE = float(os.environ.get('IMPORT_BUDGET_SCALE') or 1.0)
+
+# Preloaded by Lambda's bootstrap before it imports lambda_function.
+RUNTIME_PRELOADED = 'import logging, json, os, sys, time, base64, decimal'
+
+# Module -> cumulative import budget in milliseconds.
+BUDGETS = {
+    'renlabs.runtime.aws.wsgi.apigatewayv2': 15.0,
+    'renlabs.runtime.aws.wsgi.apigatewayv1': 15.0,
+    'renlabs.runtime.aws.wsgi.apigateway': 15.0,
+    'renlabs.runtime.aws.wsgi.alb': 15.0,
+}
+
+
+def cumulative_ms(module):
+    """(cumulative import milliseconds, whether werkzeug got imported)"""
+    code = (f'{RUNTIME_PRELOADED}; import {module}, sys; '
+            f'print("werkzeug" in sys.modules)')
+    env = dict(os.environ, PYTHONPATH=REPO)
+    p = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                       capture_output=True, text=True, env=env, check=True)
+    for line in p.stderr.splitlines():
+        pieces = line.split('|')
+        if len(pieces) == 3 and pieces[2].strip() == module:
+            return int(pieces[1]) / 1000.0, p.stdout.strip() == 'True'
+    raise RuntimeError(f'No import time reported for {module}:\n{p.stderr}')
+
+
+@pytest.mark.parametrize('module, budget', BUDGETS.items())
+def test_import_budget(module, budget):
+    results = [cumulative_ms(module) for _ in range(RUNS)]
+    assert not any(werkzeug for _, werkzeug in results), f'{module} imports werkzeug'
+    best = min(ms for ms, _ in results)
+    assert best <= budget * SCALE, \
+        f'{module} imports in {best:.1f}ms, over its {budget * SCALE:.1f}ms budget'
@@ -0,0 +1,138 @@
+import base64, json
+
+import pytest
+
+from renlabs.runtime.aws.wsgi import apigateway_common, lambda_edge
+from renlabs.runtime.aws.wsgi.lambda_edge import (
+    wsgi_lambda_handler_LambdaAtEdge,
+    wsgi_lambda_handler_LambdaAtEdge_origin,
+    wsgi_lambda_handler_LambdaAtEdge_viewer)
+
+
+def echo_app(environ, start_response):
+    """Answers what it was asked, as JSON"""
+    length = int(environ.get('CONTENT_LENGTH') or 0)
+    body = environ['wsgi.input'].read(length) if length else b''
+    answer = json.dumps({
+        'method': environ['REQUEST_METHOD'],
+        'script_name': environ['SCRIPT_NAME'],
+        'path': environ['PATH_INFO'],
+        'query': environ['QUERY_STRING'],
+        'host': environ['HTTP_HOST'],
+        'content_type': environ.get('CONTENT_TYPE'),
+        'x_custom': environ.get('HTTP_X_CUSTOM'),
+        'body': body.decode('latin1'),
+    }).encode('utf-8')
+    start_response('200 OK', [('Content-Type', 'application/json'),
+                              ('Content-Length', str(len(answer)))])
+    return [answer]
+
+
+def edge_event(event_type, method='GET', uri='/items/42', querystring='', body=None,
+               **headers):
+    headers = dict({'host': 'd111111abcdef8.cloudfront.net'}, **headers)
+    request = {
+        'clientIp': '203.0.113.7',
+        'method': method,
+        'uri': uri,
+        'querystring': querystring,
+        'headers': {k: [{'key': k.title(), 'value': v}] for k, v in headers.items()},
+    }
+    if body is not None:
+        request['body'] = dict({'action': 'read-only', 'inputTruncated': False}, **body)
+    return {'Records': [{'cf': {'config': {'eventType': event_type}, 'request': request}}]}
+
+
+def answer(response):
+    assert response['status'] == '200'
+    body = response['body']
+    if response['bodyEncoding'] == 'base64':
+        body = base64.b64decode(body)
+    return json.loads(body)
+
+
+@pytest.fixture(params=[False, True], ids=['fast', 'compat'])
+def compat(request, monkeypatch):
+    monkeypatch.setattr(apigateway_common, 'COMPAT_CLIENT', request.param)
+    return request.param
+
+
+@pytest.mark.parametrize('handler, event_type', [
+    (wsgi_lambda_handler_LambdaAtEdge_viewer, 'viewer-request'),
+    (wsgi_lambda_handler_LambdaAtEdge_origin, 'origin-request'),
+    (wsgi_lambda_handler_LambdaAtEdge, 'origin-request'),
+])
+def test_request_triggers(compat, handler, event_type):
+    response = handler(echo_app, edge_event(event_type, querystring='a=1&b=2',
+                                            **{'x-custom': 'yes'}), None)
+    assert answer(response) == {
+        'method': 'GET', 'script_name': '', 'path': '/items/42', 'query': 'a=1&b=2',
+        'host': 'd111111abcdef8.cloudfront.net', 'content_type': None,
+        'x_custom': 'yes', 'body': ''}
+    assert response['headers']['content-type'] == [
+        {'key': 'Content-Type', 'value': 'application/json'}]
+
+
+def test_response_trigger_is_refused():
+    event = edge_event('origin-response')
+    event['Records'][0]['cf']['response'] = {'status': '200'}
+    with pytest.raises(RuntimeError):
+        wsgi_lambda_handler_LambdaAtEdge_origin(echo_app, event, None)
+
+
+@pytest.mark.parametrize('include, exclude, uri', [
+    (['/api'], [], '/static/logo.png'),
+    ([], ['/static'], '/static/logo.png'),
+    (['/api'], ['/api/static'], '/api/static/logo.png'),
+])
+def test_bypass_returns_request_unchanged(monkeypatch, include, exclude, uri):
+    monkeypatch.setattr(lambda_edge, 'app_path', lambda_edge.path_matcher(include, exclude))
+
+    def app(environ, start_response):
+        raise AssertionError("bypassed requests don't reach the app")
+
+    event = edge_event('viewer-request', uri=uri)
+    request = event['Records'][0]['cf']['request']
+    original = json.loads(json.dumps(request))
+    assert wsgi_lambda_handler_LambdaAtEdge_viewer(app, event, None) is request
+    assert request == original
+
+
+def test_included_path_reaches_app(monkeypatch):
+    monkeypatch.setattr(lambda_edge, 'app_path', lambda_edge.path_matcher(['/api'], ['/api/static']))
+    response = wsgi_lambda_handler_LambdaAtEdge_origin(
+        echo_app, edge_event('origin-request', uri='/api/items'), None)
+    assert answer(response)['path'] == '/api/items'
+
+
+@pytest.mark.parametrize('body, expected', [
+    ({'encoding': 'text', 'data': '{"hello": "world"}'}, '{"hello": "world"}'),
+    ({'encoding': 'base64', 'data': base64.b64encode(b'\x00\x01binary\xff').decode('ascii')},
+     '\x00\x01binary\xff'),
+])
+def test_body_decoding(compat, body, expected):
+    event = edge_event('origin-request', method='POST', body=body,
+                       **{'content-type': 'application/octet-stream'})
+    got = answer(wsgi_lambda_handler_LambdaAtEdge_origin(echo_app, event, None))
+    assert got['method'] == 'POST'
+    assert got['body'] == expected
+    assert got['content_type'] == 'application/octet-stream'
+
+
+@pytest.mark.parametrize('event', [
+    edge_event('viewer-request', querystring='q=a%20b&empty='),
+    edge_event('origin-request', uri='/a%20path/x', **{'x-custom': 'v', 'accept': '*/*'}),
+    edge_event('origin-request', method='POST', body={'encoding': 'text', 'data': 'k=v'},
+               **{'content-type': 'application/x-www-form-urlencoded'}),
+    edge_event('origin-request', method='PUT',
+               body={'encoding': 'base64', 'data': base64.b64encode(bytes(range(256))).decode()},
+               **{'content-type': 'application/octet-stream'}),
+    edge_event('origin-request', method='POST', **{'content-type': 'application/json'}),
+], ids=['query', 'quoted-path', 'form', 'binary', 'empty-post'])
+def test_fast_path_matches_compat_client(monkeypatch, event):
+    responses = []
+    for compat in (False, True):
+        monkeypatch.setattr(apigateway_common, 'COMPAT_CLIENT', compat)
+        responses.append(wsgi_lambda_handler_LambdaAtEdge_origin(
+            echo_app, json.loads(json.dumps(event)), None))
+    assert responses[0] == responses[1]
@@ -0,0 +1,80 @@
+import compileall, os, shutil, stat, zipfile
+
+from renlabs.provisioning.aws.awslambda import build_package
+
+
+def make_tree(root, mtime):
+    """A small installed-package-like tree, every file dated mtime"""
+    (root / 'pkg').mkdir(parents=True)
+    (root / 'pkg' / '__init__.py').write_text('VALUE = 1\n')
+    (root / 'pkg' / 'mod.py').write_text('def f():\n    return 2\n')
+    (root / 'lambda_function.py').write_text('def lambda_handler(event, context):\n    pass\n')
+    (root / 'bin').mkdir()
+    (root / 'bin' / 'tool').write_text('#!/bin/sh\n')
+    (root / 'bin' / 'tool').chmod(0o700)
+    (root / 'data.txt').write_text('data\n')
+    (root / 'data.txt').chmod(0o600)
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            os.utime(os.path.join(dirpath, name), (mtime, mtime))
+
+
+def compile_tree(root):
+    """As pip does after installing"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith('.py'):
+                assert compileall.compile_file(os.path.join(dirpath, name), force=True, quiet=1)
+
+
+def build_twice(tmp_path, compile=False):
+    """Package bytes from building the tree twice in one place, as the
+    package builder does, with different mtimes"""
+    tree, built = tmp_path / 'lambda-dir', []
+    for n, mtime in enumerate([1_600_000_000, 1_700_000_000]):
+        shutil.rmtree(tree, ignore_errors=True)
+        make_tree(tree, mtime)
+        if compile:
+            compile_tree(tree)
+        with open(build_package(str(tree), str(tmp_path / f'{n}.zip')), 'rb') as f:
+            built.append(f.read())
+    return built
+
+
+def test_same_tree_with_different_mtimes_gives_same_bytes(tmp_path):
+    first, second = build_twice(tmp_path)
+    assert first == second
+
+
+def test_recompiled_tree_gives_same_bytes_under_source_date_epoch(tmp_path, monkeypatch):
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '315532800')
+    first, second = build_twice(tmp_path, compile=True)
+    assert first == second
+    with zipfile.ZipFile(tmp_path / '0.zip') as z:
+        assert any(name.endswith('.pyc') for name in z.namelist())
+
+
+def test_recompiled_tree_differs_without_source_date_epoch(tmp_path, monkeypatch):
+    monkeypatch.delenv('SOURCE_DATE_EPOCH', raising=False)
+    first, second = build_twice(tmp_path, compile=True)
+    assert first != second
+
+
+def test_entries_are_sorted_dated_and_moded(tmp_path):
+    make_tree(tmp_path / 'tree', 1_700_000_000)
+    with zipfile.ZipFile(build_package(str(tmp_path / 'tree'), str(tmp_path / 'p.zip'))) as z:
+        infos = z.infolist()
+    names = [i.filename for i in infos]
+    assert names == sorted(names)
+    assert 'pkg/' not in names
+    modes = {i.filename: stat.S_IMODE(i.external_attr >> 16) for i in infos}
+    assert modes['bin/tool'] == 0o755
+    assert modes['data.txt'] == 0o644
+    assert {i.date_time for i in infos} == {(1980, 1, 1, 0, 0, 0)}
+
+
+def test_single_file(tmp_path):
+    source = tmp_path / 'lambda_function.py'
+    source.write_text('x = 1\n')
+    with zipfile.ZipFile(build_package(str(source), str(tmp_path / 'p.zip'))) as z:
+        assert z.namelist() == ['lambda_function.py']
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+import pytest
+
+from renlabs.provisioning.aws import state
+from renlabs.provisioning.aws.state import StateCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(state, 'time', SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def loader(*values):
+    calls = []
+    values = iter(values)
+
+    def load():
+        calls.append(None)
+        return next(values)
+    load.calls = calls
+    return load
+
+
+def test_loads_once_without_ttl(clock):
+    cache, load = StateCache(), loader('a', 'b')
+    assert cache.get(('k',), load) == 'a'
+    clock.now += 10 ** 6
+    assert cache.get(('k',), load) == 'a'
+    assert len(load.calls) == 1
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'entries': 1}
+
+
+def test_ttl_expiry_reloads(clock):
+    cache, load = StateCache(ttl=30), loader('a', 'b')
+    assert cache.get(('k',), load) == 'a'
+    clock.now += 29
+    assert cache.get(('k',), load) == 'a'
+    clock.now += 1
+    assert cache.get(('k',), load) == 'b'
+    assert len(load.calls) == 2
+
+
+def test_invalidate_forgets_the_key_and_longer_keys_only(clock):
+    cache = StateCache()
+    for key in [('routes', 'a1'), ('routes', 'a1', 'GET /x'), ('routes', 'a2'), ('apis', 'app')]:
+        cache.put(key, key)
+    cache.invalidate('routes', 'a1')
+    assert cache.get(('routes', 'a1'), lambda: 'reloaded') == 'reloaded'
+    assert cache.get(('routes', 'a1', 'GET /x'), lambda: 'reloaded') == 'reloaded'
+    assert cache.get(('routes', 'a2'), lambda: 'reloaded') == ('routes', 'a2')
+    cache.invalidate()
+    assert cache.stats()['entries'] == 0
+
+
+def test_load_exceptions_arent_cached(clock):
+    cache = StateCache()
+
+    def fail():
+        raise KeyError('nope')
+    with pytest.raises(KeyError):
+        cache.get(('k',), fail)
+    assert cache.get(('k',), lambda: 'loaded') == 'loaded'
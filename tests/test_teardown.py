@@ -0,0 +1,156 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from renlabs.provisioning.aws import (
+    Teardown, clients, get_tagged_role_names, nuke_arns, nuke_roles)
+
+REGION = 'us-west-2'
+
+
+def _error(code):
+    return ClientError({'Error': {'Code': code}}, 'Delete')
+
+
+class _Paginator:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return iter(self.pages(**kwargs))
+
+
+class FakeIAM:
+    def __init__(self, roles, refuse=(), hidden=()):
+        self.roles = roles  # name -> attached policy ARNs
+        self.refuse = set(refuse)  # role names delete_role is denied for
+        self.hidden = set(hidden)  # role names listing inline policies is denied for
+        self.deleted = []
+
+    def get_paginator(self, operation):
+        if operation == 'list_attached_role_policies':
+            return _Paginator(lambda RoleName: [{'AttachedPolicies': [
+                {'PolicyArn': a, 'PolicyName': a.rsplit('/', 1)[-1]}
+                for a in self.roles[RoleName]]}])
+        assert operation == 'list_role_policies'
+
+        def pages(RoleName):
+            if RoleName in self.hidden:
+                raise _error('AccessDenied')
+            return [{'PolicyNames': ['inline']}]
+        return _Paginator(pages)
+
+    def detach_role_policy(self, RoleName, PolicyArn):
+        pass
+
+    def delete_role_policy(self, RoleName, PolicyName):
+        pass
+
+    def delete_role(self, RoleName):
+        if RoleName in self.refuse:
+            raise _error('AccessDenied')
+        self.deleted.append(RoleName)
+
+
+class FakeLambda:
+    def get_paginator(self, operation):
+        return _Paginator(lambda FunctionName: [{'Aliases': [{'Name': 'live'}]}])
+
+    def get_policy(self, FunctionName, Qualifier=None):
+        return {'Policy': json.dumps({'Statement': [{'Sid': f'sid-{Qualifier}'}]})}
+
+    def remove_permission(self, **kwargs):
+        pass
+
+    def delete_function(self, FunctionName):
+        pass
+
+
+class FakeApiGateway:
+    def get_paginator(self, operation):
+        items = {'get_routes': [{'RouteId': 'r1', 'RouteKey': 'GET /items'}],
+                 'get_integrations': [{'IntegrationId': 'i1'}],
+                 'get_stages': [{'StageName': 'testing'}]}[operation]
+        return _Paginator(lambda ApiId: [{'Items': items}])
+
+    def __getattr__(self, name):
+        assert name.startswith('delete_')
+        return lambda **kwargs: None
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    fakes = {'lambda': FakeLambda(), 'apigatewayv2': FakeApiGateway()}
+    monkeypatch.setattr(clients, 'client',
+                        lambda service, region=None, role=None: fakes[service])
+    return fakes
+
+
+def test_nuke_roles_returns_a_label_per_role(aws):
+    aws['iam'] = FakeIAM({'one': ['arn:aws:iam::aws:policy/p1'], 'two': []})
+    assert nuke_roles(['one', 'two']) == ['iam -> one', 'iam -> two']
+
+
+def test_nuke_roles_raises_a_failed_delete(aws):
+    aws['iam'] = FakeIAM({'one': [], 'two': []}, refuse=['two'])
+    with pytest.raises(ClientError) as e:
+        nuke_roles(['one', 'two'])
+    assert e.value.response['Error']['Code'] == 'AccessDenied'
+    assert aws['iam'].deleted == ['one']
+
+
+def test_a_failed_lookup_doesnt_stop_the_others(aws):
+    aws['iam'] = FakeIAM({'one': [], 'two': [], 'three': []}, hidden=['two'])
+    td = Teardown().add_roles(['one', 'two', 'three'])
+    deleted = td.run(progress=lambda line: None)
+    assert 'iam -> one' in deleted and 'iam -> three' in deleted
+    assert not any('two' in label for label in deleted)
+    assert list(td.failures) == ['lookup of two']
+
+    with pytest.raises(ClientError) as e:
+        nuke_roles(['one', 'two', 'three'])
+    assert e.value.response['Error']['Code'] == 'AccessDenied'
+
+
+def test_nuke_arns_returns_a_label_per_function_or_api(aws):
+    arns = [f'arn:aws:lambda:{REGION}:123456789012:function:fn',
+            f'arn:aws:apigateway:{REGION}::/apis/a1']
+    assert nuke_arns(REGION, arns) == ['lambda -> fn', 'apigatewayv2 -> a1']
+
+
+class FakeTaggedIAM:
+    def __init__(self, tags):
+        self.tags = tags  # role name -> provisioning tag value or None
+        self.tag_lookups = []
+
+    def get_paginator(self, operation):
+        if operation == 'list_roles':
+            return _Paginator(lambda: [{'Roles': [{'RoleName': n} for n in self.tags]}])
+        assert operation == 'list_role_tags'
+
+        def pages(RoleName):
+            self.tag_lookups.append(RoleName)
+            value = self.tags[RoleName]
+            return [{'Tags': [{'Key': 'provisioning', 'Value': value}] if value else []}]
+        return _Paginator(pages)
+
+
+class FakeTagging:
+    def __init__(self, arns):
+        self.arns = arns
+
+    def get_paginator(self, operation):
+        return _Paginator(lambda **kwargs: [{'ResourceTagMappingList': [
+            {'ResourceARN': arn} for arn in self.arns]}])
+
+
+def test_tagged_role_names_merges_tagging_index_and_listing(aws):
+    aws['iam'] = FakeTaggedIAM({'indexed': 't', 'new': 't', 'other': 'x', 'untagged': None})
+    aws['resourcegroupstaggingapi'] = FakeTagging([
+        'arn:aws:iam::123456789012:role/indexed',
+        'arn:aws:iam::123456789012:role/deleted'])
+    names = get_tagged_role_names('t')
+    assert isinstance(names, list)
+    assert sorted(names) == ['indexed', 'new']
+    assert 'indexed' not in aws['iam'].tag_lookups